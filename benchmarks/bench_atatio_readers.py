@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the streaming atatio readers against the previous string splitting implementation
+on generated vmat.out and configmult.out files
+
+usage: bench_atatio_readers.py [--clusters N] [--rows R] [--cols C] [--repeat K]
+"""
+
+import argparse
+import os
+import re
+import tempfile
+import time
+import numpy as np
+
+from toolkit.io.atatio import read_vmatrix, read_configmult
+
+def legacy_read_vmatrix(vmat_fname) -> dict:
+
+    pattern2 = re.compile("\n\n")
+
+    vmat = {}
+    with open(vmat_fname, 'r') as fvmat:
+        _ = next(fvmat)  # ignore first lie
+        temp_vmat = fvmat.read()
+
+    # split by 2 empty lines i.e. maxclusters
+    temp_vmat = pattern2.split(temp_vmat)
+
+    while("" in temp_vmat):
+        temp_vmat.remove("")  # remove empty blocks
+
+    for clus_idx, mat in enumerate(temp_vmat):
+        mat = mat.split('\n')  # split by 1 empty line i.e. subclusters
+        mat_float = np.empty(list(map(int, mat[0].split(' '))))
+        for idx, row in enumerate(mat[1:]):  # ignore first line
+            mat_float[idx] = list(map(float, row.split(' ')[:-1]))
+
+        vmat[clus_idx] = mat_float
+
+    return vmat
+
+def legacy_read_configmult(configmult_fname) -> dict:
+
+    configmult = {}
+    pattern2 = re.compile("\n\n")
+
+    with open(configmult_fname, 'r') as fsubmult:
+        _ = next(fsubmult)  # ignore first line
+        temp_submult = fsubmult.read()
+        # split lines into blocks separated by 2 empty lines
+        temp_submult = pattern2.split(temp_submult)
+
+    for idx, submult in enumerate(temp_submult[:-1]):
+        submult = submult.split('\n')  # split into number of subclusters
+        while("" in submult):
+            submult.remove("")  # remove empty blocks
+        # also ignore 1st line of each block
+        configmult[idx] = list(map(float, submult[1:]))
+
+    return configmult
+
+def write_vmat(fname: str,
+               blocks: list[np.ndarray],
+              ) -> None:
+    # same layout as cvmclus: shape line, rows with a trailing space, blank line between blocks
+    with open(fname, 'w', encoding='utf-8') as fvmat:
+        fvmat.write(f'{len(blocks)}\n')
+        for block in blocks:
+            fvmat.write(f'{block.shape[0]} {block.shape[1]}\n')
+            for row in block:
+                fvmat.write(' '.join(f'{val:.6f}' for val in row) + ' \n')
+            fvmat.write('\n')
+
+def write_configmult(fname: str,
+                     mults: list[np.ndarray],
+                    ) -> None:
+    with open(fname, 'w', encoding='utf-8') as fmult:
+        fmult.write(f'{len(mults)}\n')
+        for block in mults:
+            fmult.write(f'{len(block)}\n')
+            fmult.write(''.join(f'{int(mult)}\n' for mult in block))
+            fmult.write('\n')
+
+def best_time(func, fname: str, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(fname)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clusters', type=int, default=20, help='number of V-Matrix blocks [default: %(default)s]')
+    parser.add_argument('--rows', type=int, default=1000, help='rows (configurations) of the largest block [default: %(default)s]')
+    parser.add_argument('--cols', type=int, default=300, help='number of clusters (columns) [default: %(default)s]')
+    parser.add_argument('--repeat', type=int, default=3, help='timing repetitions, the best is reported [default: %(default)s]')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    blocks = [np.round(rng.uniform(-1, 1, size=(max(args.rows // (idx + 1), 2), args.cols)), 6) for idx in range(args.clusters)]
+    mults = [rng.integers(1, 48, size=len(block)).astype(float) for block in blocks]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        vmat_fname = os.path.join(tmpdir, 'vmat.out')
+        configmult_fname = os.path.join(tmpdir, 'configmult.out')
+        write_vmat(vmat_fname, blocks)
+        write_configmult(configmult_fname, mults)
+
+        vmat, rows = read_vmatrix(vmat_fname)
+        legacy_vmat = legacy_read_vmatrix(vmat_fname)
+        assert np.array_equal(vmat, np.vstack(list(legacy_vmat.values())))
+        assert np.array_equal(rows, [len(block) for block in legacy_vmat.values()])
+        configmult, counts = read_configmult(configmult_fname)
+        legacy_configmult = legacy_read_configmult(configmult_fname)
+        assert np.array_equal(configmult, np.concatenate(list(legacy_configmult.values())))
+        assert np.array_equal(counts, [len(block) for block in legacy_configmult.values()])
+
+        print(f'vmat.out: {vmat.shape[0]} x {vmat.shape[1]} in {len(blocks)} blocks, {os.path.getsize(vmat_fname)/2**20:.1f} MiB')
+        print('{0:<16s}|{1:<12s}|{2:<12s}|{3:<8s}'.format('Reader', 'legacy (s)', 'new (s)', 'speedup'))
+        for name, legacy, new, fname in [('read_vmatrix', legacy_read_vmatrix, read_vmatrix, vmat_fname),
+                                         ('read_configmult', legacy_read_configmult, read_configmult, configmult_fname),
+                                        ]:
+            legacy_time = best_time(legacy, fname, args.repeat)
+            new_time = best_time(new, fname, args.repeat)
+            print('{0:<16s}|{1:<12.4f}|{2:<12.4f}|{3:<8.1f}'.format(name, legacy_time, new_time, legacy_time / new_time))
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the basin hopping chains against the random search of CVMOptimizer: minimum free energy,
+local solves and time at every temperature of the sro_correction options
+
+usage: run from a structure directory (e.g. tests/test_phase/test_structure) with the sro_correction
+       options, e.g. bench_basinhopping.py -Tl 100 -Tm 2000 -Ts 300 -git 100 -es 20 -bhc 4
+"""
+
+import os
+import sys
+import time
+import numpy as np
+
+from toolkit.io.argparser import SRO_argument_parser
+from toolkit.drivers.pipeline import custom_linspace, make_cluster, fit_ordered_state, make_sro_optimizer
+
+if __name__ == '__main__':
+
+    args = SRO_argument_parser()
+    args.basinhopping = False
+    cluster = make_cluster(os.getcwd(), args)
+    _ = fit_ordered_state(cluster, args)
+    opt_random = make_sro_optimizer(cluster, args)
+    args.basinhopping = True
+    opt_bh = make_sro_optimizer(cluster, args)
+    opt_random.print_output = opt_bh.print_output = False
+
+    print('{0:<10s}|{1:<14s}|{2:<14s}|{3:<12s}|{4:<14s}|{5:<10s}|{6:<12s}|{7:<8s}'.format('T (K)', 'F random', 'F hopping', 'F diff', 'solves random', 'solves bh', 'random (s)', 'bh (s)'))
+    totals = np.zeros(4)
+    for T in custom_linspace(start=args.Tmin, stop=args.Tmax, step=args.Tstep):
+        timings = []
+        solves = []
+        energies = []
+        for opt in (opt_random, opt_bh):
+            opt.temperature = T
+            solves_before = opt.local_solves
+            start = time.perf_counter()
+            energies.append(opt.fit()[0])
+            timings.append(time.perf_counter() - start)
+            solves.append(opt.local_solves - solves_before)
+        totals += *solves, *timings
+        print('{0:<10.1f}|{1:<14.8f}|{2:<14.8f}|{3:<12.2e}|{4:<14d}|{5:<10d}|{6:<12.2f}|{7:<8.2f}'.format(T,
+              energies[0]/cluster.num_lat_atoms, energies[1]/cluster.num_lat_atoms, (energies[1] - energies[0])/cluster.num_lat_atoms,
+              solves[0], solves[1], timings[0], timings[1]), file=sys.stdout, flush=True)
+    opt_random.close()
+    opt_bh.close()
+    print(f'Total: random search {int(totals[0])} local solves in {totals[2]:.2f}s | basin hopping {int(totals[1])} local solves in {totals[3]:.2f}s')
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the natural iteration method against the trust-constr random search of CVMOptimizer
+over the temperature grid of the sro_correction options
+
+usage: run from a structure directory (e.g. tests/test_phase/test_structure) with the sro_correction
+       options, e.g. bench_nim.py -Tl 100 -Tm 2000 -Ts 100 -git 20
+"""
+
+import os
+import time
+import numpy as np
+
+from toolkit.io.argparser import SRO_argument_parser
+from toolkit.drivers.pipeline import custom_linspace, make_cluster, fit_ordered_state, make_sro_optimizer
+from toolkit.optimizers.NIMOptimizer import NIMOptimizer
+
+if __name__ == '__main__':
+
+    args = SRO_argument_parser()
+    cluster = make_cluster(os.getcwd(), args)
+    _ = fit_ordered_state(cluster, args)
+    opt_sro = make_sro_optimizer(cluster, args)
+    opt_sro.print_output = False
+    opt_nim = NIMOptimizer(cluster = cluster,
+                           print_output = False,
+                           maxiter = args.maxiter,
+                           xtol = args.xtol,
+                          )
+
+    print('{0:<10s}|{1:<14s}|{2:<14s}|{3:<12s}|{4:<12s}|{5:<16s}|{6:<11s}|{7:<6s}'.format('T (K)', 'F trust-constr', 'F NIM', 'F diff', 'max |dx|', 'trust-constr (s)', 'NIM (s)', 'iter'))
+    times = np.zeros(2)
+    for T in custom_linspace(start=args.Tmin, stop=args.Tmax, step=args.Tstep):
+        opt_sro.temperature = T
+        opt_nim.temperature = T
+        start = time.perf_counter()
+        F_sro, corrs_sro, _, _ = opt_sro.fit()
+        time_sro = time.perf_counter() - start
+        start = time.perf_counter()
+        F_nim, corrs_nim, _, constr_viol_nim = opt_nim.fit()
+        time_nim = time.perf_counter() - start
+        times += time_sro, time_nim
+        assert constr_viol_nim < args.constr_tol
+        print('{0:<10.1f}|{1:<14.8f}|{2:<14.8f}|{3:<12.2e}|{4:<12.2e}|{5:<16.4f}|{6:<11.4f}|{7:<6d}'.format(T,
+              F_sro/cluster.num_lat_atoms, F_nim/cluster.num_lat_atoms, (F_nim - F_sro)/cluster.num_lat_atoms,
+              np.max(np.abs(corrs_nim - corrs_sro)), time_sro, time_nim, opt_nim.iterations))
+    opt_sro.close()
+    print(f'Total: trust-constr {times[0]:.2f}s | NIM {times[1]:.4f}s | speedup {times[0]/times[1]:.1f}')
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the trust-constr local solves with the norm constraint: linear positivity constraint and
+exact norm constraint derivatives against the previous dict constraints (analytic Jacobian plus BFGS
+Hessian for V.x >= 0, 3-point Jacobian plus BFGS Hessian for the norm constraint)
+
+usage: run from a structure directory (e.g. tests/test_phase/test_structure) with the sro_correction
+       options, e.g. bench_norm_constraint.py -Tl 100 -Tm 2000 -Ts 300 -git 10
+"""
+
+import os
+import sys
+import time
+import numpy as np
+from scipy.optimize import BFGS
+
+from toolkit.io.argparser import SRO_argument_parser
+from toolkit.drivers.pipeline import custom_linspace, make_cluster, fit_ordered_state, make_sro_optimizer
+
+def legacy_constraints(opt_sro) -> list[dict]:
+
+    vmat = opt_sro._presolve.vmat_free
+    rho_offset = opt_sro._presolve.rho_offset
+    ordered = opt_sro._presolve.restrict(opt_sro.cluster.ordered_correlations)
+    disordered = opt_sro._presolve.restrict(opt_sro.cluster.disordered_correlations)
+    return [{'fun': lambda x: vmat @ x + rho_offset,
+             'type': 'ineq',
+             'jac' : lambda x : vmat,
+            },
+            {'fun': lambda x: np.linalg.norm(ordered - disordered)/2 - np.linalg.norm(x - disordered),
+             'type': 'ineq',
+             'jac': '3-point',
+             'hess': BFGS(),
+            },
+           ]
+
+def run_trials(opt_sro, constraints, num_trials: int) -> (float, int, float):
+    """
+    Best F, total iterations and total time of the local solves of the first num_trials trials
+    """
+    opt_sro._constraints = constraints
+    best, iterations, elapsed = np.inf, 0, 0.0
+    for trial in range(num_trials):
+        corrs_attempt = opt_sro._trial_start(trial)
+        start = time.perf_counter()
+        result = opt_sro._local_solve(corrs_attempt)
+        elapsed += time.perf_counter() - start
+        if result is None:
+            continue
+        iterations += result.nit
+        if result.constr_violation < opt_sro.constr_tol:
+            best = min(best, result.fun)
+    return best, iterations, elapsed
+
+if __name__ == '__main__':
+
+    if '-nc' not in sys.argv and '--norm_constraint' not in sys.argv:
+        sys.argv.append('--norm_constraint')
+    args = SRO_argument_parser()
+    cluster = make_cluster(os.getcwd(), args)
+    _ = fit_ordered_state(cluster, args)
+    opt_sro = make_sro_optimizer(cluster, args)
+    opt_sro.print_output = False
+    constraints = opt_sro._constraints
+    legacy = legacy_constraints(opt_sro)
+
+    print('{0:<10s}|{1:<14s}|{2:<14s}|{3:<12s}|{4:<12s}|{5:<14s}|{6:<14s}'.format('T (K)', 'F legacy', 'F new', 'iter legacy', 'iter new', 'ms/iter legacy', 'ms/iter new'))
+    totals = np.zeros(2)
+    for T in custom_linspace(start=args.Tmin, stop=args.Tmax, step=args.Tstep):
+        opt_sro.temperature = T
+        F_legacy, iter_legacy, time_legacy = run_trials(opt_sro, legacy, args.global_iterations)
+        F_new, iter_new, time_new = run_trials(opt_sro, constraints, args.global_iterations)
+        totals += time_legacy, time_new
+        print('{0:<10.1f}|{1:<14.8f}|{2:<14.8f}|{3:<12d}|{4:<12d}|{5:<14.3f}|{6:<14.3f}'.format(T,
+              F_legacy/cluster.num_lat_atoms, F_new/cluster.num_lat_atoms, iter_legacy, iter_new,
+              1e3*time_legacy/max(iter_legacy, 1), 1e3*time_new/max(iter_new, 1)))
+    print(f'Total: legacy {totals[0]:.2f}s | new {totals[1]:.2f}s | speedup {totals[0]/totals[1]:.1f}')
@@ -0,0 +1,41 @@
+"""
+Inspect or clear the corrdump correlation cache, or the ordered state cache
+"""
+
+import argparse
+
+from toolkit.io.CorrelationCache import CorrelationCache, CACHE_NAMESPACES
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(prog='corrcache',
+                                     description='Inspect the content-addressed caches of corrdump correlations and ordered state LP solutions',
+                                    )
+    parser.add_argument('command',
+                        choices=['stats', 'list', 'clear'],
+                        help='stats: hit rate and size, list: cached structures, clear: remove all entries',
+                       )
+    parser.add_argument('--namespace', '-ns',
+                        default='correlations',
+                        choices=CACHE_NAMESPACES,
+                        help='correlations: corrdump output, ordered_states: ordered state LP solutions [default: %(default)s]',
+                       )
+    parser.add_argument('--cache_dir', '-cd',
+                        default=None,
+                        help='cache directory [default: $CVM_TOOLKIT_CACHE/<namespace>, else ~/.cache/cvm_toolkit/<namespace>]',
+                       )
+    args = parser.parse_args()
+
+    cache = CorrelationCache(namespace=args.namespace, cache_dir=args.cache_dir)
+    if args.command == 'stats':
+        stats = cache.stats()
+        print(f'Cache directory: {cache.cache_dir}')
+        print(f"Entries: {stats['entries']} ({stats['size_bytes']} bytes)")
+        print(f"Hits: {stats['hits']} | Misses: {stats['misses']} | Hit rate: {stats['hit_rate']:.2%}")
+    elif args.command == 'list':
+        print('{0:<66s}|{1:<28s}|{2:<8s}|{3}'.format('Key', 'Created', 'Flags', 'Structure'))
+        for entry in cache.entries():
+            print('{0:<66s}|{1:<28s}|{2:<8s}|{3}'.format(entry['key'], entry.get('created', ''), ' '.join(entry.get('flags', [])), entry.get('structure', '')))
+    else:
+        cache.clear()
+        print(f'Cleared {cache.cache_dir}')
@@ -0,0 +1,25 @@
+import sys
+
+from toolkit.io.argparser import SRO_argument_parser
+from toolkit.drivers.batch import run_phase
+
+import numpy as np
+
+if __name__ == '__main__':
+
+    np.set_printoptions(suppress=True, precision=4)
+
+    #parse arguments
+    args = SRO_argument_parser(batch=True)
+    if args.fit_correction_only:
+        print('--fit_correction_only is not supported by sro_batch, run sro_correction in the structure directory.')
+        sys.exit(1)
+
+    table = run_phase(args.phase,
+                      args,
+                      structures = args.structures,
+                      max_workers = args.workers,
+                      blas_threads = args.blas_threads,
+                      table_fname = args.table,
+                     )
+    print(f'{table.structure.nunique() if not table.empty else 0} structures written to {args.phase}/{args.table}')
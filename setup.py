@@ -6,7 +6,10 @@ setup(
     author='Sayan Samanta',
     author_email='sayan_samanta@brown.edu',
     packages=find_packages(),
-    scripts=['scripts/sro_correction.py',],
+    scripts=['scripts/sro_correction.py',
+             'scripts/corrcache.py',
+             'scripts/sro_batch.py',
+            ],
     license='LICENSE.txt',
     description='A CVM Optimizer',
     long_description=open('README.md').read(),
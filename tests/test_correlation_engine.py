@@ -0,0 +1,102 @@
+"""
+Correlation engine against a brute-force orbit average over the cubic group, on fcc fixtures in test_phase/fcc:
+the same Al-Ni lattice described by the primitive cell (lat.in), a non-reduced basis (lat_skew.in) and
+the conventional cell with 4 sites (lat_conv.in), and random structures on a diagonal (str.in) and a
+non-diagonal (str_skew.in) supercell
+"""
+
+import itertools
+import os
+import numpy as np
+import pytest
+
+from toolkit.cluster import Cluster as cluster_module
+from toolkit.cluster.Cluster import Cluster
+from toolkit.cluster.CorrelationEngine import CorrelationEngine
+from toolkit.io.atatio import read_clusters, read_structure
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'test_phase', 'fcc')
+LATTICES = ('lat.in', 'lat_skew.in', 'lat_conv.in')
+STRUCTURES = ('str.in', 'str_skew.in')
+SPINS = {'Al': -1.0, 'Ni': 1.0}
+
+def _cubic_group() -> list:
+    """
+    The 48 signed permutation matrices
+    """
+    return [np.diag(signs)[list(perm)]
+            for perm in itertools.permutations(range(3))
+            for signs in itertools.product((-1, 1), repeat=3)]
+
+def _brute_force_correlations(clusters: dict,
+                              structure: dict,
+                             ) -> np.ndarray:
+    """
+    Average of the spin products over every cubic rotation of every cluster anchored at every atom
+    """
+    inv_cell = np.linalg.inv(structure['cell'])
+    frac_atoms = structure['positions'] @ inv_cell
+    spins = np.array([SPINS[specie] for specie in structure['species']])
+
+    def atom_index(position):
+        offsets = position @ inv_cell - frac_atoms
+        mismatch = np.abs(offsets - np.round(offsets)).max(axis=1)
+        assert mismatch.min() < 1e-6
+        return np.argmin(mismatch)
+
+    corrs = np.ones(len(clusters))
+    for idx, cluster in enumerate(clusters.values()):
+        if cluster['type'] == 0:
+            continue
+        points = cluster['points'] - cluster['points'][0]
+        products = [np.prod([spins[atom_index(point @ rotation + anchor)] for point in points])
+                    for rotation in _cubic_group() for anchor in structure['positions']]
+        corrs[idx] = np.mean(products)
+    return corrs
+
+@pytest.fixture(scope='module')
+def clusters() -> dict:
+    return read_clusters(os.path.join(FIXTURES, 'clusters.out'))
+
+@pytest.mark.parametrize('lattice_fname, num_ops', list(zip(LATTICES, (48, 48, 192))))
+def test_space_group_order(clusters, lattice_fname, num_ops):
+    engine = CorrelationEngine.from_files(clusters, os.path.join(FIXTURES, lattice_fname))
+    assert len(engine._symmetry_ops) == num_ops
+
+@pytest.mark.parametrize('lattice_fname', LATTICES[:2])
+def test_orbit_sizes_match_multiplicities(clusters, lattice_fname):
+    engine = CorrelationEngine.from_files(clusters, os.path.join(FIXTURES, lattice_fname))
+    np.testing.assert_array_equal(engine.orbit_sizes, [cluster['mult'] for cluster in clusters.values()])
+
+# str_skew.in is not a supercell of the conventional cell
+@pytest.mark.parametrize('lattice_fname, structure_fname', [pair for pair in itertools.product(LATTICES, STRUCTURES) if pair != ('lat_conv.in', 'str_skew.in')])
+def test_correlations_match_brute_force(clusters, lattice_fname, structure_fname):
+    engine = CorrelationEngine.from_files(clusters, os.path.join(FIXTURES, lattice_fname))
+    structure = read_structure(os.path.join(FIXTURES, structure_fname))
+    np.testing.assert_allclose(engine.bind(structure).correlations(),
+                               _brute_force_correlations(clusters, structure),
+                               rtol=0.0, atol=1e-12)
+
+def test_incomplete_space_group_raises(clusters, monkeypatch):
+    # a search limited to coordinates in range(-3, 4) finds 6 of the 48 operations of lat_skew.in
+    def truncated_lattice_vectors(self, length):
+        candidates = np.array(list(itertools.product(range(-3, 4), repeat=3)))
+        return candidates[np.abs(np.linalg.norm(candidates @ self.lattice.cell, axis=1) - length) < self.lattice.tolerance]
+    monkeypatch.setattr(CorrelationEngine, '_lattice_vectors', truncated_lattice_vectors)
+    with pytest.raises(ValueError):
+        CorrelationEngine.from_files(clusters, os.path.join(FIXTURES, 'lat_skew.in'))
+
+@pytest.mark.parametrize('odd_sign, engine_used', [(1.0, True), (-1.0, False)])
+def test_engine_checked_against_corrdump(clusters, monkeypatch, odd_sign, engine_used):
+    # corrdump with the opposite spin convention flips the sign of the odd-order correlations
+    structure = read_structure(os.path.join(FIXTURES, 'str.in'))
+    signs = np.array([odd_sign if cluster['type'] % 2 else 1.0 for cluster in clusters.values()])
+    corrdump_corrs = signs * _brute_force_correlations(clusters, structure)
+    monkeypatch.setattr(cluster_module.shutil, 'which', lambda cmd: f'/usr/bin/{cmd}')
+    monkeypatch.setattr(Cluster, '_corrdump_correlations', lambda self, structure_fname: corrdump_corrs.copy())
+    cluster = Cluster(structure=FIXTURES, _input_structure_fname='str.in', native_correlations=True, use_snapshot=False)
+    assert (cluster.correlation_engine is not None) == engine_used
+    np.testing.assert_allclose(cluster.get_correlations('str.in'), corrdump_corrs, rtol=0.0, atol=1e-12)
+
+def test_engine_off_by_default():
+    assert Cluster(structure=FIXTURES, use_snapshot=False).correlation_engine is None
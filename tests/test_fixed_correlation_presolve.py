@@ -0,0 +1,70 @@
+"""
+FixedCorrelationPresolve on a synthetic V-Matrix: the reduced evaluator of the free correlations
+against the full evaluator at the same point
+"""
+
+import numpy as np
+import pytest
+from scipy import sparse
+
+from toolkit.functions.FreeEnergyEvaluator import FreeEnergyEvaluator
+from toolkit.presolve.FixedCorrelationPresolve import FixedCorrelationPresolve
+
+NUM_CLUSTERS = 6
+NUM_ROWS = 20
+# the empty cluster and one point cluster are fixed
+LOWER = np.array([1.0, 0.2, -1.0, -1.0, -1.0, -1.0])
+UPPER = np.array([1.0, 0.2, 1.0, 1.0, 1.0, 1.0])
+FREE = np.array([2, 3, 4, 5])
+TEMPERATURE = 500.0
+
+@pytest.fixture(scope='module')
+def problem() -> dict:
+    rng = np.random.default_rng(3)
+    vmat = rng.uniform(-0.1, 0.1, size=(NUM_ROWS, NUM_CLUSTERS))
+    # rho >= 0.5 - 0.1*0.2 - 4*0.1*0.5 > 0 for free correlations in [-0.5, 0.5]
+    vmat[:, 0] = 0.5
+    return {'vmat': vmat,
+            'mults_eci': rng.uniform(-1, 1, size=NUM_CLUSTERS),
+            'multconfig_kb': rng.uniform(-1, 2, size=NUM_ROWS),
+            'corrs_free': rng.uniform(-0.5, 0.5, size=len(FREE)),
+           }
+
+def _presolve(problem: dict, storage) -> FixedCorrelationPresolve:
+    return FixedCorrelationPresolve(all_vmat=storage(problem['vmat']),
+                                    mults_eci=problem['mults_eci'],
+                                    lower=LOWER,
+                                    upper=UPPER,
+                                   )
+
+@pytest.mark.parametrize('storage', [np.array, sparse.csr_array])
+def test_restrict_expand_round_trip(problem, storage):
+    presolve = _presolve(problem, storage)
+    np.testing.assert_array_equal(presolve.free, FREE)
+    np.testing.assert_array_equal(presolve.fixed_values, LOWER[:2])
+    corrs = presolve.expand(problem['corrs_free'])
+    np.testing.assert_array_equal(corrs[presolve.fixed], LOWER[:2])
+    np.testing.assert_array_equal(presolve.restrict(corrs), problem['corrs_free'])
+    np.testing.assert_array_equal(presolve.expand(presolve.restrict(corrs)), corrs)
+    np.testing.assert_array_equal(presolve.bounds.lb, LOWER[FREE])
+    np.testing.assert_array_equal(presolve.bounds.ub, UPPER[FREE])
+
+@pytest.mark.parametrize('storage', [np.array, sparse.csr_array])
+def test_reduced_evaluator_matches_full(problem, storage):
+    presolve = _presolve(problem, storage)
+    reduced = presolve.evaluator(problem['multconfig_kb'], TEMPERATURE)
+    full = FreeEnergyEvaluator(mults_eci=problem['mults_eci'],
+                               multconfig_kb=problem['multconfig_kb'],
+                               all_vmat=problem['vmat'],
+                               temperature=TEMPERATURE,
+                              )
+    corrs_free = problem['corrs_free']
+    corrs = presolve.expand(corrs_free)
+    p = np.linspace(-1, 1, len(FREE))
+    p_full = np.zeros(NUM_CLUSTERS)
+    p_full[FREE] = p
+
+    assert reduced.F(corrs_free) == pytest.approx(full.F(corrs), rel=1e-12, abs=1e-15)
+    np.testing.assert_allclose(reduced.F_jacobian(corrs_free), full.F_jacobian(corrs)[FREE], rtol=1e-12, atol=1e-15)
+    np.testing.assert_allclose(reduced.F_hessian(corrs_free), full.F_hessian(corrs)[np.ix_(FREE, FREE)], rtol=1e-12, atol=1e-15)
+    np.testing.assert_allclose(reduced.F_hessp(corrs_free, p), full.F_hessp(corrs, p_full)[FREE], rtol=1e-12, atol=1e-15)
@@ -0,0 +1,122 @@
+"""
+OrderedStateOptimizer on the LP of a 4-point maximal cluster (correlations: empty, point, pair, triplet, quadruplet):
+warm started and cached solves against a fresh linprog, and the optimal vertices against a brute-force enumeration
+"""
+
+import itertools
+from dataclasses import dataclass
+import numpy as np
+import pytest
+from scipy.optimize import linprog
+
+from toolkit.io.CorrelationCache import CorrelationCache
+from toolkit.optimizers.OrderedStateOptimizer import OrderedStateOptimizer
+
+# V-Matrix blocks of the quadruplet, triplet, pair and point clusters
+VMAT = np.array([[0.0625, 0.25, 0.375, 0.25, 0.0625],
+                 [0.0625, 0.125, 0.0, -0.125, -0.0625],
+                 [0.0625, 0.0, -0.125, 0.0, 0.0625],
+                 [0.0625, -0.125, 0.0, 0.125, -0.0625],
+                 [0.0625, -0.25, 0.375, -0.25, 0.0625],
+                 [0.125, 0.375, 0.375, 0.125, 0.0],
+                 [0.125, 0.125, -0.125, -0.125, 0.0],
+                 [0.125, -0.125, -0.125, 0.125, 0.0],
+                 [0.125, -0.375, 0.375, -0.125, 0.0],
+                 [0.25, 0.5, 0.25, 0.0, 0.0],
+                 [0.25, 0.0, -0.25, 0.0, 0.0],
+                 [0.25, -0.5, 0.25, 0.0, 0.0],
+                 [0.5, 0.5, 0.0, 0.0, 0.0],
+                 [0.5, -0.5, 0.0, 0.0, 0.0],
+                ])
+CLUSTER_TYPES = (0, 1, 2, 3, 4)
+CLUSMULT = np.array([1.0, 1.0, 6.0, 8.0, 2.0])
+POINT_CORRELATIONS = np.array([[0.0], [0.2], [-0.3]])
+
+@dataclass
+class _LPCluster:
+    # the parts of Cluster read by OrderedStateOptimizer
+    eci_array: np.ndarray
+    structure: str = '.'
+    vmatrix_array = VMAT
+    clusmult_array = CLUSMULT
+    configmult_array = np.ones(len(VMAT))
+    kb_array = np.ones(len(VMAT))
+    num_clusters = len(CLUSTER_TYPES)
+    single_point_clusters = [1]
+    clusters = {idx: {'type': cluster_type} for idx, cluster_type in enumerate(CLUSTER_TYPES)}
+    disordered_correlations = np.array([1.0, 0.0, 0.0, 0.0, 0.0])
+
+def _optimizer(eci: np.ndarray, **kwargs) -> OrderedStateOptimizer:
+    return OrderedStateOptimizer(cluster=_LPCluster(eci_array=eci), options={}, use_cache=False, print_output=False, **kwargs)
+
+def _bounds(point_correlation: float) -> (np.ndarray, np.ndarray):
+    lower = np.array([1.0, point_correlation, -1.0, -1.0, -1.0])
+    upper = np.array([1.0, point_correlation, 1.0, 1.0, 1.0])
+    return lower, upper
+
+def _fresh_linprog(mults_eci: np.ndarray, point_correlation: float) -> float:
+    result = linprog(mults_eci, A_ub=-VMAT, b_ub=np.zeros(len(VMAT)), bounds=np.column_stack(_bounds(point_correlation)), method='highs')
+    assert result.success
+    return result.fun
+
+def test_fit_batch_matches_fresh_linprog():
+    rng = np.random.default_rng(7)
+    eci_sets = rng.normal(size=(4, len(CLUSTER_TYPES)))
+    # scaled ECI's share their ordered state, the second solve is a warm start
+    eci_sets = np.vstack([eci_sets, 2.5 * eci_sets])
+    eci_sets = np.repeat(eci_sets, len(POINT_CORRELATIONS), axis=0)
+    point_correlations = np.tile(POINT_CORRELATIONS, (len(eci_sets) // len(POINT_CORRELATIONS), 1))
+    optimizer = _optimizer(eci_sets[0])
+    results = optimizer.fit_batch(eci_sets, point_correlations)
+
+    assert optimizer.warm_starts > 0
+    for eci, point_correlation, result in zip(eci_sets, point_correlations[:, 0], results):
+        mults_eci = eci * CLUSMULT
+        assert result.success
+        assert result.x[1] == point_correlation
+        assert np.min(VMAT @ result.x) >= -1e-9
+        assert mults_eci @ result.x == pytest.approx(_fresh_linprog(mults_eci, point_correlation), abs=1e-9)
+
+def test_cache_hit_updates_warm_start(tmp_path):
+    optimizer = _optimizer(np.zeros(len(CLUSTER_TYPES)))
+    optimizer._cache = CorrelationCache(namespace='ordered_states', cache_dir=str(tmp_path))
+    lower, upper = _bounds(0.0)
+    mults_eci = (np.array([0.0, 0.0, 1.0, 0.0, 0.0]), np.array([0.0, 0.0, -1.0, 0.0, 0.5]))
+    first = optimizer._solve(mults_eci[0], lower, upper)
+    optimizer._solve(mults_eci[1], lower, upper)
+    cached = optimizer._solve(mults_eci[0], lower, upper)
+    assert optimizer.cache_hits == 1
+    np.testing.assert_array_equal(cached.x, first.x)
+    np.testing.assert_array_equal(optimizer._previous[2], first.x)
+
+def _brute_force_vertices(point_correlation: float) -> np.ndarray:
+    """
+    Vertices of {V.x >= 0, lower <= x <= upper} in the free correlations, from every set of active constraints
+    """
+    lower, upper = _bounds(point_correlation)
+    free = np.arange(2, len(CLUSTER_TYPES))
+    identity = np.eye(len(free))
+    A = np.vstack([-VMAT[:, free], -identity, identity])
+    b = np.concatenate([VMAT[:, :2] @ lower[:2], -lower[free], upper[free]])
+    vertices = []
+    for active in itertools.combinations(range(len(A)), len(free)):
+        active = list(active)
+        if abs(np.linalg.det(A[active])) < 1e-12:
+            continue
+        vertex = np.linalg.solve(A[active], b[active])
+        if np.all(A @ vertex <= b + 1e-9) and not any(np.max(np.abs(vertex - known)) < 1e-7 for known in vertices):
+            vertices.append(vertex)
+    return np.array(vertices)
+
+@pytest.mark.parametrize('point_correlation', POINT_CORRELATIONS[:2, 0])
+def test_optimal_vertices_of_flat_objective(point_correlation):
+    # with zero ECI's every vertex of the polytope is optimal
+    optimizer = _optimizer(np.zeros(len(CLUSTER_TYPES)), vertex_probes=50)
+    lower, upper = _bounds(point_correlation)
+    mults_eci = np.zeros(len(CLUSTER_TYPES))
+    result = optimizer._solve(mults_eci, lower, upper)
+    vertices = optimizer._optimal_vertices(mults_eci, lower, upper, result)
+    expected = _brute_force_vertices(point_correlation)
+    assert len(vertices) == len(expected)
+    for vertex in vertices[:, 2:]:
+        assert np.min(np.max(np.abs(expected - vertex), axis=1)) < 1e-7
@@ -0,0 +1,56 @@
+"""
+Merging of the identical rows of a stacked V-Matrix, dense and CSR
+"""
+
+import numpy as np
+import pytest
+from scipy import sparse
+
+from toolkit.presolve import vmatrows
+from toolkit.presolve.vmatrows import merge_identical_rows
+
+# rows 2, 4 and 5 repeat rows 0, 1 and 0
+VMAT = np.array([[1.0, 0.5, -0.25, 0.0],
+                 [1.0, -0.5, 0.0, 0.25],
+                 [1.0, 0.5, -0.25, 0.0],
+                 [0.5, 0.0, 0.0, -0.5],
+                 [1.0, -0.5, 0.0, 0.25],
+                 [1.0, 0.5, -0.25, 0.0],
+                ])
+WEIGHTS = np.array([1.0, -2.0, 3.0, 0.5, 4.0, -1.5])
+
+def _as_dense(vmat) -> np.ndarray:
+    return vmat.toarray() if sparse.issparse(vmat) else np.asarray(vmat)
+
+@pytest.mark.parametrize('storage', [np.array, sparse.csr_array])
+def test_merge_identical_rows(storage):
+    merged, weights, inverse = merge_identical_rows(storage(VMAT), WEIGHTS)
+    assert sparse.issparse(merged) == sparse.issparse(storage(VMAT))
+    np.testing.assert_array_equal(_as_dense(merged), VMAT[[0, 1, 3]])
+    np.testing.assert_array_equal(inverse, [0, 1, 0, 2, 1, 0])
+    np.testing.assert_allclose(weights, [1.0 + 3.0 - 1.5, -2.0 + 4.0, 0.5])
+
+@pytest.mark.parametrize('storage', [np.array, sparse.csr_array])
+def test_merged_weighted_sum_unchanged(storage):
+    corrs = np.random.default_rng(1).uniform(-1, 1, size=VMAT.shape[1])
+    merged, weights, _ = merge_identical_rows(storage(VMAT), WEIGHTS)
+    for func in (np.square, np.exp, lambda rho: rho * np.log(np.abs(rho))):
+        assert weights @ func(merged @ corrs) == pytest.approx(WEIGHTS @ func(VMAT @ corrs), rel=1e-12)
+
+def test_merge_without_weights():
+    merged, weights, inverse = merge_identical_rows(VMAT)
+    assert weights is None
+    np.testing.assert_array_equal(merged[inverse], VMAT)
+
+class _CollidingGenerator:
+    # every row projects to the same key
+    def uniform(self, low, high, size):
+        return np.zeros(size)
+
+@pytest.mark.parametrize('storage', [np.array, sparse.csr_array])
+def test_projection_collision_keeps_all_rows(storage, monkeypatch):
+    monkeypatch.setattr(vmatrows.np.random, 'default_rng', lambda seed: _CollidingGenerator())
+    merged, weights, inverse = merge_identical_rows(storage(VMAT), WEIGHTS)
+    np.testing.assert_array_equal(_as_dense(merged), VMAT)
+    np.testing.assert_array_equal(weights, WEIGHTS)
+    np.testing.assert_array_equal(inverse, np.arange(len(VMAT)))
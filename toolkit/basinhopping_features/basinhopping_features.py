@@ -1,5 +1,8 @@
 import numpy as np
 
+# draws between two stepsize adjustments
+STEPSIZE_INTERVAL = 10
+
 class BasinHoppingBounds:
     """
     Class to constrain the trial correlations of Basin Hopping
@@ -13,27 +16,59 @@ class BasinHoppingBounds:
 
 class BasinHoppingStep:
     """
-    Class to define the step in a Basin Hopping algorithm
+    Class to define the step in a Basin Hopping algorithm.
+    Gaussian jitter of the correlations beyond the point clusters, redrawn until the accept test
+    (e.g. BasinHoppingBounds) passes. Every interval draws the stepsize is divided (multiplied) by factor
+    if the fraction of draws passing the test is above (below) target_accept_rate
     """
     def __init__(self,
                  cluster: dict,
                  stepsize: float = 0.01,
                  seed: int = 42,
+                 target_accept_rate: float = 0.5,
+                 interval: int = STEPSIZE_INTERVAL,
+                 factor: float = 0.9,
                 ) -> None:
 
-        self.cluster = cluster
+        # only the mask is kept, the step travels to the worker processes with its chain
+        self._jittered = np.zeros(cluster.num_clusters, dtype=bool)
+        self._jittered[1 + len(cluster.single_point_clusters):] = True
         self.stepsize = stepsize
+        self.target_accept_rate = target_accept_rate
+        self.interval = interval
+        self.factor = factor
+        self.num_draws = 0
+        self.num_accepted = 0
+        self._window_accepted = 0
         self._rng = np.random.default_rng(seed)
 
-    def __call__(self, x: np.ndarray) -> None:
-
-        jitter = np.array([0,
-                           *[0]*len(self.cluster.single_point_clusters),
-                           *self._rng.normal(0,
-                                             self.stepsize,
-                                             self.cluster.num_clusters -
-                                             len(self.cluster.single_point_clusters) - 1
-                                            )
-                          ]
-                         )
-        return x + jitter
+    @property
+    def acceptance_rate(self) -> float:
+        return self.num_accepted / max(self.num_draws, 1)
+
+    def _record(self, accepted: bool) -> None:
+
+        self.num_draws += 1
+        self.num_accepted += accepted
+        self._window_accepted += accepted
+        if self.num_draws % self.interval == 0:
+            if self._window_accepted / self.interval > self.target_accept_rate:
+                self.stepsize /= self.factor
+            else:
+                self.stepsize *= self.factor
+            self._window_accepted = 0
+
+    def __call__(self,
+                 x: np.ndarray,
+                 accept_test: BasinHoppingBounds = None,
+                 max_draws: int = 100,
+                ) -> np.ndarray:
+
+        for _ in range(max_draws):
+            x_new = x.copy()
+            x_new[self._jittered] += self._rng.normal(0, self.stepsize, np.count_nonzero(self._jittered))
+            accepted = accept_test is None or bool(accept_test(x_new=x_new))
+            self._record(accepted)
+            if accepted:
+                return x_new
+        return x.copy()
@@ -1,14 +1,32 @@
 from __future__ import annotations
-from dataclasses import dataclass, field, InitVar
+from dataclasses import dataclass, field
 from functools import cached_property
-import itertools
 import subprocess
+import shutil
 import os
 from pathlib import Path
 import numpy as np
-from toolkit.io.atatio import read_clusters, read_kbcoeffs, read_configmult, read_clustermult, read_eci, read_configs, read_vmatrix
+from scipy import sparse
+from toolkit.io.ClusterSnapshot import ClusterSnapshot
+from toolkit.io.CorrelationCache import CorrelationCache, default_correlation_cache
+from toolkit.io.atatio import iter_vmatrix_blocks
+from toolkit.cluster.randomcorrelations import random_correlations_from_files
+from toolkit.cluster.CorrelationEngine import CorrelationEngine
+from toolkit.bounds.CorrelationBounds import CorrelationBounds
+from toolkit.presolve.FixedCorrelationPresolve import FixedCorrelationPresolve
+from toolkit.presolve.chebyshev import chebyshev_center
 
 EPSILON = 1e-2
+# corrdump prints 6 decimals
+CORRDUMP_ATOL = 1e-5
+SPARSE_DENSITY_THRESHOLD = 0.3
+
+def _split_blocks(stacked, counts) -> dict:
+    """
+    Splits stacked rows (array or list) into consecutive blocks of the given lengths, keyed by block index
+    """
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    return {idx: stacked[offsets[idx]:offsets[idx+1]] for idx in range(len(counts))}
 
 @dataclass(kw_only=True, order=False, eq=False,)
 class Cluster:
@@ -16,51 +34,103 @@ class Cluster:
     Class to hold Cluster Description
     """
 
-    _clusters_fname: InitVar[str] = field(default='clusters.out', repr=False)
-    _eci_fname: InitVar[str] = field(default='eci.out', repr=False)
-    _clustermult_fname: InitVar[str] = field(default='clusmult.out', repr=False)
-    _config_fname: InitVar[str] = field(default='config.out', repr=False)
-    _configmult_fname: InitVar[str] = field(default='configmult.out', repr=False)
-    _kb_fname: InitVar[str] = field(default='configkb.out', repr=False)
-    _vmat_fname: InitVar[str] = field(default='vmat.out', repr=False)
+    _clusters_fname: str = field(default='clusters.out', repr=False)
+    _eci_fname: str = field(default='eci.out', repr=False)
+    _clustermult_fname: str = field(default='clusmult.out', repr=False)
+    _config_fname: str = field(default='config.out', repr=False)
+    _configmult_fname: str = field(default='configmult.out', repr=False)
+    _kb_fname: str = field(default='configkb.out', repr=False)
+    _vmat_fname: str = field(default='vmat.out', repr=False)
 
     _lattice_fname: str = field(default='lat.in')
     _sqs_structure_fname: np.ndarray = field(default='str_relax.out')
     _input_structure_fname: np.ndarray = field(default='str.in')
 
+    structure: str = None
     _ordered_correlations: np.ndarray = None
+    vmat_storage: str = 'auto'
+    correlation_cache: CorrelationCache = field(default=None, repr=False)
+    analytic_random: bool = False
+    native_correlations: bool = False
+    use_snapshot: bool = True
+    _random_correlations: dict = field(init=False, default_factory=dict, repr=False)
+    _chebyshev_centers: dict = field(init=False, default_factory=dict, repr=False)
+
+    def __post_init__(self: Cluster) -> None:
+
+        # directory holding the cluster files, the current one unless given
+        self.structure = os.path.abspath(os.getcwd() if self.structure is None else self.structure)
+        if self.correlation_cache is None:
+            self.correlation_cache = default_correlation_cache()
+
+    @cached_property
+    def phase(self: Cluster) -> str:
+        return str(Path(self.structure).parent.absolute())
+
+    @cached_property
+    def _snapshot(self: Cluster) -> ClusterSnapshot:
+        # parsed files are memory mapped from .cvm_snapshot when they have not changed since the last run
+        return ClusterSnapshot(directory=self.structure, enabled=self.use_snapshot)
+
+    def _load(self: Cluster,
+              fname: str,
+              kind: str,
+             ):
+        return self._snapshot.load(f'{self.structure}/{fname}', kind)
+
+    # Cluster files are read on first access
+
+    @cached_property
+    def clusters(self: Cluster) -> dict:
+        return self._load(self._clusters_fname, 'clusters')
+
+    @cached_property
+    def clustermult(self: Cluster) -> dict:
+        return self._load(self._clustermult_fname, 'clustermult')
+
+    @cached_property
+    def eci(self: Cluster) -> dict:
+        return self._load(self._eci_fname, 'eci')
+
+    @cached_property
+    def _kb(self: Cluster) -> np.ndarray:
+        return self._load(self._kb_fname, 'kb')
+
+    @cached_property
+    def _configmult_blocks(self: Cluster) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Stacked configuration multiplicities and the number of configurations of each cluster
+        """
+        return self._load(self._configmult_fname, 'configmult')
+
+    @cached_property
+    def _vmat_blocks(self: Cluster) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Stacked V-Matrix and the number of rows of each cluster's block
+        """
+        return self._load(self._vmat_fname, 'vmat')
+
+    @cached_property
+    def kb(self: Cluster) -> dict:
+        return dict(enumerate(self._kb.tolist()))
+
+    @cached_property
+    def configmult(self: Cluster) -> dict:
+        return _split_blocks(*self._configmult_blocks)
 
-    clusters: dict = field(init=False)
-    kb: dict = field(init=False)
-    configmult: dict = field(init=False)
-    clustermult: dict = field(init=False)
-    configs: dict = field(init=False)
-    vmat: dict = field(init=False)
-    eci: dict = field(init=False)
-    phase: str = field(init=False)
-    structure: str = field(init=False)
-
-    def __post_init__(self: Cluster,
-                      _clusters_fname: str,
-                      _eci_fname: str,
-                      _clustermult_fname: str,
-                      _config_fname: str,
-                      _configmult_fname: str,
-                      _kb_fname: str,
-                      _vmat_fname: str,
-                     ) -> None:
-
-        self.structure = os.getcwd()
-        path_ = Path(self.structure)
-        self.phase = str(path_.parent.absolute())
-
-        self.clusters = read_clusters(f'{self.structure}/{_clusters_fname}')
-        self.kb = read_kbcoeffs(f'{self.structure}/{_kb_fname}')
-        self.clustermult = read_clustermult(f'{self.structure}/{_clustermult_fname}')
-        self.configmult = read_configmult(f'{self.structure}/{_configmult_fname}')
-        self.configs = read_configs(f'{self.structure}/{_config_fname}')
-        self.vmat = read_vmatrix(f'{self.structure}/{_vmat_fname}')
-        self.eci = read_eci(f'{self.structure}/{_eci_fname}')
+    @cached_property
+    def vmat(self: Cluster) -> dict:
+        return _split_blocks(*self._vmat_blocks)
+
+    @cached_property
+    def configs(self: Cluster) -> dict:
+        configs_ = self._load(self._config_fname, 'configs')
+        if configs_ is None:
+            return None
+        num_of_subclus, inter_rows, inter = configs_
+        subclus_inter = list(_split_blocks(inter, inter_rows).values())
+        return {idx: {'inter': inter_, 'num_of_subclus': len(inter_)}
+                for idx, inter_ in _split_blocks(subclus_inter, num_of_subclus).items()}
 
     @property
     def input_structure(self):
@@ -91,37 +161,59 @@ class Cluster:
         else:
             strout_lines[0:6] = strin_lines[0:6]
 
-        with open(f'{self.structure}/{self._sqs_structure_fname}_temp','w',encoding='utf-8') as scaled_relax:
-            for line in strout_lines:
-                scaled_relax.write(line)
-        corr_sqs_ = subprocess.run(['corrdump', '-c', f'-cf={self.structure}/{self._clusters_fname}', f'-s={self.structure}/{self._sqs_structure_fname}_temp', f'-l={self.structure}/{self._lattice_fname}'],
-                                  stdout=subprocess.PIPE,
-                                  stderr=subprocess.PIPE,
-                                  check=True
-                                 )
-        # convert from bytes to string list
-        corr_sqs_ = corr_sqs_.stdout.decode('utf-8').split('\t')[:-1]
-        corr_sqs_ = np.array(corr_sqs_, dtype=np.float32)  # convert to arrays
+        # the scaled structure is only piped to corrdump if it has to run on it
+        return self.correlation_cache.correlations(f'{self.structure}/{self._clusters_fname}',
+                                                   f'{self.structure}/{self._lattice_fname}',
+                                                   f'{self.structure}/{self._sqs_structure_fname}_temp',
+                                                   structure_content=''.join(strout_lines),
+                                                  )
+
+    def _corrdump_correlations(self: Cluster,
+                               structure: str,
+                              ) -> np.ndarray:
+        return self.correlation_cache.correlations(f'{self.structure}/{self._clusters_fname}',
+                                                   f'{self.structure}/{self._lattice_fname}',
+                                                   f'{self.structure}/{structure}',
+                                                  )
 
-        return corr_sqs_
+    @cached_property
+    def correlation_engine(self: Cluster) -> CorrelationEngine:
+        """
+        In-process correlation engine for the lattice, None if it is not enabled or cannot be used.
+        When corrdump is available the engine is checked against corrdump on the input structure,
+        once per lattice, and not used if they disagree (e.g. another spin convention)
+        """
+        if not self.native_correlations:
+            return None
+        try:
+            engine = CorrelationEngine.from_files(self.clusters, f'{self.structure}/{self._lattice_fname}')
+        except (NotImplementedError, ValueError, FileNotFoundError, KeyError) as err:
+            print(f'WARNING: In-process correlation engine not available ({err}). Correlations will be computed with corrdump.')
+            return None
+        if shutil.which('corrdump') is None:
+            return engine
+        try:
+            corrs_engine = engine.bind_file(f'{self.structure}/{self._input_structure_fname}').correlations()
+            corrs_corrdump = self._corrdump_correlations(self._input_structure_fname)
+        except (subprocess.SubprocessError, OSError, ValueError) as err:
+            print(f'WARNING: In-process correlation engine could not be checked against corrdump ({err}).')
+            return engine
+        if not np.allclose(corrs_engine, corrs_corrdump, rtol=0.0, atol=CORRDUMP_ATOL):
+            print(f'WARNING: In-process correlations of {self._input_structure_fname} disagree with corrdump. Correlations will be computed with corrdump.')
+            print(f'Engine: {corrs_engine}')
+            print(f'corrdump: {corrs_corrdump}')
+            return None
+        return engine
 
     def get_correlations(self:Cluster,
                          structure: str
                         ):
-        corr_ = subprocess.run(['corrdump', '-c',
-                                f'-cf={self.structure}/{self._clusters_fname}',
-                                f'-s={self.structure}/{structure}',
-                                f'-l={self.structure}/{self._lattice_fname}'
-                               ],
-                               stdout=subprocess.PIPE,
-                               stderr=subprocess.PIPE,
-                               check=True
-                              )
-        # convert from bytes to string list
-        corr_ = corr_.stdout.decode('utf-8').split('\t')[:-1]
-        corr_ = np.array(corr_, dtype=np.float32)  # convert to arrays
-
-        return corr_
+        if self.correlation_engine is not None:
+            try:
+                return self.correlation_engine.bind_file(f'{self.structure}/{structure}').correlations()
+            except (ValueError, FileNotFoundError) as err:
+                print(f'WARNING: {structure} can not be handled by the correlation engine ({err}). Using corrdump.')
+        return self._corrdump_correlations(structure)
 
 
     @property
@@ -165,7 +257,7 @@ class Cluster:
 
     @cached_property
     def num_configs(self: Cluster) -> int:
-        return len(self.configmult)
+        return len(self._configmult_blocks[1])
 
     @cached_property
     def single_point_clusters(self: Cluster) -> list:
@@ -185,41 +277,135 @@ class Cluster:
 
     @cached_property
     def configmult_array(self: Cluster) -> np.ndarray:
-        return np.array(list(itertools.chain.from_iterable(list(self.configmult.values()))))
+        return np.asarray(self._configmult_blocks[0])
 
     @cached_property
     def kb_array(self: Cluster) -> np.ndarray:
-        return np.array(list(itertools.chain.from_iterable([[kb for _ in range(
-            len(self.configmult[idx]))] for idx, kb in self.kb.items()])))
+        return np.repeat(self._kb, self._configmult_blocks[1])
+
+    @property
+    def _vmat_streamed(self: Cluster) -> bool:
+        # without the memory mapped snapshot the dense stack is not kept, the V-Matrix is built from vmat.out block by block
+        return not self.use_snapshot and '_vmat_blocks' not in self.__dict__
 
     @cached_property
-    def vmatrix_array(self: Cluster) -> np.ndarray:
-        return np.vstack(list(self.vmat.values()))
+    def _vmat_csr(self: Cluster) -> sparse.csr_array:
+        if self._vmat_streamed:
+            blocks = iter_vmatrix_blocks(f'{self.structure}/{self._vmat_fname}')
+        else:
+            blocks = _split_blocks(*self._vmat_blocks).values()
+        return sparse.csr_array(sparse.vstack([sparse.csr_array(block) for block in blocks], format='csr'))
+
+    @cached_property
+    def vmatrix_density(self: Cluster) -> float:
+        if self._vmat_streamed:
+            return self._vmat_csr.nnz / np.prod(self._vmat_csr.shape)
+        return np.count_nonzero(self._vmat_blocks[0]) / self._vmat_blocks[0].size
+
+    @cached_property
+    def vmatrix_array(self: Cluster) -> np.ndarray | sparse.csr_array:
+        """
+        Stacked V-Matrix of all maximal clusters and subclusters.
+        Stored as CSR if vmat_storage is 'sparse', or if it is 'auto' and
+        the fraction of nonzero entries is below SPARSE_DENSITY_THRESHOLD.
+        Without the snapshot the CSR array is built block by block, no dense stack is kept
+        """
+        if self.vmat_storage not in ('auto', 'dense', 'sparse'):
+            raise ValueError(f"vmat_storage should be one of 'auto', 'dense' or 'sparse', not {self.vmat_storage}")
+        if self.vmat_storage == 'sparse' or (self.vmat_storage == 'auto' and self.vmatrix_density < SPARSE_DENSITY_THRESHOLD):
+            return self._vmat_csr
+        if self._vmat_streamed and '_vmat_csr' in self.__dict__:
+            # only the dense array is kept
+            return self.__dict__.pop('_vmat_csr').toarray()
+        return np.asarray(self._vmat_blocks[0])
+
+    def _corrdump_random_correlations(self: Cluster) -> np.ndarray:
+        return self.correlation_cache.correlations(f'{self.structure}/{self._clusters_fname}',
+                                                   f'{self.structure}/{self._lattice_fname}',
+                                                   f'{self.structure}/{self._input_structure_fname}',
+                                                   flags=('-rnd',),
+                                                  )
+
+    def _analytic_random_correlations(self: Cluster) -> np.ndarray:
+        """
+        In-process random state correlations, checked against corrdump -rnd when corrdump is available.
+        None if they can not be computed or disagree with corrdump (e.g. another spin convention)
+        """
+        try:
+            corr_rnd = random_correlations_from_files(self.clusters,
+                                                      f'{self.structure}/{self._lattice_fname}',
+                                                      f'{self.structure}/{self._input_structure_fname}',
+                                                     )
+        except (NotImplementedError, ValueError, FileNotFoundError, KeyError) as err:
+            print(f'WARNING: Analytic random state correlations not available ({err}). Falling back to corrdump -rnd.')
+            return None
+        if shutil.which('corrdump') is None:
+            return corr_rnd
+        try:
+            corr_corrdump = self._corrdump_random_correlations()
+        except (subprocess.SubprocessError, OSError, ValueError) as err:
+            print(f'WARNING: Analytic random state correlations could not be checked against corrdump -rnd ({err}).')
+            return corr_rnd
+        if not np.allclose(corr_rnd, corr_corrdump, rtol=0.0, atol=CORRDUMP_ATOL):
+            print('WARNING: Analytic random state correlations disagree with corrdump -rnd. Using corrdump -rnd.')
+            print(f'Analytic: {corr_rnd}')
+            print(f'corrdump: {corr_corrdump}')
+            return None
+        return corr_rnd
 
     @property
     def disordered_correlations(self: Cluster) -> np.ndarray:
+        """
+        Random state correlations of the input structure, from corrdump -rnd unless analytic_random is set
+        """
+        if self.analytic_random:
+            if self._input_structure_fname not in self._random_correlations:
+                self._random_correlations[self._input_structure_fname] = self._analytic_random_correlations()
+            corr_rnd = self._random_correlations[self._input_structure_fname]
+            if corr_rnd is not None:
+                return corr_rnd.copy()
+
+        return self._corrdump_random_correlations()
+
+    def _chebyshev(self: Cluster) -> (np.ndarray, float):
+        """
+        Chebyshev centre and radius of the correlation polytope, one linear programming per input structure
+        """
+        if self._input_structure_fname not in self._chebyshev_centers:
+            corrs_rnd = self.disordered_correlations
+            bounds = CorrelationBounds(self.num_clusters,
+                                       len(self.single_point_clusters),
+                                       corrs_rnd[self.single_point_clusters]
+                                      ).sro_bounds
+            presolve = FixedCorrelationPresolve(all_vmat=self.vmatrix_array,
+                                                mults_eci=np.zeros(self.num_clusters),
+                                                lower=bounds.lb,
+                                                upper=bounds.ub,
+                                               )
+            center, radius = chebyshev_center(presolve.vmat_free, presolve.rho_offset, presolve.lower[presolve.free], presolve.upper[presolve.free])
+            if center is None:
+                print('WARNING: Using the disordered correlations as the centre of the correlation polytope.')
+                center, radius = presolve.restrict(corrs_rnd), 0.0
+            self._chebyshev_centers[self._input_structure_fname] = (presolve.expand(center), radius)
+        return self._chebyshev_centers[self._input_structure_fname]
 
-        corr_rnd = subprocess.run(['corrdump', '-c', f'-cf={self.structure}/{self._clusters_fname}', f'-s={self.structure}/{self._input_structure_fname}', f'-l={self.structure}/{self._lattice_fname}', '-rnd'],
-                                  stdout=subprocess.PIPE,
-                                  stderr=subprocess.PIPE,
-                                  check=True
-                                 )
-        # convert from bytes to string list
-        corr_rnd = corr_rnd.stdout.decode('utf-8').split('\t')[:-1]
-        corr_rnd = np.array(corr_rnd, dtype=np.float32)  # convert to arrays
+    @property
+    def chebyshev_center(self: Cluster) -> np.ndarray:
+        """
+        Correlations farthest inside {V.x >= 0} and the bounds with the empty and point correlations of the
+        disordered state: centre of the largest ball of the other correlations inside the polytope
+        """
+        return self._chebyshev()[0].copy()
 
-        return corr_rnd
+    @property
+    def chebyshev_radius(self: Cluster) -> float:
+        return self._chebyshev()[1]
 
     def check_correlation_validity(self: Cluster,
                                    correlations: np.ndarray,
                                   ) -> bool:
-        try:
-            for vmat in self.vmat.values():
-                rho = vmat @ correlations
-                assert np.all([(x >= 0.0 - EPSILON) and (x <= 1.0 + EPSILON) for x in rho])
-        except AssertionError:
-            return False
-        return True
+        rho = self.vmatrix_array @ correlations
+        return bool(np.all((rho >= 0.0 - EPSILON) & (rho <= 1.0 + EPSILON)))
 
     def print_correlations_to_file(self: Cluster,
                                    correlations: np.ndarray,
@@ -252,20 +438,26 @@ class Cluster:
     def from_maximal_cluster(cls: Cluster,
                              maxclus_fname: str = 'maxclus.in',
                              lattice_fname: str = 'lat.in',
+                             vmat_storage: str = 'auto',
+                             analytic_random: bool = False,
+                             native_correlations: bool = False,
+                             use_snapshot: bool = True,
+                             structure: str = None,
                             ):
+        structure_ = os.path.abspath(os.getcwd() if structure is None else structure)
         try:
-            structure_ = os.getcwd()
             path_ = Path(structure_)
             phase_ = str(path_.parent.absolute())
             _ = subprocess.run(['cvmclus',
                                 f'-m={phase_}/{maxclus_fname}',
                                 f'-l={structure_}/{lattice_fname}'
                                ],
+                               cwd=structure_,
                                stdout=subprocess.PIPE,
                                stderr=subprocess.PIPE,
                                check=True
                               )
-        except subprocess.SubprocessError as suberr:
+        except (subprocess.SubprocessError, OSError) as suberr:
             print('Error in generating cluster configuration files for CVM.')
             print('Continuing to run. Might work if the required files already exists, maybe created by some previous run of cvmclus')
 
@@ -278,6 +470,11 @@ class Cluster:
                           _kb_fname = 'configkb.out',
                           _vmat_fname = 'vmat.out',
                           _lattice_fname = lattice_fname,
+                          vmat_storage = vmat_storage,
+                          analytic_random = analytic_random,
+                          native_correlations = native_correlations,
+                          use_snapshot = use_snapshot,
+                          structure = structure_,
                          )
         return cluster
 
@@ -326,6 +523,7 @@ class Cluster:
 
         print(f'Total Configurations: {self.vmatrix_array.shape[0]}')
         print(f'Total Clusters: {self.vmatrix_array.shape[1]}')
+        print(f'V-Matrix density: {self.vmatrix_density:.3f} (stored as {"CSR" if sparse.issparse(self.vmatrix_array) else "dense"})')
         print(f"Phase: {self.phase.rsplit('/',maxsplit=1)[-1]}")
         print(f'No. of lattice atoms: {self.num_lat_atoms}')
         print(f"Structure: {self.structure.split('/')[-1]}")
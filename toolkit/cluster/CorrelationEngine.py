@@ -0,0 +1,243 @@
+"""
+In-process correlation calculator for periodic structures built on the parent lattice
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+import numpy as np
+
+from toolkit.cluster.Lattice import Lattice
+from toolkit.io.atatio import read_structure
+
+# orders of the point groups of the lattices of the 7 crystal systems
+HOLOHEDRY_ORDERS = (2, 4, 8, 12, 16, 24, 48)
+
+@dataclass(kw_only=True, order=False, eq=False)
+class CorrelationEngine:
+    """
+    Precomputes the space group of the parent lattice and the orbit of every cluster
+    in clusters.out, so that correlations of structures on the lattice can be evaluated
+    without corrdump. Only binary lattices are supported.
+    The point group of the lattice is searched over all lattice vectors of the lengths of the cell vectors,
+    so non-reduced cells are handled. A ValueError is raised if the operations found do not form a lattice
+    point group, or if the space group operations are not closed under composition.
+    Input:
+        lattice - Parent lattice
+        clusters - Clusters as returned by read_clusters (with point coordinates)
+    """
+
+    lattice: Lattice
+    clusters: dict
+
+    _symmetry_ops: list = field(init=False, repr=False)
+    _orbits: list = field(init=False, repr=False)
+
+    def __post_init__(self: CorrelationEngine) -> None:
+        if not self.lattice.is_binary:
+            raise NotImplementedError('The correlation engine only supports binary lattices')
+        for cluster in self.clusters.values():
+            if cluster['type'] > 0 and np.any(cluster['functions'][:, 1] != 0):
+                raise NotImplementedError('The correlation engine only supports the binary site function')
+        self._symmetry_ops = self._space_group()
+        self._orbits = [self._orbit(cluster) for cluster in self.clusters.values()]
+
+    @classmethod
+    def from_files(cls: CorrelationEngine,
+                   clusters: dict,
+                   lattice_fname: str = 'lat.in',
+                  ) -> CorrelationEngine:
+        return cls(lattice=Lattice.from_file(lattice_fname), clusters=clusters)
+
+    def _lattice_vectors(self: CorrelationEngine,
+                         length: float,
+                        ) -> np.ndarray:
+        """
+        Integer coordinates of every lattice vector of the given length. The coordinates n = v.inv(cell)
+        of a vector v satisfy |n_i| <= |v| |inv(cell)[:, i]|, whatever the cell
+        """
+        cell = self.lattice.cell
+        bounds = np.ceil(length * np.linalg.norm(np.linalg.inv(cell), axis=0) + self.lattice.tolerance).astype(int)
+        candidates = np.stack(np.meshgrid(*[np.arange(-bound, bound + 1) for bound in bounds], indexing='ij'), axis=-1).reshape(-1, 3)
+        return candidates[np.abs(np.linalg.norm(candidates @ cell, axis=1) - length) < self.lattice.tolerance]
+
+    def _point_group(self: CorrelationEngine) -> list:
+        """
+        Integer matrices R (fractional coordinates f -> f.R) mapping the lattice onto itself
+        """
+        cell = self.lattice.cell
+        metric = cell @ cell.T
+        tolerance = self.lattice.tolerance
+        # images of the lattice vectors are lattice vectors of the same lengths and angles
+        rows = [self._lattice_vectors(length) for length in np.sqrt(np.diag(metric))]
+        cartesian = [row @ cell for row in rows]
+        rotations = []
+        for first, second in zip(*np.nonzero(np.abs(cartesian[0] @ cartesian[1].T - metric[0, 1]) < tolerance)):
+            thirds = np.flatnonzero((np.abs(cartesian[2] @ cartesian[0][first] - metric[0, 2]) < tolerance)
+                                    & (np.abs(cartesian[2] @ cartesian[1][second] - metric[1, 2]) < tolerance))
+            rotations.extend(np.array([rows[0][first], rows[1][second], rows[2][third]]) for third in thirds)
+
+        keys = {rotation.tobytes() for rotation in rotations}
+        closed = all((first @ second).tobytes() in keys for first in rotations for second in rotations)
+        if len(keys) not in HOLOHEDRY_ORDERS or not closed or (-np.eye(3, dtype=rotations[0].dtype)).tobytes() not in keys:
+            raise ValueError(f'The {len(keys)} point operations found do not form the point group of a lattice')
+        return rotations
+
+    def _space_group(self: CorrelationEngine) -> list:
+        """
+        Symmetry operations f -> f.R + t (fractional coordinates) mapping the lattice,
+        including the allowed species of every site, onto itself
+        """
+        cell = self.lattice.cell
+        point_group = self._point_group()
+        frac_sites = self.lattice.fractional(self.lattice.positions)
+        species = [tuple(sorted(specie)) for specie in self.lattice.species]
+        ops = []
+        for rotation in point_group:
+            rotated = frac_sites @ rotation
+            for site in range(self.lattice.num_sites):
+                if species[site] != species[0]:
+                    continue
+                translation = frac_sites[site] - rotated[0]
+                translation -= np.floor(translation + self.lattice.tolerance)
+                try:
+                    images, _ = self.lattice.locate((rotated + translation) @ cell)
+                except ValueError:
+                    continue
+                if len(set(images)) == self.lattice.num_sites and all(species[image] == species[idx] for idx, image in enumerate(images)):
+                    ops.append((rotation, translation))
+
+        # f -> (f.R1 + t1).R2 + t2 must be an operation, translations are compared modulo the lattice
+        def key(rotation, translation):
+            steps = np.round(translation / self.lattice.tolerance).astype(np.int64) % int(round(1 / self.lattice.tolerance))
+            return rotation.tobytes() + steps.tobytes()
+        keys = {key(rotation, translation) for rotation, translation in ops}
+        closed = all(key(first[0] @ second[0], first[1] @ second[0] + second[1]) in keys for first in ops for second in ops)
+        num_rotations = len({rotation.tobytes() for rotation, _ in ops})
+        if not closed or len(point_group) % num_rotations != 0:
+            raise ValueError(f'The {len(ops)} space group operations found do not form a group')
+        return ops
+
+    def _orbit(self: CorrelationEngine,
+               cluster: dict,
+              ) -> list:
+        """
+        Symmetry distinct copies of a cluster, one per lattice translation class,
+        each as (sites, translations) of its points relative to the first point
+        """
+        if cluster['type'] == 0:
+            return []
+        frac_points = self.lattice.fractional(self.lattice.to_cartesian(cluster['points']))
+        members = {}
+        for rotation, translation in self._symmetry_ops:
+            sites, translations = self.lattice.locate((frac_points @ rotation + translation) @ self.lattice.cell)
+            # canonical form: lowest relabelling over the choice of the anchor point
+            key = min(tuple(sorted(zip(sites.tolist(), map(tuple, (translations - translations[anchor]).tolist()))))
+                      for anchor in range(len(sites)))
+            members[key] = key
+        return [(np.array([point[0] for point in member]), np.array([point[1] for point in member]))
+                for member in members.values()]
+
+    @property
+    def orbit_sizes(self: CorrelationEngine) -> np.ndarray:
+        return np.array([max(len(orbit), 1) for orbit in self._orbits])
+
+    def bind(self: CorrelationEngine,
+             structure: dict,
+            ) -> SupercellCorrelator:
+        """
+        Builds the cluster site index tables of a structure (as returned by read_structure)
+        """
+        return SupercellCorrelator(engine=self, structure=structure)
+
+    def bind_file(self: CorrelationEngine,
+                  structure_fname: str,
+                 ) -> SupercellCorrelator:
+        structure = read_structure(structure_fname)
+        if structure is None:
+            raise FileNotFoundError(structure_fname)
+        return self.bind(structure)
+
+@dataclass(kw_only=True, order=False, eq=False)
+class SupercellCorrelator:
+    """
+    Correlations of arbitrary site occupations of one supercell, evaluated as a
+    gather of the occupation spins over precomputed cluster site tables followed by a product
+    """
+
+    engine: CorrelationEngine
+    structure: dict
+
+    sites: np.ndarray = field(init=False, repr=False)
+    _tables: dict = field(init=False, repr=False)
+
+    def __post_init__(self: SupercellCorrelator) -> None:
+        lattice = self.engine.lattice
+        self.sites, translations = lattice.locate(self.structure['positions'])
+        supercell = np.linalg.solve(lattice.cell.T, self.structure['cell'].T).T
+        if not np.allclose(supercell, np.round(supercell), atol=lattice.tolerance):
+            raise ValueError('The structure cell is not a supercell of the lattice')
+        supercell = np.round(supercell).astype(int)
+        inv_supercell = np.linalg.inv(supercell)
+
+        num_cells = int(round(abs(np.linalg.det(supercell))))
+
+        def wrap(sites, translations):
+            # unique integer code of a lattice site modulo the supercell, translations @ inv_supercell
+            # are multiples of 1/num_cells
+            frac = np.round(translations @ inv_supercell * num_cells).astype(np.int64) % num_cells
+            return ((sites * num_cells + frac[..., 0]) * num_cells + frac[..., 1]) * num_cells + frac[..., 2]
+
+        atom_codes = wrap(self.sites, translations)
+        order = np.argsort(atom_codes)
+        sorted_codes = atom_codes[order]
+        if np.any(np.diff(sorted_codes) == 0):
+            raise ValueError('Two atoms of the structure occupy the same lattice site')
+
+        tables = {}
+        for cluster_idx, orbit in enumerate(self.engine._orbits):
+            for member_sites, member_translations in orbit:
+                anchors = np.flatnonzero(self.sites == member_sites[0])
+                point_translations = translations[anchors][:, np.newaxis, :] + (member_translations - member_translations[0])[np.newaxis, :, :]
+                codes = wrap(np.broadcast_to(member_sites, point_translations.shape[:2]), point_translations)
+                positions = np.searchsorted(sorted_codes, codes)
+                if np.any(positions >= len(sorted_codes)) or np.any(sorted_codes[np.minimum(positions, len(sorted_codes) - 1)] != codes):
+                    raise ValueError('The structure does not cover every site of the lattice')
+                table, ids = tables.setdefault(len(member_sites), ([], []))
+                table.append(order[positions])
+                ids.append(np.full(len(anchors), cluster_idx))
+        self._tables = {}
+        for num_points, (table, ids) in tables.items():
+            ids = np.concatenate(ids)
+            by_cluster = np.argsort(ids, kind='stable')
+            ids = ids[by_cluster]
+            clusters, starts, counts = np.unique(ids, return_index=True, return_counts=True)
+            self._tables[num_points] = (np.concatenate(table)[by_cluster], clusters, starts, counts)
+
+    def spins(self: SupercellCorrelator,
+              species: list[str] = None,
+             ) -> np.ndarray:
+        """
+        Spins of a species assignment (defaults to the species of the bound structure)
+        """
+        return self.engine.lattice.spins(self.sites, self.structure['species'] if species is None else species)
+
+    def __call__(self: SupercellCorrelator,
+                 spins: np.ndarray,
+                ) -> np.ndarray:
+        """
+        Input:
+            spins - Spins of the atoms, shape (num_atoms,) or (num_samples, num_atoms)
+        Output:
+            Correlations, shape (num_clusters,) or (num_samples, num_clusters)
+        """
+        spins = np.asarray(spins, dtype=np.float64)
+        corrs = np.ones(spins.shape[:-1] + (len(self.engine.clusters),))
+        for table, clusters, starts, counts in self._tables.values():
+            products = np.prod(spins[..., table], axis=-1)
+            corrs[..., clusters] = np.add.reduceat(products, starts, axis=-1) / counts
+        return corrs
+
+    def correlations(self: SupercellCorrelator,
+                     species: list[str] = None,
+                    ) -> np.ndarray:
+        return self(self.spins(species))
@@ -0,0 +1,114 @@
+"""
+Parent lattice description read from lat.in
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+import numpy as np
+
+from toolkit.io.atatio import read_structure
+
+# Binary site functions assumed to follow ATAT's multicomponent convention -cos(pi*sigma),
+# i.e. the first species listed on a site of lat.in has spin -1 and the second +1.
+# Cluster checks the random state against corrdump -rnd when corrdump is available.
+BINARY_SPINS = (-1.0, 1.0)
+
+@dataclass(kw_only=True, order=False, eq=False)
+class Lattice:
+    """
+    Class to hold the parent lattice
+    Input:
+        coord_system - axes of the coordinate system (rows, cartesian)
+        cell - lattice vectors (rows, cartesian)
+        positions - cartesian positions of the sites in the unit cell
+        species - allowed species on each site
+    """
+
+    coord_system: np.ndarray
+    cell: np.ndarray
+    positions: np.ndarray
+    species: list[list[str]]
+    tolerance: float = 1e-3
+
+    _inv_cell: np.ndarray = field(init=False, repr=False)
+    _fractional_sites: np.ndarray = field(init=False, repr=False)
+
+    def __post_init__(self: Lattice) -> None:
+        self._inv_cell = np.linalg.inv(self.cell)
+        self._fractional_sites = self.fractional(self.positions)
+
+    @classmethod
+    def from_file(cls: Lattice,
+                  lattice_fname: str = 'lat.in',
+                 ) -> Lattice:
+        lattice = read_structure(lattice_fname)
+        if lattice is None:
+            raise FileNotFoundError(lattice_fname)
+        return cls(coord_system=lattice['coord_system'],
+                   cell=lattice['cell'],
+                   positions=lattice['positions'],
+                   species=[species.split(',') for species in lattice['species']],
+                  )
+
+    @property
+    def num_sites(self: Lattice) -> int:
+        return len(self.species)
+
+    @property
+    def active_sites(self: Lattice) -> np.ndarray:
+        return np.array([idx for idx, species in enumerate(self.species) if len(species) > 1], dtype=int)
+
+    @property
+    def is_binary(self: Lattice) -> bool:
+        return all(len(species) <= 2 for species in self.species)
+
+    def to_cartesian(self: Lattice,
+                     coords: np.ndarray,
+                    ) -> np.ndarray:
+        """
+        Converts coordinates given in units of the coordinate system (as in lat.in and clusters.out)
+        """
+        return np.asarray(coords, dtype=float) @ self.coord_system
+
+    def fractional(self: Lattice,
+                   cartesian: np.ndarray,
+                  ) -> np.ndarray:
+        return np.asarray(cartesian, dtype=float) @ self._inv_cell
+
+    def locate(self: Lattice,
+               cartesian: np.ndarray,
+              ) -> (np.ndarray, np.ndarray):
+        """
+        Maps cartesian positions onto the lattice
+        Output:
+            sites - index of the unit cell site of each position
+            translations - integer lattice translation of each position
+        """
+        frac = np.atleast_2d(self.fractional(cartesian))
+        # offset of every position from every site, an integer vector for the matching site
+        offsets = frac[:, np.newaxis, :] - self._fractional_sites[np.newaxis, :, :]
+        mismatch = np.abs(offsets - np.round(offsets)).max(axis=-1)
+        sites = np.argmin(mismatch, axis=1)
+        if np.any(mismatch[np.arange(len(sites)), sites] > self.tolerance):
+            raise ValueError('Positions do not lie on the sites of the lattice')
+        translations = np.round(offsets[np.arange(len(sites)), sites]).astype(int)
+        return sites, translations
+
+    def spins(self: Lattice,
+              sites: np.ndarray,
+              species: list[str],
+             ) -> np.ndarray:
+        """
+        Binary spin of each species on its lattice site, 0 on inactive sites
+        """
+        if not self.is_binary:
+            raise NotImplementedError('Spin variables are only defined for binary lattices')
+        spins_ = np.zeros(len(species))
+        for idx, (site, specie) in enumerate(zip(sites, species)):
+            if len(self.species[site]) < 2:
+                continue
+            try:
+                spins_[idx] = BINARY_SPINS[self.species[site].index(specie)]
+            except ValueError as valerr:
+                raise ValueError(f'Species {specie} is not allowed on site {site} of the lattice') from valerr
+        return spins_
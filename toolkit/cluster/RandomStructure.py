@@ -0,0 +1,107 @@
+"""
+Random reshuffles of the occupations of a structure
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+import numpy as np
+
+from toolkit.cluster.Cluster import Cluster
+from toolkit.cluster.CorrelationEngine import SupercellCorrelator
+from toolkit.cluster.Lattice import Lattice
+from toolkit.io.atatio import parse_structure, run_corrdump
+
+@dataclass(kw_only=True, order=False, eq=False)
+class RandomStructure:
+    """
+    Structure file (str.in) parsed once, whose occupations are reshuffled within every sublattice
+    by permutations drawn from a numpy Generator, one or many at a time.
+    The correlations of the shuffles are computed in-process by the correlation engine of the cluster
+    if it can handle the structure, otherwise by corrdump with the structure piped through stdin.
+    Input:
+        structure_fname - structure file
+        cluster - Cluster description of the structure
+    """
+
+    structure_fname: str
+    cluster: Cluster
+
+    structure: dict = field(init=False, repr=False)
+    species: np.ndarray = field(init=False, repr=False)
+    sublattices: list[np.ndarray] = field(init=False, repr=False)
+    _correlator: SupercellCorrelator = field(init=False, default=None, repr=False)
+    _spins: np.ndarray = field(init=False, default=None, repr=False)
+
+    def __post_init__(self: RandomStructure) -> None:
+
+        with open(self.structure_fname, 'r', encoding='utf-8') as fstructure:
+            self.structure = parse_structure(fstructure.read())
+        self.species = np.array(self.structure['species'])
+
+        if self.cluster.correlation_engine is not None:
+            try:
+                self._correlator = self.cluster.correlation_engine.bind(self.structure)
+                self._spins = self._correlator.spins()
+            except ValueError as err:
+                print(f'WARNING: {self.structure_fname} can not be handled by the correlation engine ({err}). Using corrdump.')
+                self._correlator = None
+
+        if self._correlator is not None:
+            sites = self._correlator.sites
+        else:
+            try:
+                sites, _ = Lattice.from_file(f'{self.cluster.structure}/{self.cluster._lattice_fname}').locate(self.structure['positions'])
+            except (ValueError, FileNotFoundError):
+                # the atoms are shuffled over all the sites
+                sites = np.zeros(len(self.species), dtype=int)
+        self.sublattices = [np.flatnonzero(sites == site) for site in np.unique(sites)]
+
+    @property
+    def num_atoms(self: RandomStructure) -> int:
+        return len(self.species)
+
+    def permutations(self: RandomStructure,
+                     rng: np.random.Generator,
+                     num_samples: int = None,
+                    ) -> np.ndarray:
+        """
+        Atom index permutations shuffling every sublattice, shape (num_atoms,) or (num_samples, num_atoms)
+        """
+        permutations = np.tile(np.arange(self.num_atoms), (1 if num_samples is None else num_samples, 1))
+        for sublattice in self.sublattices:
+            permutations[:, sublattice] = rng.permuted(permutations[:, sublattice], axis=1)
+        return permutations[0] if num_samples is None else permutations
+
+    def structure_content(self: RandomStructure,
+                          permutation: np.ndarray,
+                         ) -> str:
+        """
+        Structure file with the species of the atoms permuted
+        """
+        atoms = [f'{site} {specie}' for site, specie in zip(self.structure['sites'], self.species[permutation])]
+        return '\n'.join([*self.structure['header'], *atoms]) + '\n'
+
+    def correlations(self: RandomStructure,
+                     permutations: np.ndarray,
+                    ) -> np.ndarray:
+        """
+        Correlations of the permuted structures, shape (num_clusters,) or (num_samples, num_clusters)
+        """
+        if self._correlator is not None:
+            return self._correlator(self._spins[permutations])
+        corrs = [run_corrdump(f'{self.cluster.structure}/{self.cluster._clusters_fname}',
+                              f'{self.structure_fname}.random',
+                              f'{self.cluster.structure}/{self.cluster._lattice_fname}',
+                              structure_content=self.structure_content(permutation),
+                             )
+                 for permutation in np.atleast_2d(permutations)]
+        return corrs[0] if np.ndim(permutations) == 1 else np.array(corrs)
+
+    def sample(self: RandomStructure,
+               rng: np.random.Generator,
+               num_samples: int = None,
+              ) -> np.ndarray:
+        """
+        Correlations of random reshuffles, shape (num_clusters,) or (num_samples, num_clusters)
+        """
+        return self.correlations(self.permutations(rng, num_samples))
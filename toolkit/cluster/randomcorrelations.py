@@ -0,0 +1,68 @@
+"""
+Correlations of the random (disordered) state without corrdump
+"""
+
+from __future__ import annotations
+import numpy as np
+
+from toolkit.cluster.Lattice import Lattice
+from toolkit.io.atatio import read_structure
+
+def point_correlations(lattice: Lattice,
+                       structure: dict,
+                      ) -> np.ndarray:
+    """
+    Input:
+        lattice - Parent lattice
+        structure - Structure as returned by read_structure (str.in)
+
+    Output:
+        Average spin on every site of the lattice unit cell, i.e. the point
+        correlation fixed by the composition of the structure (0 on inactive sites)
+    """
+
+    sites, _ = lattice.locate(structure['positions'])
+    spins = lattice.spins(sites, structure['species'])
+    point_corrs = np.zeros(lattice.num_sites)
+    for site in lattice.active_sites:
+        on_site = sites == site
+        if np.any(on_site):
+            point_corrs[site] = spins[on_site].mean()
+    return point_corrs
+
+def random_correlations(clusters: dict,
+                        lattice: Lattice,
+                        structure: dict,
+                       ) -> np.ndarray:
+    """
+    Input:
+        clusters - Clusters as returned by read_clusters (with point coordinates)
+        lattice - Parent lattice
+        structure - Structure as returned by read_structure, sets the composition
+
+    Output:
+        Correlations of the random binary alloy with the composition of structure.
+        Every cluster correlation is the product of the point correlations of its sites.
+        Symmetry equivalent sublattices are assumed to have the same composition.
+    """
+
+    if not lattice.is_binary:
+        raise NotImplementedError('Analytic random state correlations are only implemented for binary lattices')
+
+    point_corrs = point_correlations(lattice, structure)
+    corrs = np.ones(len(clusters))
+    for idx, cluster in enumerate(clusters.values()):
+        if cluster['type'] == 0:
+            continue
+        sites, _ = lattice.locate(lattice.to_cartesian(cluster['points']))
+        corrs[idx] = np.prod(point_corrs[sites])
+    return corrs
+
+def random_correlations_from_files(clusters: dict,
+                                   lattice_fname: str = 'lat.in',
+                                   structure_fname: str = 'str.in',
+                                  ) -> np.ndarray:
+    structure = read_structure(structure_fname)
+    if structure is None:
+        raise FileNotFoundError(structure_fname)
+    return random_correlations(clusters, Lattice.from_file(lattice_fname), structure)
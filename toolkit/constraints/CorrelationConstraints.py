@@ -4,37 +4,47 @@ Constrain the constraints class defining the different constrains
 from __future__ import annotations
 from dataclasses import dataclass, field
 import numpy as np
-from scipy.optimize import BFGS
+from scipy.optimize import LinearConstraint, NonlinearConstraint
 
 @dataclass(frozen=True, order=False, eq=False)
 class CorrelationConstraints:
+    """
+    Constraints of the correlations x:
+        V.x + rho_offset >= 0, a linear constraint (all configuration probabilities non-negative)
+        |x - x_disordered| <= R = |x_ordered - x_disordered|/2, if norm constrained,
+        with its exact gradient and Hessian
+    """
     _all_vmat: np.ndarray
     _ordered_correlations: np.ndarray = None
     _disordered_correlations: np.ndarray = None
     _norm_constrained: bool = False
+    _rho_offset: np.ndarray | float = 0.0
 
-    _linear_constraints: list[dict] = field(init=False,default_factory=list)
-    _norm_constraints: list[dict] = field(init=False,default_factory=list)
+    _linear_constraints: list[LinearConstraint] = field(init=False,default_factory=list)
+    _norm_constraints: list[NonlinearConstraint] = field(init=False,default_factory=list)
 
-    def __post_init__(self: Constraints) -> None:
+    def __post_init__(self: CorrelationConstraints) -> None:
 
         object.__setattr__(self,
                            '_linear_constraints',
-                           [{'fun': lambda x: self._all_vmat @ x,
-                             'type': 'ineq',
-                             'jac' : lambda x : self._all_vmat,
-                             'hess': lambda x: np.zeros_like(self.__all_vmat)
-                            }
+                           [LinearConstraint(self._all_vmat,
+                                             lb=-np.broadcast_to(self._rho_offset, self._all_vmat.shape[:1]),
+                                             ub=np.inf,
+                                            )
                            ]
                           )
         if self._norm_constrained:
+            # (R^2 - |x - x_disordered|^2)/2R is smooth at the disordered state, unlike R - |x - x_disordered|,
+            # and has the same slope at the boundary
+            radius = np.linalg.norm(self._ordered_correlations - self._disordered_correlations)/2
             object.__setattr__(self,
                                '_norm_constraints',
-                               [{'fun': lambda x: np.linalg.norm(self._ordered_correlations - self._disordered_correlations)/2 - np.linalg.norm(x-self._disordered_correlations),
-                                 'type': 'ineq',
-                                 'jac': '3-point',
-                                 'hess': BFGS(),
-                                }
+                               [NonlinearConstraint(lambda x: (radius**2 - np.sum((x - self._disordered_correlations)**2)) / (2*radius),
+                                                    lb=0,
+                                                    ub=np.inf,
+                                                    jac=lambda x: -((x - self._disordered_correlations) / radius)[np.newaxis, :],
+                                                    hess=lambda x, v: -v[0] / radius * np.eye(len(x)),
+                                                   )
                                ]
                               )
 
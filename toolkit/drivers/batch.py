@@ -0,0 +1,92 @@
+"""
+Runs the SRO correction pipeline over all structure directories of a phase on a process pool
+"""
+
+from __future__ import annotations
+from argparse import Namespace
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+import os
+import sys
+import traceback
+
+import pandas as pd
+
+from toolkit.drivers.pipeline import output_fnames, run_structure
+from toolkit.drivers.workers import blas_thread_env, limit_blas_threads
+from toolkit.logger.Logger import Logger
+
+def discover_structures(phase: str,
+                        lattice_fname: str = 'lat.in',
+                        structure_fname: str = 'str.in',
+                       ) -> list[str]:
+    """
+    Structure directories of a phase, i.e. its subdirectories holding both a lattice and a structure file
+    """
+    phase = os.path.abspath(phase)
+    return [os.path.join(phase, entry) for entry in sorted(os.listdir(phase))
+            if os.path.isfile(os.path.join(phase, entry, lattice_fname)) and os.path.isfile(os.path.join(phase, entry, structure_fname))]
+
+def _run_structure_logged(structure: str,
+                          args: Namespace,
+                         ) -> pd.DataFrame:
+    """
+    run_structure with its output going to a log file in the structure directory
+    """
+    log_fname, out_fname = output_fnames(args)
+    stdout = sys.stdout
+    sys.stdout = Logger(stdout, f'{structure}/{log_fname}', False)
+    try:
+        return run_structure(structure, args, out_fname)
+    finally:
+        sys.stdout.outfile.close()
+        sys.stdout = stdout
+
+def run_phase(phase: str,
+              args: Namespace,
+              structures: list[str] = None,
+              max_workers: int = 1,
+              blas_threads: int = 1,
+              table_fname: str = None,
+             ) -> pd.DataFrame:
+    """
+    Input:
+        phase - phase directory, holding the maximal clusters file and the structure directories
+        args - pipeline options as parsed by SRO_argument_parser
+        structures - structure directory names, all structures of the phase if None
+        max_workers - number of structures processed at the same time
+        blas_threads - BLAS/OpenMP threads of each worker
+        table_fname - if given, the combined table is written to <phase>/<table_fname>
+    Output:
+        Results of all structures in one table, in the order of structures.
+        Structures that failed are reported and left out.
+    """
+
+    phase = os.path.abspath(phase)
+    if structures is None:
+        structures = discover_structures(phase, args.lat)
+    else:
+        structures = [os.path.join(phase, structure) for structure in structures]
+
+    # workers are spawned (not forked) so that the BLAS runtimes read the thread limits on import
+    results = {}
+    with blas_thread_env(blas_threads), ProcessPoolExecutor(max_workers=max_workers,
+                                                            mp_context=multiprocessing.get_context('spawn'),
+                                                            initializer=limit_blas_threads,
+                                                            initargs=(blas_threads,),
+                                                           ) as executor:
+        futures = {executor.submit(_run_structure_logged, structure, args): structure for structure in structures}
+        for future in as_completed(futures):
+            structure = futures[future]
+            try:
+                results[structure] = future.result()
+                print(f'{os.path.basename(structure)} done.')
+            except Exception as err:
+                print(f'WARNING: {os.path.basename(structure)} failed: {err!r}')
+                traceback.print_exception(err)
+
+    table = [results[structure] for structure in structures if structure in results]
+    table = pd.concat(table, ignore_index=True) if table else pd.DataFrame()
+    if table_fname is not None:
+        table.to_csv(f'{phase}/{table_fname}', index=False)
+    return table
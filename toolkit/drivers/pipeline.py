@@ -0,0 +1,182 @@
+"""
+SRO correction pipeline of a single structure directory, independent of the working directory
+"""
+
+from __future__ import annotations
+from argparse import Namespace
+from collections.abc import Iterable
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from toolkit.io.SROResults import SROResults
+from toolkit.cluster.Cluster import Cluster
+from toolkit.optimizers.OrderedStateOptimizer import OrderedStateOptimizer
+from toolkit.optimizers.CVMOptimizer import CVMOptimizer
+from toolkit.optimizers.NewtonOptimizer import NewtonOptimizer
+from toolkit.optimizers.BasinHoppingOptimizer import BasinHoppingOptimizer
+from toolkit.drivers.sweep import temperature_sweep
+
+def custom_linspace(start: float, stop: float, step:float =1) -> Iterable[float]:
+    """
+    Like np.linspace but uses step instead of num
+    This is inclusive to stop, so if start=1, stop=3, step=0.5
+    Output is: array([1., 1.5, 2., 2.5, 3.])
+    """
+
+    return np.linspace(start, stop, int((stop - start) / step + 1))
+
+def output_fnames(args: Namespace) -> (str, str):
+    """
+    Log and results file names, tagged with the constraint type and the date
+    """
+    tdate = datetime.now().strftime('%d%b-%H%m')
+    if args.norm_constraint:
+        return f'{args.log}-cons-{tdate}', f'{args.out}-cons-{tdate}'
+    return f'{args.log}-nocons-{tdate}', f'{args.out}-nocons-{tdate}'
+
+def make_cluster(structure: str,
+                 args: Namespace,
+                ) -> Cluster:
+    """
+    Runs cvmclus in structure and reads the cluster description
+    """
+    return Cluster.from_maximal_cluster(maxclus_fname = args.maximal_clusters,
+                                        lattice_fname = args.lat,
+                                        vmat_storage = args.vmat_storage,
+                                        analytic_random = args.analytic_random,
+                                        native_correlations = args.native_correlations,
+                                        use_snapshot = not args.no_snapshot,
+                                        structure = structure,
+                                       )
+
+def fit_ordered_state(cluster: Cluster,
+                      args: Namespace,
+                     ) -> OrderedStateOptimizer:
+    """
+    Ordered state by linear programming, stored in cluster.ordered_correlations
+    """
+    options_ordered = {'disp': bool(args.verbose),
+                       'maxiter': args.maxiter_linprog,
+                      }
+
+    opt_ordered = OrderedStateOptimizer(cluster = cluster,
+                                        print_output = args.disp,
+                                        num_trials = args.maxiter_linprog,
+                                        options = options_ordered,
+                                        method = args.method_linprog,
+                                        use_cache = not args.no_ordered_cache,
+                                        enumerate_vertices = args.ordered_vertices,
+                                       )
+    _ = opt_ordered.fit()
+    return opt_ordered
+
+def make_sro_optimizer(cluster: Cluster,
+                       args: Namespace,
+                      ) -> CVMOptimizer:
+
+    options = {'verbose': args.verbose,
+               'maxiter': args.maxiter,
+               'xtol': args.xtol,
+               'gtol': args.gtol,
+               'barrier_tol': args.barrier_tol,
+               'initial_tr_radius': args.initial_tr_radius,
+               'initial_constr_penalty': args.initial_constr_penalty,
+              }
+    optimizer_cls = NewtonOptimizer if args.local_solver == 'newton' else CVMOptimizer
+    optimizer_kwargs = {}
+    if args.basinhopping:
+        if args.local_solver == 'newton':
+            print('WARNING: Basin hopping uses the trust-constr local solver.')
+        optimizer_cls = BasinHoppingOptimizer
+        optimizer_kwargs = {'stepsize': args.initial_stepsize,
+                            'num_chains': args.bh_chains,
+                           }
+    return optimizer_cls(cluster = cluster,
+                         print_output = args.disp,
+                         approx_deriv = args.approx_deriv,
+                         num_trials = args.global_iterations,
+                         constr_tol = args.constr_tol,
+                         early_stopping_count = args.earlystop,
+                         norm_constrained = args.norm_constraint,
+                         hessian_free = True if args.hessian_free else None,
+                         n_jobs = args.n_jobs,
+                         continuation = args.continuation != 'none',
+                         continuation_max_step = args.continuation_max_step,
+                         basin_radius = args.basin_radius,
+                         basin_precheck_iter = args.basin_precheck,
+                         start_sampler = args.start_sampler,
+                         _seed = int(args.seed),
+                         options = options,
+                         **optimizer_kwargs,
+                         )
+
+def fit_sro_correction(cluster: Cluster,
+                       args: Namespace,
+                       data: str | pd.DataFrame,
+                      ):
+    """
+    Fits the SRO correction to the sweep results and writes it to <structure>/func
+    """
+    # matplotlib and sympy are only needed from here on
+    from toolkit.fitting.SROCorrectionModel import SROCorrectionModel
+    from toolkit.functions.sro_model import sro_model
+
+    num_str_atoms = cluster.num_str_atoms(structure = cluster.input_structure)
+    sro_correction_model = SROCorrectionModel(func=sro_model,
+                                              num_str_atoms = num_str_atoms,
+                                              in_Joules = args.inJoules,
+                                              print_output = args.disp
+                                             )
+    sro_correction_model.data = data
+    _ = sro_correction_model.fit()
+    sro_correction_model.plot_fit(structure = cluster.structure)
+    if args.disp:
+        if args.inJoules:
+            print('SRO Correction function (in J/mol):')
+        else:
+            print('SRO Correction function (in eV/atom):')
+        print(sro_correction_model.sro_function)
+    with open(f'{cluster.structure}/func','w',encoding='utf-8') as correction_func:
+        correction_func.write(sro_correction_model.sro_function)
+    return sro_correction_model
+
+def run_structure(structure: str,
+                  args: Namespace,
+                  out_fname: str,
+                 ) -> pd.DataFrame:
+    """
+    Full pipeline of one structure directory: cvmclus, ordered state, temperature sweep and SRO fit
+    Input:
+        structure - structure directory, its parent is the phase directory holding the maximal clusters
+        args - options as parsed by SRO_argument_parser
+        out_fname - results file name, written to the structure directory
+    Output:
+        Results of the temperature sweep (empty if only the ordered state is fitted)
+    """
+
+    cluster = make_cluster(structure, args)
+    _ = fit_ordered_state(cluster, args)
+    if args.fit_ordered_only:
+        print('Flag to fit ordered state only found. Exiting.')
+        return pd.DataFrame()
+
+    opt_sro = make_sro_optimizer(cluster, args)
+    print(cluster)
+    results = SROResults(phase = cluster.phase,
+                         structure = cluster.structure,
+                         norm_constrained = args.norm_constraint,
+                        )
+    temperatures = custom_linspace(start=args.Tmin, stop=args.Tmax, step=args.Tstep)
+    try:
+        results = temperature_sweep(opt_sro, temperatures, results, out_fname,
+                                    descending = args.continuation == 'descending',
+                                    max_workers = args.sweep_workers,
+                                    chunk_size = args.sweep_chunk,
+                                    blas_threads = args.blas_threads,
+                                   )
+    finally:
+        opt_sro.close()
+    _ = fit_sro_correction(cluster, args, results.result)
+    return results.result
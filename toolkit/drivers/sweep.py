@@ -0,0 +1,182 @@
+"""
+Temperature sweeps of the CVM optimizer, in sequence or in chunks of temperatures on a process pool
+"""
+
+from __future__ import annotations
+from collections.abc import Generator
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import math
+import multiprocessing
+
+import numpy as np
+
+from toolkit.io.SROResults import SROResults
+from toolkit.optimizers.CVMOptimizer import CVMOptimizer
+from toolkit.drivers.workers import blas_thread_env, limit_blas_threads
+
+_SWEEP_OPTIMIZER = None
+
+def _init_sweep_worker(optimizer_cls: type,
+                       kwargs: dict,
+                       blas_threads: int,
+                      ) -> None:
+    limit_blas_threads(blas_threads)
+    global _SWEEP_OPTIMIZER
+    _SWEEP_OPTIMIZER = optimizer_cls(**kwargs)
+
+def _solve_chunk(temperatures: np.ndarray) -> (list[tuple], int):
+    """
+    Minimises at every temperature of the chunk in order, continuing within the chunk
+    only. Returns the fits and the number of local solves.
+    """
+    _SWEEP_OPTIMIZER.reset_continuation()
+    local_solves = _SWEEP_OPTIMIZER.local_solves
+    fits = []
+    for T in temperatures:
+        _SWEEP_OPTIMIZER.temperature = T
+        fits.append(_SWEEP_OPTIMIZER.fit())
+    return fits, _SWEEP_OPTIMIZER.local_solves - local_solves
+
+def sweep_chunks(temperatures: np.ndarray,
+                 max_workers: int,
+                 chunk_size: int = None,
+                 continuation: bool = False,
+                ) -> list[np.ndarray]:
+    """
+    Splits the ordered temperatures into contiguous chunks. By default there is one chunk per
+    worker with continuation (every chunk starts with a full multi-start), otherwise four per
+    worker to balance the load.
+    """
+    if chunk_size is None:
+        num_chunks = max_workers if continuation else 4 * max_workers
+    else:
+        num_chunks = math.ceil(len(temperatures) / chunk_size)
+    return np.array_split(temperatures, min(max(num_chunks, 1), len(temperatures)))
+
+def _chunked_fits(opt_sro: CVMOptimizer,
+                  temperatures: np.ndarray,
+                  max_workers: int,
+                  chunk_size: int = None,
+                  blas_threads: int = 1,
+                 ) -> Generator[tuple[float, tuple], None, None]:
+    """
+    (temperature, fit) in the order of temperatures. The chunks are solved on a process pool
+    and handed over as soon as all chunks before them are done.
+    """
+    chunks = sweep_chunks(temperatures, max_workers, chunk_size, opt_sro.continuation)
+    # workers are spawned (not forked) so that the BLAS runtimes read the thread limits on import
+    with blas_thread_env(blas_threads), ProcessPoolExecutor(max_workers=max_workers,
+                                                            mp_context=multiprocessing.get_context('spawn'),
+                                                            initializer=_init_sweep_worker,
+                                                            initargs=(type(opt_sro), opt_sro._worker_kwargs(), blas_threads),
+                                                           ) as executor:
+        futures = {executor.submit(_solve_chunk, chunk): idx for idx, chunk in enumerate(chunks)}
+        try:
+            done = {}
+            next_chunk = 0
+            for future in as_completed(futures):
+                done[futures[future]] = future.result()
+                while next_chunk in done:
+                    fits, local_solves = done.pop(next_chunk)
+                    opt_sro.local_solves += local_solves
+                    yield from zip(chunks[next_chunk], fits)
+                    next_chunk += 1
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+def _sequential_fits(opt_sro: CVMOptimizer,
+                     temperatures: np.ndarray,
+                    ) -> Generator[tuple[float, tuple], None, None]:
+    opt_sro.reset_continuation()
+    for T in temperatures:
+        opt_sro.temperature = T
+        yield T, opt_sro.fit()
+
+def temperature_sweep(opt_sro: CVMOptimizer,
+                      temperatures: np.ndarray,
+                      results: SROResults,
+                      out_fname: str,
+                      descending: bool = False,
+                      max_workers: int = 1,
+                      chunk_size: int = None,
+                      blas_threads: int = 1,
+                     ) -> SROResults:
+    """
+    Minimises the CVM free energy at every temperature, each result is appended to
+    <structure>/<out_fname> as soon as it is available.
+    Input:
+        opt_sro - CVM optimizer, with continuation its warm starts follow the sweep direction
+        temperatures - temperature grid
+        results - receives the results, in the sweep order
+        out_fname - results file name, written to the structure directory
+        descending - visit the temperatures in decreasing order (the natural direction
+                     for continuation from the disordered state), increasing otherwise
+        max_workers - if > 1, the sweep is split in chunks of temperatures solved on a process pool
+        chunk_size - temperatures per chunk, see sweep_chunks for the default
+        blas_threads - BLAS/OpenMP threads of each worker
+    Output:
+        results
+    """
+
+    sqs_correlations = opt_sro.cluster.sqs_correlations
+    # F of the ordered, disordered and SQS states over the whole grid in one evaluation
+    reference_energies = opt_sro.get_energy(np.vstack((opt_sro.cluster.ordered_correlations,
+                                                       opt_sro.cluster.disordered_correlations,
+                                                       sqs_correlations,
+                                                      )),
+                                            temperature=temperatures,
+                                           )
+    order = np.argsort(temperatures)
+    if descending:
+        order = order[::-1]
+    reference_energies = dict(zip(temperatures[order], reference_energies[order]))
+    if max_workers > 1:
+        fits = _chunked_fits(opt_sro, temperatures[order], max_workers, chunk_size, blas_threads)
+    else:
+        fits = _sequential_fits(opt_sro, temperatures[order])
+
+    local_solves = opt_sro.local_solves
+    results.result = []
+    for T, (opt_F, opt_correlations, opt_grad, opt_constr_viol) in fits:
+
+        F_ordered, F_disordered, F_sqs = reference_energies[T]
+        print('=' * 50)
+        print(f'Optimising at temperature {T}K')
+
+        print(f'Ordered Correlations @ T = {T}K:')
+        print(f'{opt_sro.cluster.ordered_correlations}')
+        print(f'Ordered CVM Free Energy (eV/atom) @ T = {T}K: {F_ordered/opt_sro.cluster.num_lat_atoms}')
+
+        print(f'Disordered Correlations @ T = {T}K:')
+        print(f'{opt_sro.cluster.disordered_correlations}')
+        print(f'Disordered CVM Free Energy (eV/atom) @ T = {T}K: {F_disordered/opt_sro.cluster.num_lat_atoms}')
+
+        print(f'SQS Correlations @ T = {T}K:')
+        print(f'{sqs_correlations}')
+        print(f'SQS CVM Free Energy (eV/atom) @ T = {T}K: {F_sqs/opt_sro.cluster.num_lat_atoms}')
+
+        print(f'Optimised CVM Free energy (eV/atom) @ T = {T}K\t: {opt_F/opt_sro.cluster.num_lat_atoms}')
+        print(f'Optimised Correlations @ T = {T}K\t: {opt_correlations}')
+        print(f'Constraint Violation: {opt_constr_viol}')
+        print(f'Optimised Free energy Gradient: {np.array2string(opt_grad)}')
+        print('Optimised Cluster Configuration Probabilities:')
+        opt_sro.cluster.print_config_probabilities(opt_correlations)
+        print('=' * 50)
+
+        results.append([{'phase'        : opt_sro.cluster.phase.rsplit('/',maxsplit=1)[-1],
+                         'structure'    : opt_sro.cluster.structure.split('/')[-1],
+                         'temperature'  : T,
+                         'F_sqs'        : F_sqs,
+                         'F_ord'        : F_ordered,
+                         'F_rnd'        : F_disordered,
+                         'F_opt'        : opt_F,
+                         'constr_tol'   : opt_constr_viol,
+                         'correlations' : opt_correlations,
+                        }],
+                       f'{opt_sro.cluster.structure}/{out_fname}',
+                      )
+
+    print(f'Local solves in the temperature sweep: {opt_sro.local_solves - local_solves}')
+    return results
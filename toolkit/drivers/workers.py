@@ -0,0 +1,47 @@
+"""
+BLAS/OpenMP thread limits of the spawned worker processes of the drivers
+"""
+
+from __future__ import annotations
+from contextlib import contextmanager
+import os
+
+# thread pool sizes read by the BLAS/OpenMP runtimes when they are loaded
+BLAS_THREAD_ENV_VARS = ('OMP_NUM_THREADS',
+                        'OPENBLAS_NUM_THREADS',
+                        'MKL_NUM_THREADS',
+                        'BLIS_NUM_THREADS',
+                        'VECLIB_MAXIMUM_THREADS',
+                        'NUMEXPR_NUM_THREADS',
+                       )
+
+_THREADPOOL_LIMITS = None
+
+@contextmanager
+def blas_thread_env(blas_threads: int):
+    """
+    Sets the BLAS/OpenMP thread limits in the environment inherited by the workers
+    spawned inside the block, the previous values are restored on exit
+    """
+    environ = {var: os.environ.get(var) for var in BLAS_THREAD_ENV_VARS}
+    os.environ.update({var: str(blas_threads) for var in BLAS_THREAD_ENV_VARS})
+    try:
+        yield
+    finally:
+        for var, value in environ.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+def limit_blas_threads(blas_threads: int) -> None:
+    """
+    Worker initializer. The environment variables are already set when the worker
+    starts; threadpoolctl (if installed) also caps runtimes that were loaded before.
+    """
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+    global _THREADPOOL_LIMITS
+    _THREADPOOL_LIMITS = threadpool_limits(limits=blas_threads)
@@ -152,6 +152,7 @@ class SROCorrectionModel:
 
     def plot_fit(self: SROCorrectionModel,
                  image_name: str = 'cvmfit.svg',
+                 structure: str = None,
                  **matplotlib_kwargs,
                 ) -> None:
 
@@ -164,7 +165,8 @@ class SROCorrectionModel:
             plt.rc('font', family='serif',weight='bold',)
             plt.rc('xtick', labelsize='large')
             plt.rc('ytick', labelsize='large')
-        structure = os.getcwd()
+        if structure is None:
+            structure = os.getcwd()
 
         self.xcont = np.linspace(min(self.xdata), max(self.xdata), 1000)[:, np.newaxis]
 
@@ -0,0 +1,118 @@
+"""
+Fused free energy evaluator sharing rho = V.x between F, its Jacobian and Hessian
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+import sys
+import numpy as np
+
+from toolkit.functions.energyfunctions import _kB, weighted_gram
+
+@dataclass(kw_only=True, order=False, eq=False)
+class FreeEnergyEvaluator:
+    """
+    Stateful evaluator of F = H + kB*T*SUM(rho * log(rho)) and its derivatives
+    Input:
+        mults_eci - Multiplicities of clusters times ECI's
+        multconfig_kb - Multiplicities of configurations times Kikuchi-Barker coefficients
+        all_vmat - Stacked V-Matrix (dense or scipy.sparse)
+        temperature - Temperature
+        rho_offset, energy_offset - constant parts of V.x and of the energy, left by the
+                                    fixed correlations removed by FixedCorrelationPresolve
+    The configuration probabilities rho, log(rho) and the entropy terms are cached for the
+    last evaluated correlations. trust-constr requests the value, gradient and Hessian at the
+    same point in every iteration, so only the first of these requests pays for the matvec.
+    """
+
+    mults_eci: np.ndarray
+    multconfig_kb: np.ndarray
+    all_vmat: np.ndarray
+    temperature: float = 100
+    rho_offset: np.ndarray | float = 0.0
+    energy_offset: float = 0.0
+
+    hits: int = field(init=False, default=0)
+    misses: int = field(init=False, default=0)
+
+    _corrs: np.ndarray = field(init=False, default=None, repr=False)
+    _rho: np.ndarray = field(init=False, default=None, repr=False)
+    _log_rho: np.ndarray = field(init=False, default=None, repr=False)
+    _S: float = field(init=False, default=None, repr=False)
+    _dS: np.ndarray = field(init=False, default=None, repr=False)
+    _d2S: np.ndarray = field(init=False, default=None, repr=False)
+
+    def _update(self: FreeEnergyEvaluator,
+                corrs: np.ndarray,
+               ) -> None:
+
+        if self._corrs is not None and np.array_equal(corrs, self._corrs):
+            self.hits += 1
+            return
+
+        self.misses += 1
+        self._corrs = np.array(corrs, dtype=np.float64)
+        self._rho = self.all_vmat @ self._corrs + self.rho_offset
+        rho_ = self._rho + sys.float_info.epsilon
+        self._log_rho = np.log(np.abs(rho_))
+        self._S = self.multconfig_kb @ (rho_ * self._log_rho)
+        # derivative pieces are filled in on demand
+        self._dS = None
+        self._d2S = None
+
+    def F(self: FreeEnergyEvaluator,
+          corrs: np.ndarray,
+          *args,
+         ) -> float:
+        """
+        Free energy at corrs, extra positional arguments are ignored
+        """
+        self._update(corrs)
+        return self.mults_eci @ self._corrs + self.energy_offset + _kB*self.temperature*self._S
+
+    def F_jacobian(self: FreeEnergyEvaluator,
+                   corrs: np.ndarray,
+                   *args,
+                  ) -> np.ndarray:
+        """
+        Gradient of the free energy at corrs, [dF/dcorr0, dF/dcorr1, ...]
+        """
+        self._update(corrs)
+        if self._dS is None:
+            self._dS = self.all_vmat.T @ (self.multconfig_kb * (1 + self._log_rho))
+        return self.mults_eci + _kB*self.temperature*self._dS
+
+    def F_hessian(self: FreeEnergyEvaluator,
+                  corrs: np.ndarray,
+                  *args,
+                 ) -> np.ndarray:
+        """
+        Hessian of the free energy at corrs
+        """
+        self._update(corrs)
+        if self._d2S is None:
+            self._d2S = weighted_gram(self.all_vmat, self.multconfig_kb / self._rho)
+        return _kB*self.temperature*self._d2S
+
+    def F_hessp(self: FreeEnergyEvaluator,
+                corrs: np.ndarray,
+                p: np.ndarray,
+                *args,
+               ) -> np.ndarray:
+        """
+        Product of the Hessian at corrs with p, without forming the Hessian
+        """
+        self._update(corrs)
+        return _kB*self.temperature*(self.all_vmat.T @ (self.multconfig_kb / self._rho * (self.all_vmat @ p)))
+
+    @property
+    def cache_stats(self: FreeEnergyEvaluator) -> dict:
+        calls = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / calls if calls else 0.0,
+               }
+
+    def reset_stats(self: FreeEnergyEvaluator) -> None:
+        self.hits = 0
+        self.misses = 0
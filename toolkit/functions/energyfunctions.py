@@ -1,63 +1,77 @@
 from typing import Callable
 import numpy as np
+from scipy import sparse
 import math
 import sys
 
 _kB = 8.617330337217213e-05
+
+def rhologrho(rho: np.ndarray) -> np.ndarray:
+    """
+    Elementwise rho * log(|rho|)
+    """
+    return rho * np.log(np.abs(rho))
+
 def F(corrs: np.ndarray,
       mults_eci: np.ndarray,
       multconfig_kb: np.ndarray,
       all_vmat: np.ndarray,
       vect_rhologrho: Callable[[np.ndarray], np.ndarray],
-      temp: float
-     ) -> float:
+      temp: float | np.ndarray
+     ) -> float | np.ndarray:
     """
     Input:
-        corrs - Correlations
+        corrs - Correlations, either one vector or a 2-D stack with one vector per row
         vmat  - V-Matrix
         clusters - Maximal Cluster Information (multiplicity, longest neighbor length, no. of points)
         configs - Not used
         clustermult - Multiplicities of clusters
         configmult - Multiplicities of configurations
-        T - Temperature
+        T - Temperature, either a scalar or an array of temperatures
         eci - ECI's
 
     Output:
         F = H + kB*T*SUM(rho * log(rho))
+        with shape temp.shape + corrs.shape[:-1], i.e. one row per temperature
+        and one column per correlation vector
         """
 
-    H = mults_eci @ corrs
-    S = multconfig_kb @ vect_rhologrho((all_vmat @ corrs) + sys.float_info.epsilon)
+    corrs = np.asarray(corrs)
+    H = corrs @ mults_eci
+    S = vect_rhologrho((all_vmat @ corrs.T).T + sys.float_info.epsilon) @ multconfig_kb
 
-    return H + _kB*temp*S
+    return H + _kB*np.multiply.outer(temp, S)
 
 def F_jacobian(corrs: np.ndarray,
                mults_eci: np.ndarray,
                multconfig_kb: np.ndarray,
                all_vmat: np.ndarray,
                vect_rhologrho: Callable[[np.ndarray], np.ndarray],
-               temp: float
+               temp: float | np.ndarray
               ) -> np.ndarray:
     """
     Input: 
-        corrs - Correlations
+        corrs - Correlations, either one vector or a 2-D stack with one vector per row
         vmat  - V-Matrix
         clusters - Maximal Cluster Information (multiplicity, longest neighbor length, no. of points)
         configs - Not used
         clustermult - Multiplicities of clusters
         configmult - Multiplicities of configurations
-        T - Temperature
+        T - Temperature, either a scalar or an array of temperatures
         eci - ECI's
 
     Output:
         Vector representation gradient of F with Corrs
         [dF/dcorr0, dF/dcorr1, ...]
+        with shape temp.shape + corrs.shape
     """
 
+    corrs = np.asarray(corrs)
     dH = mults_eci
-    dS = all_vmat.T @ (multconfig_kb * (1 + np.log(np.abs((all_vmat @ corrs) + sys.float_info.epsilon))))
+    log_rho = np.log(np.abs((all_vmat @ corrs.T).T + sys.float_info.epsilon))
+    dS = (all_vmat.T @ (multconfig_kb * (1 + log_rho)).T).T
 
-    return dH + _kB*temp*dS
+    return dH + _kB*np.multiply.outer(temp, dS)
 
 def F_hessian(corrs: np.ndarray,
                mults_eci: np.ndarray,
@@ -88,6 +102,38 @@ def F_hessian(corrs: np.ndarray,
         ]
     """
 
-    d2S = (np.diag(multconfig_kb / (all_vmat @ corrs)).T @ all_vmat).T @ all_vmat
+    d2S = weighted_gram(all_vmat, multconfig_kb / (all_vmat @ corrs))
 
     return _kB*temp*d2S
+
+def F_hessp(corrs: np.ndarray,
+            p: np.ndarray,
+            mults_eci: np.ndarray,
+            multconfig_kb: np.ndarray,
+            all_vmat: np.ndarray,
+            vect_rhologrho: Callable[[np.ndarray], np.ndarray],
+            temp: float
+           ) -> np.ndarray:
+    """
+    Input:
+        corrs - Correlations
+        p - Arbitrary vector in correlation space
+        Rest as in F_hessian
+
+    Output:
+        Product of the Hessian of F with p, computed as kB*T*V^T.(w/rho * V.p)
+        without building the Hessian
+    """
+
+    return _kB*temp*(all_vmat.T @ ((multconfig_kb / (all_vmat @ corrs)) * (all_vmat @ p)))
+
+def weighted_gram(all_vmat: np.ndarray,
+                  weights: np.ndarray,
+                 ) -> np.ndarray:
+    """
+    Dense V^T.diag(weights).V, scaling the rows of V instead of building diag(weights)
+    """
+
+    if sparse.issparse(all_vmat):
+        return (all_vmat.T @ all_vmat.multiply(weights[:, np.newaxis])).toarray()
+    return all_vmat.T @ (weights[:, np.newaxis] * all_vmat)
@@ -0,0 +1,193 @@
+"""
+Binary snapshots of parsed ATAT cluster files
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+import hashlib
+import json
+import os
+import numpy as np
+
+from toolkit.io.atatio import read_clusters, read_kbcoeffs, read_configmult, read_clustermult, read_eci, read_configs, read_vmatrix
+
+SNAPSHOT_VERSION = 2
+SNAPSHOT_DIRNAME = '.cvm_snapshot'
+
+def _pack_scalars(parsed: dict) -> dict:
+    return {'keys': np.array(list(parsed.keys()), dtype=int),
+            'values': np.array(list(parsed.values()), dtype=float),
+           }
+
+def _unpack_scalars(arrays: dict) -> dict:
+    return dict(zip(arrays['keys'].tolist(), arrays['values'].tolist()))
+
+def _pack_clusters(parsed: dict) -> dict:
+    clusters = list(parsed.values())
+    return {'keys': np.array(list(parsed.keys()), dtype=int),
+            'mult': np.array([cluster['mult'] for cluster in clusters], dtype=int),
+            'length': np.array([cluster['length'] for cluster in clusters], dtype=float),
+            'type': np.array([cluster['type'] for cluster in clusters], dtype=int),
+            'points': np.concatenate([cluster['points'] for cluster in clusters]).reshape(-1, 3),
+            'functions': np.concatenate([cluster['functions'] for cluster in clusters]).reshape(-1, 2).astype(int),
+            'num_functions': np.array([len(cluster['functions']) for cluster in clusters], dtype=int),
+           }
+
+def _unpack_clusters(arrays: dict) -> dict:
+    point_offsets = np.concatenate(([0], np.cumsum(arrays['type'])))
+    function_offsets = np.concatenate(([0], np.cumsum(arrays['num_functions'])))
+    return {key: {'mult': int(arrays['mult'][idx]),
+                  'length': float(arrays['length'][idx]),
+                  'type': int(arrays['type'][idx]),
+                  'points': arrays['points'][point_offsets[idx]:point_offsets[idx+1]],
+                  'functions': arrays['functions'][function_offsets[idx]:function_offsets[idx+1]],
+                 }
+            for idx, key in enumerate(arrays['keys'].tolist())}
+
+def _array_format(*names: str):
+    """
+    Pack/unpack pair for readers returning a tuple of arrays (or a single array)
+    """
+    if len(names) == 1:
+        return lambda parsed: {names[0]: parsed}, lambda arrays: arrays[names[0]]
+    return lambda parsed: dict(zip(names, parsed)), lambda arrays: tuple(arrays[name] for name in names)
+
+_FORMATS = {'clusters': (read_clusters, _pack_clusters, _unpack_clusters),
+            'kb': (read_kbcoeffs, *_array_format('values')),
+            'clustermult': (read_clustermult, _pack_scalars, _unpack_scalars),
+            'configmult': (read_configmult, *_array_format('values', 'counts')),
+            'configs': (read_configs, *_array_format('num_of_subclus', 'inter_rows', 'inter')),
+            'vmat': (read_vmatrix, *_array_format('values', 'rows')),
+            'eci': (read_eci, _pack_scalars, _unpack_scalars),
+           }
+
+@dataclass(kw_only=True, order=False, eq=False)
+class ClusterSnapshot:
+    """
+    Parsed clusters.out, configkb.out, clusmult.out, configmult.out, config.out, vmat.out and eci.out
+    stored as memory-mappable .npy arrays in <directory>/.cvm_snapshot. A manifest records the
+    snapshot version and the mtime, size and sha256 of each source file. An entry is reused when
+    the mtime and size are unchanged, or when the contents still hash to the same value.
+    """
+
+    directory: str
+    enabled: bool = True
+
+    _manifest: dict = field(init=False, repr=False)
+
+    def __post_init__(self: ClusterSnapshot) -> None:
+        self._manifest = {'version': SNAPSHOT_VERSION, 'files': {}}
+        if not self.enabled:
+            return
+        try:
+            with open(self._manifest_fname, 'r', encoding='utf-8') as fmanifest:
+                self._manifest = json.load(fmanifest)
+        except (OSError, ValueError):
+            self._manifest = {}
+        if self._manifest.get('version') != SNAPSHOT_VERSION:
+            # written by another version, the arrays are rebuilt from the sources
+            self._manifest = {'version': SNAPSHOT_VERSION, 'files': {}}
+            try:
+                for fname in os.listdir(self.snapshot_dir):
+                    if fname.endswith('.npy'):
+                        os.remove(os.path.join(self.snapshot_dir, fname))
+            except OSError:
+                pass
+
+    @property
+    def snapshot_dir(self: ClusterSnapshot) -> str:
+        return os.path.join(self.directory, SNAPSHOT_DIRNAME)
+
+    @property
+    def _manifest_fname(self: ClusterSnapshot) -> str:
+        return os.path.join(self.snapshot_dir, 'manifest.json')
+
+    @staticmethod
+    def _sha256(fname: str) -> str:
+        with open(fname, 'rb') as fsource:
+            return hashlib.sha256(fsource.read()).hexdigest()
+
+    def _is_valid(self: ClusterSnapshot,
+                  fname: str,
+                  kind: str,
+                 ) -> bool:
+        entry = self._manifest['files'].get(os.path.basename(fname))
+        if entry is None or entry['kind'] != kind:
+            return False
+        stat = os.stat(fname)
+        if entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            return True
+        # touched but possibly unchanged
+        if entry['size'] == stat.st_size and entry['sha256'] == self._sha256(fname):
+            entry['mtime_ns'] = stat.st_mtime_ns
+            self._write_manifest()
+            return True
+        return False
+
+    def _array_fname(self: ClusterSnapshot,
+                     fname: str,
+                     name: str,
+                    ) -> str:
+        return os.path.join(self.snapshot_dir, f'{os.path.basename(fname)}.{name}.npy')
+
+    def _load_arrays(self: ClusterSnapshot,
+                     fname: str,
+                    ) -> dict:
+        arrays = {}
+        for name in self._manifest['files'][os.path.basename(fname)]['arrays']:
+            try:
+                arrays[name] = np.load(self._array_fname(fname, name), mmap_mode='r')
+            except ValueError:
+                # empty arrays can not be memory mapped
+                arrays[name] = np.load(self._array_fname(fname, name))
+        return arrays
+
+    def _write_manifest(self: ClusterSnapshot) -> None:
+        tmp_fname = f'{self._manifest_fname}.{os.getpid()}.tmp'
+        with open(tmp_fname, 'w', encoding='utf-8') as fmanifest:
+            json.dump(self._manifest, fmanifest, indent=1)
+        os.replace(tmp_fname, self._manifest_fname)
+
+    def _save(self: ClusterSnapshot,
+              fname: str,
+              kind: str,
+              arrays: dict,
+             ) -> None:
+        stat = os.stat(fname)
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        for name, array in arrays.items():
+            tmp_fname = f'{self._array_fname(fname, name)}.{os.getpid()}.tmp.npy'
+            np.save(tmp_fname, array)
+            os.replace(tmp_fname, self._array_fname(fname, name))
+        self._manifest['files'][os.path.basename(fname)] = {'kind': kind,
+                                                            'mtime_ns': stat.st_mtime_ns,
+                                                            'size': stat.st_size,
+                                                            'sha256': self._sha256(fname),
+                                                            'arrays': list(arrays.keys()),
+                                                           }
+        self._write_manifest()
+
+    def load(self: ClusterSnapshot,
+             fname: str,
+             kind: str,
+            ):
+        """
+        Parsed contents of fname (one of the kinds in _FORMATS), from the snapshot when it is
+        up to date, otherwise parsed with the atatio reader and added to the snapshot
+        """
+        reader, pack, unpack = _FORMATS[kind]
+        if not self.enabled or not os.path.isfile(fname):
+            return reader(fname)
+        if self._is_valid(fname, kind):
+            return unpack(self._load_arrays(fname))
+
+        parsed = reader(fname)
+        if parsed is None:
+            return parsed
+        arrays = pack(parsed)
+        try:
+            self._save(fname, kind, arrays)
+        except OSError as oserr:
+            print(f'WARNING: could not write snapshot of {os.path.basename(fname)} to {self.snapshot_dir}: {oserr}')
+            return parsed
+        return unpack(self._load_arrays(fname))
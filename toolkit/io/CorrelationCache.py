@@ -0,0 +1,245 @@
+"""
+Content-addressed cache for correlations computed by corrdump (and other arrays, by namespace)
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+from datetime import datetime
+import atexit
+import hashlib
+import json
+import os
+import platform
+import numpy as np
+
+from toolkit.io.atatio import run_corrdump
+
+CACHE_DIR_ENV = 'CVM_TOOLKIT_CACHE'
+STATS_PREFIX = 'stats'
+# correlations: corrdump output, ordered_states: ordered state LP solutions (OrderedStateOptimizer)
+CACHE_NAMESPACES = ('correlations', 'ordered_states')
+
+def default_cache_dir(namespace: str = 'correlations') -> str:
+    """
+    Cache location: $CVM_TOOLKIT_CACHE/<namespace>, else $XDG_CACHE_HOME/cvm_toolkit/<namespace>
+    """
+    if namespace not in CACHE_NAMESPACES:
+        raise ValueError(f"namespace should be one of {', '.join(CACHE_NAMESPACES)}, not {namespace}")
+    if os.environ.get(CACHE_DIR_ENV):
+        return os.path.join(os.environ[CACHE_DIR_ENV], namespace)
+    cache_home = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache_home, 'cvm_toolkit', namespace)
+
+@dataclass(kw_only=True, order=False, eq=False)
+class CorrelationCache:
+    """
+    Correlations keyed on the sha256 of clusters.out, lat.in and the structure file contents
+    (plus the corrdump flags), kept in memory and as .npy files in cache_dir. Each distinct
+    structure is therefore passed through corrdump once per installation.
+    The same store keeps other arrays under their own namespace (and directory), see CACHE_NAMESPACES.
+    Every process keeps its hit/miss counts in its own stats file, so concurrent flushes never lose counts.
+    A pickled copy (e.g. the cache of a Cluster sent to a worker process) starts counting from zero
+    and flushes its own counts when the worker exits.
+    """
+
+    namespace: str = 'correlations'
+    cache_dir: str = None
+    hits: int = field(init=False, default=0)
+    misses: int = field(init=False, default=0)
+
+    _memory: dict = field(init=False, default_factory=dict, repr=False)
+    _file_hashes: dict = field(init=False, default_factory=dict, repr=False)
+
+    def __post_init__(self: CorrelationCache) -> None:
+        if self.cache_dir is None:
+            self.cache_dir = default_cache_dir(self.namespace)
+        atexit.register(self.flush_stats)
+
+    def __getstate__(self: CorrelationCache) -> dict:
+        # the counts so far are flushed by this process only
+        return {**self.__dict__, 'hits': 0, 'misses': 0}
+
+    def __setstate__(self: CorrelationCache,
+                     state: dict,
+                    ) -> None:
+        self.__dict__.update(state)
+        # __post_init__ is not run on unpickling
+        atexit.register(self.flush_stats)
+
+    @property
+    def _stats_fname(self: CorrelationCache) -> str:
+        return f'{STATS_PREFIX}.{platform.node()}.{os.getpid()}.json'
+
+    def _stats_fnames(self: CorrelationCache) -> list[str]:
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return [fname for fname in os.listdir(self.cache_dir) if fname.startswith(STATS_PREFIX) and fname.endswith('.json')]
+
+    @staticmethod
+    def _read_stats(stats_fname: str) -> dict:
+        stats_ = {'hits': 0, 'misses': 0}
+        try:
+            with open(stats_fname, 'r', encoding='utf-8') as fstats:
+                stats_.update(json.load(fstats))
+        except (OSError, ValueError):
+            pass
+        return stats_
+
+    def file_hash(self: CorrelationCache,
+                  fname: str,
+                 ) -> str:
+        """
+        sha256 of a file, memoized on (path, mtime, size)
+        """
+        stat = os.stat(fname)
+        memo_key = (os.path.abspath(fname), stat.st_mtime_ns, stat.st_size)
+        if memo_key not in self._file_hashes:
+            with open(fname, 'rb') as fhash:
+                self._file_hashes[memo_key] = hashlib.sha256(fhash.read()).hexdigest()
+        return self._file_hashes[memo_key]
+
+    def key(self: CorrelationCache,
+            clusters_fname: str,
+            lattice_fname: str,
+            structure_fname: str,
+            flags: tuple = (),
+            structure_content: str = None,
+           ) -> str:
+        if structure_content is None:
+            structure_hash = self.file_hash(structure_fname)
+        else:
+            structure_hash = hashlib.sha256(structure_content.encode('utf-8')).hexdigest()
+        key_ = '\n'.join([self.file_hash(clusters_fname),
+                          self.file_hash(lattice_fname),
+                          structure_hash,
+                          *sorted(flags),
+                         ])
+        return hashlib.sha256(key_.encode('utf-8')).hexdigest()
+
+    def get(self: CorrelationCache,
+            key: str,
+           ) -> np.ndarray:
+        if key in self._memory:
+            return self._memory[key].copy()
+        try:
+            corrs = np.load(os.path.join(self.cache_dir, f'{key}.npy'))
+        except (OSError, ValueError):
+            return None
+        self._memory[key] = corrs
+        return corrs.copy()
+
+    def lookup(self: CorrelationCache,
+               key: str,
+              ) -> np.ndarray:
+        """
+        get counting a hit or a miss
+        """
+        corrs = self.get(key)
+        if corrs is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return corrs
+
+    def put(self: CorrelationCache,
+            key: str,
+            corrs: np.ndarray,
+            metadata: dict = None,
+           ) -> None:
+        self._memory[key] = corrs.copy()
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # write to a temporary name first so concurrent readers never see partial files
+            tmp_fname = os.path.join(self.cache_dir, f'{key}.{os.getpid()}.tmp.npy')
+            np.save(tmp_fname, corrs)
+            os.replace(tmp_fname, os.path.join(self.cache_dir, f'{key}.npy'))
+            with open(os.path.join(self.cache_dir, f'{key}.json'), 'w', encoding='utf-8') as fmeta:
+                json.dump({**(metadata or {}), 'created': datetime.now().isoformat()}, fmeta)
+        except OSError as oserr:
+            print(f'WARNING: could not write correlation cache entry to {self.cache_dir}: {oserr}')
+
+    def correlations(self: CorrelationCache,
+                     clusters_fname: str,
+                     lattice_fname: str,
+                     structure_fname: str,
+                     flags: tuple = (),
+                     structure_content: str = None,
+                    ) -> np.ndarray:
+        """
+        Correlations of a structure, running corrdump only on a cache miss.
+        If structure_content is given it is hashed instead of structure_fname,
+        and piped to corrdump only when it has to run.
+        """
+        key = self.key(clusters_fname, lattice_fname, structure_fname, flags, structure_content)
+        corrs = self.lookup(key)
+        if corrs is not None:
+            return corrs
+
+        corrs = run_corrdump(clusters_fname, structure_fname, lattice_fname, *flags, structure_content=structure_content)
+        self.put(key, corrs, {'structure': os.path.abspath(structure_fname), 'flags': list(flags)})
+        return corrs.copy()
+
+    def stats(self: CorrelationCache) -> dict:
+        """
+        Hit/miss counts of this session added to the ones persisted in cache_dir by all processes
+        """
+        persisted = [self._read_stats(os.path.join(self.cache_dir, fname)) for fname in self._stats_fnames()]
+        hits = sum(stats_['hits'] for stats_ in persisted) + self.hits
+        misses = sum(stats_['misses'] for stats_ in persisted) + self.misses
+        entries = [fname for fname in os.listdir(self.cache_dir) if fname.endswith('.npy')] if os.path.isdir(self.cache_dir) else []
+        return {'hits': hits,
+                'misses': misses,
+                'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+                'entries': len(entries),
+                'size_bytes': sum(os.path.getsize(os.path.join(self.cache_dir, fname)) for fname in entries),
+               }
+
+    def flush_stats(self: CorrelationCache) -> None:
+        """
+        Add this session's hit/miss counts to the totals persisted for this process
+        """
+        if self.hits + self.misses == 0:
+            return
+        stats_fname = os.path.join(self.cache_dir, self._stats_fname)
+        stats_ = self._read_stats(stats_fname)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_fname = f'{stats_fname}.tmp'
+            with open(tmp_fname, 'w', encoding='utf-8') as fstats:
+                json.dump({'hits': stats_['hits'] + self.hits, 'misses': stats_['misses'] + self.misses}, fstats)
+            os.replace(tmp_fname, stats_fname)
+        except OSError:
+            return
+        self.hits = 0
+        self.misses = 0
+
+    def entries(self: CorrelationCache) -> list[dict]:
+        entries_ = []
+        if not os.path.isdir(self.cache_dir):
+            return entries_
+        for fname in sorted(os.listdir(self.cache_dir)):
+            if not fname.endswith('.json') or fname.startswith(STATS_PREFIX):
+                continue
+            with open(os.path.join(self.cache_dir, fname), 'r', encoding='utf-8') as fmeta:
+                entries_.append({'key': fname[:-len('.json')], **json.load(fmeta)})
+        return entries_
+
+    def clear(self: CorrelationCache) -> None:
+        self._memory.clear()
+        if not os.path.isdir(self.cache_dir):
+            return
+        for fname in os.listdir(self.cache_dir):
+            if fname.endswith(('.npy', '.json')):
+                os.remove(os.path.join(self.cache_dir, fname))
+        self.hits = 0
+        self.misses = 0
+
+_DEFAULT_CACHES = {}
+
+def default_correlation_cache(namespace: str = 'correlations') -> CorrelationCache:
+    """
+    Process wide cache instance of a namespace, shared by all Cluster (or OrderedStateOptimizer) objects
+    """
+    if namespace not in _DEFAULT_CACHES:
+        _DEFAULT_CACHES[namespace] = CorrelationCache(namespace=namespace)
+    return _DEFAULT_CACHES[namespace]
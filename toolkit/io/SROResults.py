@@ -1,5 +1,5 @@
 from __future__ import annotations
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Union
 import numpy as np
 import pandas as pd
@@ -10,11 +10,12 @@ class SROResults:
     phase: str
     structure: str
     norm_constrained: bool = False
-    _result: pd.DataFrame = pd.DataFrame(columns=['phase','structure','temperature',
-                                                  'F_sqs','F_opt','F_ord','F_rnd',
-                                                  'constr_tol','correlations'
-                                                 ]
-                                        )
+    _result: pd.DataFrame = field(default_factory=lambda: pd.DataFrame(columns=['phase','structure','temperature',
+                                                                                'F_sqs','F_opt','F_ord','F_rnd',
+                                                                                'constr_tol','correlations'
+                                                                               ]
+                                                                      )
+                                 )
 
     @property
     def result(self: SROResults) -> pd.DataFrame:
@@ -39,3 +40,21 @@ class SROResults:
 
     def save_to_file(self: SROResults, outfile) -> None:
         self._result.to_csv(outfile,index=False)
+
+    def append(self: SROResults,
+               records: list[dict],
+               outfile: str = None,
+              ) -> None:
+        """
+        Adds records to the results and, if outfile is given, appends them to it
+        instead of rewriting the whole file. Appending to empty results starts a new file.
+        """
+        rows = pd.DataFrame.from_dict(records, orient='columns')
+        new_file = self._result.empty
+        if new_file:
+            self._result = rows
+        else:
+            rows = rows[self._result.columns]
+            self._result = pd.concat([self._result, rows], ignore_index=True)
+        if outfile is not None:
+            rows.to_csv(outfile, mode='w' if new_file else 'a', header=new_file, index=False)
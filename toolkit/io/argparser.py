@@ -1,8 +1,10 @@
 import argparse
 
-def SRO_argument_parser():
+def SRO_argument_parser(batch: bool = False):
     """
     Argument Parse for SRO correction code
+    Input:
+        batch - also parse the options of the phase batch driver (sro_batch)
     """
 
     description = r"""
@@ -29,7 +31,7 @@ $$$$$$$$\                  $$\ $$\       $$\   $$\
 
 written by Sayan Samanta and Axel van de Walle @ Brown University, RI, USA
 """
-    parser = argparse.ArgumentParser(prog='sro_correction',
+    parser = argparse.ArgumentParser(prog='sro_batch' if batch else 'sro_correction',
                                      #description='CVM SRO Error Correction Code by Sayan Samanta and Axel van de Walle',
                                      description=description,
                                      epilog='The code uses scipy heavily for all numerical optimization. Thanks guys.',
@@ -100,6 +102,26 @@ written by Sayan Samanta and Axel van de Walle @ Brown University, RI, USA
                              default='lat.in',
                              help="contains the lattice description of the phase [default: %(default)s]"
                             )
+    clus_params.add_argument('--vmat_storage', '-vms',
+                             default='auto',
+                             choices=['auto', 'dense', 'sparse'],
+                             help="storage of the stacked V-Matrix, auto picks CSR for sparse matrices [default: %(default)s]"
+                            )
+    clus_params.add_argument('--analytic_random', '-ar',
+                             action='store_true',
+                             default=False,
+                             help="Flag to compute the disordered correlations in-process instead of with corrdump -rnd, checked against corrdump -rnd once per structure when corrdump is available [default: %(default)s]"
+                            )
+    clus_params.add_argument('--native_correlations', '-nat',
+                             action='store_true',
+                             default=False,
+                             help="Flag to compute structure correlations with the in-process correlation engine instead of corrdump, checked against corrdump once per lattice when corrdump is available [default: %(default)s]"
+                            )
+    clus_params.add_argument('--no_snapshot', '-nss',
+                             action='store_true',
+                             default=False,
+                             help="Flag to always re-parse the cluster files instead of loading the binary snapshot in .cvm_snapshot [default: %(default)s]"
+                            )
 
     sro_fit_params.add_argument('--Tmin','-Tl',
                                 default=100,
@@ -173,10 +195,11 @@ written by Sayan Samanta and Axel van de Walle @ Brown University, RI, USA
                            )
     opt_params.add_argument('--gtol','-g',
                             type=float,
-                            default=1e-8,
+                            default=1e-12,
                             help="The algorithm will terminate when both the infinity norm (i.e., max abs value)\
                             of the Lagrangian gradient and the constraint violation\
-                            are smaller than ``gtol`` [default: %(default)s]"
+                            are smaller than ``gtol``. The test is not tied to the barrier parameter, so a loose\
+                            gtol stops trust-constr away from the rho = 0 boundary [default: %(default)s]"
                            )
     opt_params.add_argument('--barrier_tol','-btol',
                             type=float,
@@ -204,13 +227,29 @@ written by Sayan Samanta and Axel van de Walle @ Brown University, RI, USA
                             help="Flag to find find_ordered state only and exit [default: %(default)s]"
                             )
     opt_params.add_argument('--method_linprog','-linm',
-                            default='highs',
-                            help="Method of linear programming for finding ordered correlations [default: %(default)s]",
+                            default='highs-ds',
+                            choices=['highs', 'highs-ds', 'highs-ipm'],
+                            help="HiGHS method of linear programming for finding ordered correlations: automatic, dual simplex or interior point [default: %(default)s]",
+                            )
+    opt_params.add_argument('--ordered_vertices','-ov',
+                            action='store_true',
+                            default=False,
+                            help="Flag to enumerate the optimal vertices of a degenerate ordered state [default: %(default)s]",
+                            )
+    opt_params.add_argument('--no_ordered_cache','-noc',
+                            action='store_true',
+                            default=False,
+                            help="Flag to solve the ordered state LP even if its result is cached [default: %(default)s]",
                             )
     opt_params.add_argument('--basinhopping','-bh',
                             action='store_true',
-                            default='False',
-                            help="Flag to switch on basinhopping [default: %(default)s]",
+                            default=False,
+                            help="Flag to replace the random search by parallel basin hopping chains [default: %(default)s]",
+                           )
+    opt_params.add_argument('--bh_chains','-bhc',
+                            default=4,
+                            type=int,
+                            help="Number of basin hopping chains, solved on --n_jobs processes [default: %(default)s]",
                            )
     opt_params.add_argument('--verbose', '-v', action='count', default=0,
                             help="Indicate the verbosity of the fit [default: %(default)s]",
@@ -220,16 +259,92 @@ written by Sayan Samanta and Axel van de Walle @ Brown University, RI, USA
                             default=False,
                             help="Flag to enable estimation of derivatives [default: %(default)s]",
                             )
+    opt_params.add_argument('--hessian_free','-hf',
+                            action='store_true',
+                            default=False,
+                            help="Flag to run trust-constr with Hessian-vector products only. Switched on automatically for large cluster counts [default: %(default)s]",
+                            )
+    opt_params.add_argument('--local_solver','-lsol',
+                            default='trust-constr',
+                            choices=['trust-constr', 'newton'],
+                            help="Local solver of every trial: scipy trust-constr or the damped Newton method on the free correlations [default: %(default)s]",
+                            )
+    opt_params.add_argument('--start_sampler','-ss',
+                            default='structure',
+                            choices=['structure', 'hit-and-run'],
+                            help="Starting points of the random search trials: reshuffled str.in structures or hit-and-run samples of the correlation polytope [default: %(default)s]",
+                            )
     opt_params.add_argument('--earlystop','-es',
                             default=20,
                             type=int,
                             help="Number of steps to break out of trials if no new minima has been found [default: %(default)s]",
                             )
+    opt_params.add_argument('--n_jobs','-nj',
+                            default=1,
+                            type=int,
+                            help="Number of processes solving the random search trials in parallel, the result does not depend on it (--basin_radius is ignored above 1) [default: %(default)s]",
+                            )
+    opt_params.add_argument('--continuation','-cont',
+                            default='none',
+                            choices=['none', 'descending', 'ascending'],
+                            help="Temperature continuation: warm start every temperature from the previous optima, sweeping in the given direction [default: %(default)s]",
+                            )
+    opt_params.add_argument('--continuation_max_step','-cms',
+                            default=0.1,
+                            type=float,
+                            help="Largest change of any correlation accepted from a warm started solve before falling back to the random search [default: %(default)s]",
+                            )
+    opt_params.add_argument('--basin_radius','-br',
+                            default=0.0,
+                            type=float,
+                            help="Neighbourhood (max norm of the correlations) of the minima already found at a temperature: a trial entering one stops early, 0 keeps every trial. Ignored with --n_jobs above 1 [default: %(default)s]",
+                            )
+    opt_params.add_argument('--basin_precheck','-bpc',
+                            default=5,
+                            type=int,
+                            help="Number of iterations after which a trial heading into a known basin is discarded (0: never), used with --basin_radius [default: %(default)s]",
+                            )
+    opt_params.add_argument('--sweep_workers','-sw',
+                            default=1,
+                            type=int,
+                            help="Number of processes solving chunks of the temperature grid in parallel, continuation acts within each chunk [default: %(default)s]",
+                            )
+    opt_params.add_argument('--sweep_chunk','-sc',
+                            default=None,
+                            type=int,
+                            help="Temperatures per chunk of the parallel sweep [default: one chunk per worker with continuation, four otherwise]",
+                            )
+    opt_params.add_argument('--blas_threads','-bt',
+                            default=1,
+                            type=int,
+                            help="BLAS/OpenMP threads per worker process of the parallel sweep (and of sro_batch) [default: %(default)s]",
+                            )
     opt_params.add_argument('--initial_stepsize','-is',
                             default=0.1,
                             type=float,
-                            help="Initial stepsize of the basinhopping algorithm from the disordered phase [default: %(default)s]",
+                            help="Initial stepsize of the basinhopping chains, adapted to a 50%% rate of steps within 0 <= rho <= 1 [default: %(default)s]",
                             )
 
+    if batch:
+        batch_params = parser.add_argument_group("Parameters related to batch runs over a phase")
+        batch_params.add_argument('--phase', '-ph',
+                                  default='.',
+                                  help="Phase directory containing the maximal clusters file and the structure directories [default: %(default)s]"
+                                 )
+        batch_params.add_argument('--structures', '-sl',
+                                  nargs='+',
+                                  default=None,
+                                  help="Structure directories to process, all subdirectories of the phase with a lattice and a str.in file if not given [default: %(default)s]"
+                                 )
+        batch_params.add_argument('--workers', '-nw',
+                                  type=int,
+                                  default=1,
+                                  help="Number of structures processed in parallel [default: %(default)s]"
+                                 )
+        batch_params.add_argument('--table', '-tab',
+                                  default='sro_batch.csv',
+                                  help="Name of the combined results table, written to the phase directory [default: %(default)s]"
+                                 )
+
     args = parser.parse_args()
     return args
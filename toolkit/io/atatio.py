@@ -1,40 +1,39 @@
 from __future__ import annotations
-from typing import Type, Generator
-import re
-import random
+from typing import Generator
+import itertools
+import os
 import subprocess
 import numpy as np
-#from toolkit.cluster.Cluster import Cluster
-
-def get_random_structure(structure: str,
-                         cluster: Type[Cluster]
-                        ) -> Generator[np.ndarray, None, None]:
-
-    while True:
-        with open(f'{structure}/str.in','r', encoding='utf-8') as init_structure:
-            lines = init_structure.readlines()
-            positions = [[*line.strip().split(' ')] for lnum, line in enumerate(lines) if lnum > 5]
-        atoms = [l[-1] for l in positions]
-        random.shuffle(atoms)
-        with open(f'{structure}/randstr.in','w', encoding='utf-8') as random_structure:
-            with open(f'{structure}/str.in','r', encoding='utf-8') as init_structure:
-                lines = init_structure.readlines()
-                for lnum, line in enumerate(lines):
-                    if lnum < 6:
-                        random_structure.write(line)
-                for position, atom in zip(positions,atoms):
-                    random_structure.write(f'{" ".join(position[:-1])} {atom}\n')
-
-        print('random structure generated..')
-        corrs_attempt = subprocess.run(['corrdump', '-c', f'-cf={structure}/{cluster._clusters_fname}', f'-s={structure}/randstr.in', f'-l={structure}/{cluster._lattice_fname}'],
-                                       stdout=subprocess.PIPE,
-                                       stderr=subprocess.PIPE,
-                                       check=True
-                                      )
-        # convert from bytes to string list
-        corrs_attempt = corrs_attempt.stdout.decode('utf-8').split('\t')[:-1]
-        corrs_attempt = np.array(corrs_attempt, dtype=np.float32)  # convert to arrays
-        yield corrs_attempt
+
+STDIN_FNAME = '/dev/stdin'
+
+def run_corrdump(clusters_fname: str,
+                 structure_fname: str,
+                 lattice_fname: str,
+                 *flags: str,
+                 structure_content: str = None,
+                ) -> np.ndarray:
+    """
+    Correlations of a structure from ATAT corrdump.
+    If structure_content is given, it is piped to corrdump as the structure file instead of reading structure_fname
+    (structure_fname is written and read if the platform has no /dev/stdin)
+    """
+    stdin = None
+    if structure_content is not None:
+        if os.path.exists(STDIN_FNAME):
+            structure_fname, stdin = STDIN_FNAME, structure_content.encode('utf-8')
+        else:
+            with open(structure_fname, 'w', encoding='utf-8') as fstructure:
+                fstructure.write(structure_content)
+    corrs = subprocess.run(['corrdump', '-c', f'-cf={clusters_fname}', f'-s={structure_fname}', f'-l={lattice_fname}', *flags],
+                           input=stdin,
+                           stdout=subprocess.PIPE,
+                           stderr=subprocess.PIPE,
+                           check=True
+                          )
+    # convert from bytes to string list
+    corrs = corrs.stdout.decode('utf-8').split('\t')[:-1]
+    return np.array(corrs, dtype=np.float32)  # convert to arrays
 
 def read_clusters(clusters_fname) -> dict:
 
@@ -56,21 +55,91 @@ def read_clusters(clusters_fname) -> dict:
         multiplicity = int(line[0])  # 1st line
         length = float(line[1])  # largest distance between two atoms
         num_points = int(line[2])  # type of cluster
+        # coordinates of each point, optionally followed by the number of site functions and function index
+        points = [point.split() for point in line[3:3+num_points]]
         clusters[idx] = {'mult': multiplicity,
                          'length': length,
-                         'type': num_points
+                         'type': num_points,
+                         'points': np.array([point[:3] for point in points], dtype=float).reshape(num_points, 3),
+                         'functions': np.array([point[3:5] for point in points if len(point) >= 5], dtype=int).reshape(-1, 2),
                         }
     return clusters
 
-def read_kbcoeffs(kb_fname) -> dict:
+def _cell_parameters_to_vectors(a: float, b: float, c: float,
+                                alpha: float, beta: float, gamma: float,
+                               ) -> np.ndarray:
+    alpha, beta, gamma = np.radians([alpha, beta, gamma])
+    ax = np.array([a, 0.0, 0.0])
+    bx = np.array([b*np.cos(gamma), b*np.sin(gamma), 0.0])
+    cx = c*np.cos(beta)
+    cy = c*(np.cos(alpha) - np.cos(beta)*np.cos(gamma))/np.sin(gamma)
+    return np.array([ax, bx, [cx, cy, np.sqrt(c**2 - cx**2 - cy**2)]])
+
+def read_structure(structure_fname) -> dict:
+    """
+    Reads an ATAT lat.in/str.in style file, see parse_structure
+    """
 
-    kb = {}
     try:
-        fkb = open(kb_fname, 'r')
-        _ = next(fkb)  # ignore first line
+        with open(structure_fname, 'r', encoding='utf-8') as fstructure:
+            return parse_structure(fstructure.read())
+    except FileNotFoundError:
+        print(f"WARNING: Structure file {structure_fname.split('/')[-1]} not found. ")
+        return None
 
-        temp_kb = fkb.read()
-        fkb.close()
+def parse_structure(content: str) -> dict:
+    """
+    Parses the contents of an ATAT lat.in/str.in style file
+    Output:
+        coord_system - rows are the axes of the coordinate system (cartesian)
+        cell - rows are the lattice (or supercell) vectors (cartesian)
+        positions - cartesian positions of the sites
+        species - species on each site as written, e.g. 'Al' or 'Al,Ni'
+        header - lines of the coordinate system and of the cell
+        sites - coordinates of every site as written
+    """
+
+    raw_lines = [line.strip() for line in content.split('\n') if line.strip() != '']
+    lines = [line.split() for line in raw_lines]
+    num_header = 4 if len(lines[0]) > 3 else 6
+
+    if len(lines[0]) > 3:
+        coord_system = _cell_parameters_to_vectors(*map(float, lines[0][:6]))
+        lines = lines[1:]
+    else:
+        coord_system = np.array(lines[:3], dtype=float)
+        lines = lines[3:]
+
+    cell = np.array(lines[:3], dtype=float) @ coord_system
+    positions = np.array([line[:3] for line in lines[3:]], dtype=float).reshape(-1, 3) @ coord_system
+    species = [''.join(line[3:]) for line in lines[3:]]
+
+    return {'coord_system': coord_system,
+            'cell': cell,
+            'positions': positions,
+            'species': species,
+            'header': raw_lines[:num_header],
+            'sites': [' '.join(line[:3]) for line in lines[3:]],
+           }
+
+def _nonempty_lines(fobj) -> Generator[str, None, None]:
+    """
+    Lines of an open file, skipping blank ones
+    """
+    for line in fobj:
+        if line.strip():
+            yield line
+
+def read_kbcoeffs(kb_fname) -> np.ndarray:
+    """
+    Output:
+        Kikuchi-Barker coefficient of every maximal cluster and subcluster
+    """
+
+    try:
+        with open(kb_fname, 'r') as fkb:
+            _ = next(fkb)  # ignore first line
+            return np.array(fkb.read().split(), dtype=float)
     except FileNotFoundError as fnfe:
         print(
             f"WARNING: Kikuchi-Barker coefficients file {kb_fname.split('/')[-1]} not found. ")
@@ -78,26 +147,17 @@ def read_kbcoeffs(kb_fname) -> dict:
     except TypeError:
         return None
 
-    temp_kb = temp_kb.split('\n')  # split file linewise
-    for idx, kbcoeff in enumerate(temp_kb):
-        if kbcoeff == '':  # check for spurious empty blocks
-            continue
-        kb[idx] = float(kbcoeff)
-
-    return kb
-
-def read_configmult(configmult_fname) -> dict:
-
-    configmult = {}
-    pattern1 = re.compile("\n\n\n")
-    pattern2 = re.compile("\n\n")
+def read_configmult(configmult_fname) -> (np.ndarray, np.ndarray):
+    """
+    Output:
+        mults - multiplicities of the configurations of all clusters, one block after the other
+        counts - number of configurations of each cluster
+    """
 
     try:
         with open(configmult_fname, 'r') as fsubmult:
             _ = next(fsubmult)  # ignore first line
-            temp_submult = fsubmult.read()
-            # split lines into blocks separated by 2 empty lines
-            temp_submult = pattern2.split(temp_submult)
+            tokens = np.array(fsubmult.read().split(), dtype=float)
     except FileNotFoundError as fnfe:
         print(
             f"WARNING: Config Multiplicities file {configmult_fname.split('/')[-1]} not found. ")
@@ -105,14 +165,15 @@ def read_configmult(configmult_fname) -> dict:
     except TypeError:
         return None
 
-    for idx, submult in enumerate(temp_submult[:-1]):
-        submult = submult.split('\n')  # split into number of subclusters
-        while("" in submult):
-            submult.remove("")  # remove empty blocks
-        # also ignore 1st line of each block
-        configmult[idx] = list(map(float, submult[1:]))
-
-    return configmult
+    # every block starts with its number of configurations
+    counts = []
+    headers = []
+    header = 0
+    while header < len(tokens):
+        counts.append(int(tokens[header]))
+        headers.append(header)
+        header += counts[-1] + 1
+    return np.delete(tokens, headers), np.array(counts, dtype=int)
 
 def read_clustermult(clustermult_fname) -> dict:
 
@@ -137,16 +198,28 @@ def read_clustermult(clustermult_fname) -> dict:
 
     return clustermult
 
-def read_vmatrix(vmat_fname) -> dict:
+def iter_vmatrix_blocks(vmat_fname) -> Generator[np.ndarray, None, None]:
+    """
+    V-Matrix block of every cluster in turn, read as the file is streamed
+    """
+    with open(vmat_fname, 'r') as fvmat:
+        _ = next(fvmat)  # ignore first line
+        lines = _nonempty_lines(fvmat)
+        # every block starts with its shape
+        for shape in lines:
+            num_rows, num_cols = map(int, shape.split())
+            block = np.loadtxt(itertools.islice(lines, num_rows), dtype=float, ndmin=2)
+            yield block.reshape(num_rows, num_cols)
+
+def read_vmatrix(vmat_fname) -> (np.ndarray, np.ndarray):
+    """
+    Output:
+        vmat - V-Matrices of all clusters stacked row wise, shape (num_configs, num_clusters)
+        rows - number of rows (configurations) of each cluster's block
+    """
 
-    pattern1 = re.compile("\n\n\n")
-    pattern2 = re.compile("\n\n")
-
-    vmat = {}
     try:
-        with open(vmat_fname, 'r') as fvmat:
-            _ = next(fvmat)  # ignore first lie
-            temp_vmat = fvmat.read()
+        blocks = list(iter_vmatrix_blocks(vmat_fname))
     except FileNotFoundError as fnfe:
         print(
             f"WARNING: Vmat file {vmat_fname.split('/')[-1]} not found. ")
@@ -154,21 +227,7 @@ def read_vmatrix(vmat_fname) -> dict:
     except TypeError:
         return None
 
-    # split by 2 empty lines i.e. maxclusters
-    temp_vmat = pattern2.split(temp_vmat)
-
-    while("" in temp_vmat):
-        temp_vmat.remove("")  # remove empty blocks
-
-    for clus_idx, mat in enumerate(temp_vmat):
-        mat = mat.split('\n')  # split by 1 empty line i.e. subclusters
-        mat_float = np.empty(list(map(int, mat[0].split(' '))))
-        for idx, row in enumerate(mat[1:]):  # ignore first line
-            mat_float[idx] = list(map(float, row.split(' ')[:-1]))
-
-        vmat[clus_idx] = mat_float
-
-    return vmat
+    return np.vstack(blocks), np.array([len(block) for block in blocks], dtype=int)
 
 def read_eci(eci_fname) -> dict:
 
@@ -193,18 +252,27 @@ def read_eci(eci_fname) -> dict:
 
     return eci
 
-def read_configs(config_fname) -> dict:
-
-    pattern1 = re.compile("\n\n\n")
-    pattern2 = re.compile("\n\n")
-    # Read config.out
-    configs = {}
-
+def read_configs(config_fname) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    Output:
+        num_of_subclus - number of subclusters of each cluster
+        inter_rows - number of points of each subcluster, num_of_subclus.sum() entries
+        inter - last two columns of the point lines of all subclusters, one block after the other
+    """
+
+    num_of_subclus = []
+    inter_rows = []
+    inter = []
     try:
         with open(config_fname, 'r') as fconfig:
             _ = next(fconfig)  # Ignore first line
-
-            temp_config = fconfig.read()  # .split('\n\n')
+            lines = _nonempty_lines(fconfig)
+            for num_subclus in lines:
+                num_of_subclus.append(int(num_subclus))
+                for _ in range(num_of_subclus[-1]):
+                    num_points = int(next(lines))
+                    inter.append(np.loadtxt(itertools.islice(lines, num_points), usecols=(-2, -1), dtype=int, ndmin=2))
+                    inter_rows.append(num_points)
     except FileNotFoundError as fnfe:
         print(
             f"WARNING: Config Description file {config_fname.split('/')[-1]} not found. Since this is not explicitly used in calculation. The programs shall continue.")
@@ -212,26 +280,7 @@ def read_configs(config_fname) -> dict:
     except TypeError:
         return None
 
-    # split lines separated by 2 empty lines
-    temp_config = pattern1.split(temp_config)
-
-    for idx, config in enumerate(temp_config):
-        if config == '':  # Check for spurious empty blocks
-            continue
-        num_points = int(config.split('\n')[0])  # number of subclusters
-        inter = []
-        # now split individual subclusters separated by 1 blank line
-        config = pattern2.split(config)
-        for i in range(num_points):
-            line = config[i].split('\n')
-            if i == 0:
-                length = int(line[1])
-            else:
-                length = int(line[0])
-            tmp_inter = np.array(
-                    [(list(map(int, l.split(' ')[-2:]))) for l in line[-length:]])
-            inter.append(tmp_inter)
-        configs[idx] = {'inter': inter,
-                        'num_of_subclus': num_points}
-
-    return configs
+    return (np.array(num_of_subclus, dtype=int),
+            np.array(inter_rows, dtype=int),
+            np.vstack(inter) if inter else np.empty((0, 2), dtype=int),
+           )
@@ -0,0 +1,160 @@
+"""
+Parallel basin hopping for the CVM free energy
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+from itertools import repeat
+
+import numpy as np
+from scipy.optimize import OptimizeResult
+
+from toolkit.optimizers.CVMOptimizer import CVMOptimizer
+import toolkit.optimizers.CVMOptimizer as cvm_optimizer
+from toolkit.basinhopping_features.basinhopping_features import BasinHoppingBounds, BasinHoppingStep, STEPSIZE_INTERVAL
+from toolkit.functions.energyfunctions import _kB
+
+# decrease of the best F (eV/atom) that counts as an improvement for the early stopping
+IMPROVEMENT_TOL = 1e-7
+
+@dataclass(kw_only=True, order=False, eq=False,)
+class HoppingChain:
+    """
+    State of one basin hopping chain, sent to a worker process for every epoch
+    """
+    index: int
+    start: np.ndarray
+    step: BasinHoppingStep
+    rng: np.random.Generator
+    corrs: np.ndarray = None
+    energy: float = np.inf
+    best: OptimizeResult = None
+    improved: bool = False
+    hops: int = 0
+
+def _hop_chain(chain: HoppingChain,
+               temperature: float,
+               num_hops: int,
+              ) -> (HoppingChain, int):
+    optimizer = cvm_optimizer._WORKER_OPTIMIZER
+    optimizer.temperature = temperature
+    local_solves = optimizer.local_solves
+    chain = optimizer._hop(chain, num_hops)
+    return chain, optimizer.local_solves - local_solves
+
+@dataclass(kw_only=True, order=False, eq=False,)
+class BasinHoppingOptimizer(CVMOptimizer):
+    """
+    CVMOptimizer whose global search is basin hopping instead of the random restarts.
+    num_chains chains (the first from the disordered state, the others from random structures) hop
+    from local minimum to local minimum with adaptive Gaussian steps that stay inside 0 <= rho <= 1,
+    accepting hops with the Metropolis criterion at bh_temperature (kB*T by default).
+    Every epoch of epoch_hops hops the chains that did not improve on their own best restart from the
+    best minimum of all chains. The chains run in parallel on n_jobs processes, the result does not depend on n_jobs.
+    num_trials is the budget of local solves over all chains, the search stops early after
+    early_stopping_count local solves without improving the best minimum by more than IMPROVEMENT_TOL.
+    """
+
+    stepsize: float = 0.1
+    num_chains: int = 4
+    epoch_hops: int = 5
+    bh_temperature: float = None
+    bh_interval: int = STEPSIZE_INTERVAL
+    _bh_accept: BasinHoppingBounds = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+
+        super().__post_init__()
+        self._bh_accept = BasinHoppingBounds(self._vmat)
+
+    def _hop(self: BasinHoppingOptimizer,
+             chain: HoppingChain,
+             num_hops: int,
+            ) -> HoppingChain:
+        """
+        num_hops hops of chain at the current temperature, the first from its starting correlations.
+        Until a local solve succeeds every hop starts from a new trial start, seeded by the chain and the hop
+        """
+        kT = _kB*self.temperature if self.bh_temperature is None else self.bh_temperature
+        for _ in range(num_hops):
+            if chain.corrs is not None:
+                corrs_new = chain.step(chain.corrs, self._bh_accept)
+            elif chain.hops == 0:
+                corrs_new = chain.start
+            else:
+                corrs_new = self._trial_start(chain.index + self.num_chains * chain.hops)
+            temp_results = self._trial_solve(corrs_new)
+            chain.hops += 1
+            if temp_results is None or temp_results.constr_violation >= self.constr_tol:
+                continue
+            if chain.best is None or temp_results.fun < chain.best.fun:
+                chain.best = OptimizeResult(temp_results)
+                chain.improved = True
+            if temp_results.fun < chain.energy or chain.rng.random() < np.exp(-(temp_results.fun - chain.energy) / kT):
+                chain.corrs, chain.energy = temp_results.x.copy(), temp_results.fun
+        return chain
+
+    def _epochs(self: BasinHoppingOptimizer,
+                chains: list[HoppingChain],
+                num_hops: int,
+               ) -> list[HoppingChain]:
+        if self.n_jobs == 1:
+            return [self._hop(chain, num_hops) for chain in chains]
+        hopped = list(self._trial_executor().map(_hop_chain, chains, repeat(self.temperature), repeat(num_hops)))
+        # the local solves counted by the workers, as the serial hops count them here
+        self.local_solves += sum(local_solves for _, local_solves in hopped)
+        return [chain for chain, _ in hopped]
+
+    def _multistart_fit(self: BasinHoppingOptimizer) -> (float, np.ndarray, np.ndarray, float):
+
+        chains = [HoppingChain(index = index,
+                               start = self._trial_start(index),
+                               step = BasinHoppingStep(self.cluster, self.stepsize, seed=(self._seed, index, 0), interval=self.bh_interval),
+                               rng = np.random.default_rng((self._seed, index, 1)),
+                              )
+                  for index in range(self.num_chains)
+                 ]
+
+        result = None
+        result_correlations = self.cluster.disordered_correlations.copy()
+        result_value = self.get_energy(result_correlations)
+        result_constr_viol = np.float64(0.0)
+        result_grad = np.zeros(result_correlations.shape[0])
+
+        hops, earlystop, epoch = 0, 0, 0
+        while hops < self.num_trials:
+            num_hops = min(self.epoch_hops, -(-(self.num_trials - hops) // self.num_chains))
+            chains = self._epochs(chains, num_hops)
+            hops += num_hops * self.num_chains
+            epoch += 1
+
+            earlystop += num_hops * self.num_chains
+            for chain in chains:
+                if chain.best is not None and chain.best.fun < result_value:
+                    if (result_value - chain.best.fun)/self.cluster.num_lat_atoms > IMPROVEMENT_TOL:
+                        earlystop = 0
+                    result = chain.best
+                    result_value = chain.best.fun
+                    result_grad = chain.best.grad.copy()
+                    result_correlations = chain.best.x.copy()
+                    result_constr_viol = chain.best.constr_violation
+
+            # share the best minimum with the chains that stopped improving
+            for chain in chains:
+                if not chain.improved and result is not None and chain.energy > result_value:
+                    chain.corrs, chain.energy = result_correlations.copy(), result_value
+                chain.improved = False
+
+            if self.print_output:
+                print(f'Basin hopping epoch {epoch} @ T = {self.temperature}K : {hops} local solves')
+                print(f'Chain energies: {np.array([chain.energy for chain in chains])/self.cluster.num_lat_atoms}')
+                print(f'Stepsizes: {np.array([chain.step.stepsize for chain in chains])}')
+                print(f'Step acceptance rates: {np.array([chain.step.acceptance_rate for chain in chains])}')
+                print(f"Current Min Free Energy @ T = {self.temperature}K : {result_value/self.cluster.num_lat_atoms}")
+
+            if earlystop >= self.early_stopping_count:
+                print(f'No improvement for consecutive {self.early_stopping_count} local solves after {hops} local solves')
+                break
+
+        self.optimized_result = result
+        return (result_value, result_correlations, result_grad, result_constr_viol)
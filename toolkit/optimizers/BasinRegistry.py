@@ -0,0 +1,100 @@
+"""
+Registry of the local minima found by the multi-start at one temperature
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Callable
+
+import numpy as np
+from scipy.optimize import OptimizeResult
+
+# a short descent heads into a known basin if it ends within CAPTURE_FACTOR * radius of its minimum, closer than it started
+CAPTURE_FACTOR = 10.0
+
+@dataclass(kw_only=True, order=False, eq=False,)
+class BasinRegistry:
+    """
+    Converged local minima (free correlations and full OptimizeResult) of the trials at the current temperature.
+    A local solve entering the neighbourhood (max norm < radius) of a known minimum, or whose first
+    precheck_iter iterations head into it, is a duplicate of that minimum and can be stopped.
+    The local solvers check after every iteration, nit counts the completed iterations (0 disables the precheck).
+    """
+
+    radius: float
+    precheck_iter: int = 0
+    hits: int = field(init=False, default=0)
+    _points: np.ndarray = field(init=False, default=None, repr=False)
+    _minima: list[OptimizeResult] = field(init=False, default_factory=list, repr=False)
+
+    def __len__(self) -> int:
+        return len(self._minima)
+
+    def clear(self: BasinRegistry) -> None:
+        self._points = None
+        self._minima.clear()
+        self.hits = 0
+
+    def distances(self: BasinRegistry,
+                  corrs: np.ndarray,
+                 ) -> np.ndarray:
+        """
+        Max norm distance of the free correlations corrs to every known minimum
+        """
+        if self._points is None:
+            return np.empty(0)
+        return np.max(np.abs(self._points - corrs), axis=1)
+
+    def add(self: BasinRegistry,
+            corrs: np.ndarray,
+            result: OptimizeResult,
+           ) -> None:
+        """
+        Records the minimum result at the free correlations corrs, unless it lies in the neighbourhood of a known one
+        """
+        if np.any(self.distances(corrs) < self.radius):
+            return
+        self._points = corrs[np.newaxis, :].copy() if self._points is None else np.vstack([self._points, corrs])
+        self._minima.append(OptimizeResult(result))
+
+    def monitor(self: BasinRegistry,
+                corrs_start: np.ndarray,
+               ) -> Callable[[np.ndarray, int], int]:
+        """
+        Input:
+            corrs_start - free correlations a local solve starts from
+        Output:
+            function (free correlations after nit iterations, nit) -> index of the known basin the descent
+            from corrs_start has entered or, after precheck_iter iterations, heads into. None otherwise
+        """
+        start_distances = self.distances(corrs_start)
+
+        def known_basin(corrs: np.ndarray, nit: int) -> int:
+            distances = self.distances(corrs)[:len(start_distances)]
+            if len(distances) == 0:
+                return None
+            nearest = int(np.argmin(distances))
+            if distances[nearest] < self.radius:
+                return nearest
+            if nit == self.precheck_iter and distances[nearest] < min(CAPTURE_FACTOR * self.radius, start_distances[nearest]):
+                return nearest
+            return None
+
+        return known_basin
+
+    def duplicate(self: BasinRegistry,
+                  index: int,
+                  nit: int,
+                 ) -> OptimizeResult:
+        """
+        The known minimum index as the result of a local solve stopped after nit iterations
+        """
+        self.hits += 1
+        result = OptimizeResult(self._minima[index])
+        result.update(status = 3,
+                      message = f'Stopped in the neighbourhood of known basin {index}.',
+                      success = False,
+                      nit = nit,
+                      basin = index,
+                     )
+        return result
@@ -3,18 +3,45 @@ Optimiser module for SRO Correction
 """
 
 from __future__ import annotations
-from dataclasses import dataclass, field
-from typing import Generator, Type
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, fields
+from typing import Callable, Generator, Type
+import multiprocessing
+import weakref
 
 import numpy as np
 from scipy.optimize import minimize
-from scipy.optimize import OptimizeWarning, OptimizeResult
+from scipy.optimize import OptimizeWarning, OptimizeResult, Bounds
 
 from toolkit.constraints.CorrelationConstraints import CorrelationConstraints
 from toolkit.bounds.CorrelationBounds import CorrelationBounds
 from toolkit.optimizers.ClusterOptimizer import ClusterOptimizer
+from toolkit.optimizers.BasinRegistry import BasinRegistry
+from toolkit.presolve.FixedCorrelationPresolve import FixedCorrelationPresolve
+from toolkit.functions.FreeEnergyEvaluator import FreeEnergyEvaluator
 
-from toolkit.io.atatio import get_random_structure
+from toolkit.cluster.RandomStructure import RandomStructure
+from toolkit.sampling.HitAndRunSampler import HitAndRunSampler
+
+START_SAMPLERS = ('structure', 'hit-and-run')
+# fraction of the configuration probabilities at the Chebyshev centre every start is lifted to
+INTERIOR_FRACTION = 1e-2
+
+# optimizer rebuilt once in every worker process of the parallel multi-start
+_WORKER_OPTIMIZER = None
+
+def _init_trial_worker(optimizer_cls: type,
+                       kwargs: dict,
+                      ) -> None:
+    global _WORKER_OPTIMIZER
+    _WORKER_OPTIMIZER = optimizer_cls(**kwargs)
+
+def _solve_trial(trial: int,
+                 temperature: float,
+                ) -> (np.ndarray, OptimizeResult):
+    _WORKER_OPTIMIZER.temperature = temperature
+    corrs_attempt = _WORKER_OPTIMIZER._trial_start(trial)
+    return corrs_attempt, _WORKER_OPTIMIZER._trial_solve(corrs_attempt)
 
 @dataclass(kw_only=True, order=False, eq=False,)
 class CVMOptimizer(ClusterOptimizer):
@@ -26,25 +53,63 @@ class CVMOptimizer(ClusterOptimizer):
     options: dict
     optimized_result: Type[OptimizeResult] = None
     _T: float = 100
-    _structure_generator: Generator[np.ndarray, None, None] = field(init=False)
+    n_jobs: int = 1
+    continuation: bool = False
+    continuation_extrapolate: bool = True
+    continuation_max_step: float = 0.1
+    basin_radius: float = 0.0
+    basin_precheck_iter: int = 0
+    start_sampler: str = 'structure'
+    local_solves: int = field(init=False, default=0)
+    _path: list = field(init=False, default_factory=list, repr=False)
+    _random_structure: RandomStructure = field(init=False, default=None, repr=False)
+    _start_pool: np.ndarray = field(init=False, default=None, repr=False)
+    _executor: ProcessPoolExecutor = field(init=False, default=None, repr=False)
+    _presolve: FixedCorrelationPresolve = field(init=False, repr=False)
+    _reduced_evaluator: FreeEnergyEvaluator = field(init=False, repr=False)
+    _reduced_bounds: Bounds = field(init=False, repr=False)
+    _basins: BasinRegistry = field(init=False, default=None, repr=False)
 
     def __post_init__(self) -> None:
 
 
         super().__post_init__()
-        assert self.cluster.vmatrix_array.shape == (len(self._multconfig_kb), len(self._mults_eci))
-        self._constraints = CorrelationConstraints(self.cluster.vmatrix_array,
-                                                    self.cluster.ordered_correlations,
-                                                    self.cluster.disordered_correlations,
-                                                    self.norm_constrained
-                                                   ).constraints
-
+        if self.start_sampler not in START_SAMPLERS:
+            raise ValueError(f"start_sampler should be one of {', '.join(START_SAMPLERS)}, not {self.start_sampler}")
+        self._evaluator.temperature = self._T
+        assert self._vmat.shape == (len(self._multconfig_kb), len(self._mults_eci))
         self._bounds = CorrelationBounds(self.cluster.num_clusters,
                                          len(self.cluster.single_point_clusters),
                                          self.cluster.disordered_correlations[self.cluster.single_point_clusters]
                                         ).sro_bounds
 
-        self._structure_generator = get_random_structure(self.cluster.structure, self.cluster)
+        # the local solves only see the free correlations
+        self._presolve = FixedCorrelationPresolve(all_vmat=self._vmat,
+                                                  mults_eci=self._mults_eci,
+                                                  lower=self._bounds.lb,
+                                                  upper=self._bounds.ub,
+                                                 )
+        self._reduced_evaluator = self._presolve.evaluator(self._multconfig_kb, self._T)
+        self._reduced_bounds = self._presolve.bounds
+        ordered_correlations = self.cluster.ordered_correlations
+        self._constraints = CorrelationConstraints(self._presolve.vmat_free,
+                                                    None if ordered_correlations is None else self._presolve.restrict(ordered_correlations),
+                                                    self._presolve.restrict(self.cluster.disordered_correlations),
+                                                    self.norm_constrained,
+                                                    self._presolve.rho_offset,
+                                                   ).constraints
+        if not self.approx_deriv:
+            self._dF = self._reduced_evaluator.F_jacobian
+            if self.hessian_free:
+                self._d2Fp = self._reduced_evaluator.F_hessp
+            else:
+                self._d2F = self._reduced_evaluator.F_hessian
+        if self.basin_radius > 0 and self.n_jobs > 1:
+            # every worker would keep its own registry and the trials stopped would depend on n_jobs
+            print('WARNING: The basin registry is only used with n_jobs = 1. Ignoring basin_radius.')
+            self.basin_radius = 0.0
+        if self.basin_radius > 0:
+            self._basins = BasinRegistry(radius=self.basin_radius, precheck_iter=self.basin_precheck_iter)
 
     @property
     def temperature(self):
@@ -52,20 +117,249 @@ class CVMOptimizer(ClusterOptimizer):
 
     @temperature.setter
     def temperature(self, T):
+        # the known minima only hold at the temperature they were found at
+        if self._basins is not None and T != self._T:
+            self._basins.clear()
         self._T = T
+        self._evaluator.temperature = T
+        self._reduced_evaluator.temperature = T
 
     def get_energy(self: CVMOptimizer,
-                   correlations: np.ndarray
-                  ) -> float:
+                   correlations: np.ndarray,
+                   temperature: float | np.ndarray = None,
+                  ) -> float | np.ndarray:
+        """
+        Free energy of one correlation vector at the current temperature, or of a 2-D stack
+        of correlation vectors and/or an array of temperatures in one vectorized evaluation.
+        The batched result has shape temperature.shape + correlations.shape[:-1]
+        """
+        if temperature is None and np.ndim(correlations) == 1:
+            return self._evaluator.F(correlations)
         return self._F(correlations,
                        self._mults_eci,
                        self._multconfig_kb,
-                       self.cluster.vmatrix_array,
+                       self._vmat,
                        self._vrhologrho,
-                       self._T
+                       self._T if temperature is None else temperature
                       )
 
+    def _trial_start(self: CVMOptimizer,
+                     trial: int,
+                    ) -> np.ndarray:
+        """
+        Starting correlations of a trial: the disordered state for trial 0, otherwise a random
+        structure drawn with a generator seeded by (seed, trial), or with the hit-and-run start_sampler
+        a point of the correlation polytope from a pool drawn once with a generator seeded by seed.
+        Every trial is therefore reproducible whatever the process it runs in
+        """
+        if trial == 0:
+            return self.cluster.disordered_correlations.copy()
+        if self.start_sampler == 'hit-and-run':
+            if self._start_pool is None:
+                sampler = HitAndRunSampler(vmat=self._presolve.vmat_free,
+                                           rho_offset=self._presolve.rho_offset,
+                                           lower=self._reduced_bounds.lb,
+                                           upper=self._reduced_bounds.ub,
+                                           start=self._presolve.restrict(self.cluster.chebyshev_center),
+                                          )
+                self._start_pool = sampler.sample(np.random.default_rng(self._seed), max(self.num_trials - 1, 1))
+            return self._presolve.expand(self._start_pool[(trial - 1) % len(self._start_pool)])
+        if self._random_structure is None:
+            self._random_structure = RandomStructure(structure_fname=f'{self.cluster.structure}/str.in', cluster=self.cluster)
+        return self._random_structure.sample(np.random.default_rng((self._seed, trial)))
+
+    def _interior_start(self: CVMOptimizer,
+                        corrs_attempt: np.ndarray,
+                       ) -> np.ndarray:
+        """
+        corrs_attempt with the fixed correlations set, moved towards the Chebyshev centre of the cluster
+        just enough for every configuration probability to be at least INTERIOR_FRACTION of its value there
+        """
+        corrs_start = self._presolve.expand(self._presolve.restrict(corrs_attempt))
+        corrs_center = self.cluster.chebyshev_center
+        rho_start = self._vmat @ corrs_start
+        rho_center = self._vmat @ corrs_center
+        rho_min = INTERIOR_FRACTION * rho_center
+        low = rho_start < rho_min
+        if not np.any(low):
+            return corrs_start
+        # rho is linear along the segment, the smallest mixing that lifts every rho to rho_min
+        mixing = min(1.0, np.max((rho_min[low] - rho_start[low]) / (rho_center[low] - rho_start[low])))
+        return corrs_start + mixing * (corrs_center - corrs_start)
+
+    def _local_solve(self: CVMOptimizer,
+                     corrs_attempt: np.ndarray,
+                     known_basin: Callable[[np.ndarray, int], int] = None,
+                    ) -> OptimizeResult:
+        """
+        trust-constr minimisation of the free correlations from corrs_attempt (made strictly feasible
+        by _interior_start), None if it failed.
+        The solution and the gradient are returned for all the correlations.
+        known_basin (see BasinRegistry.monitor) is checked at every iteration, the solve stops
+        and returns the known minimum as soon as it gives a basin
+        """
+        self.local_solves += 1
+        basin = None
+
+        def callback(intermediate_result: OptimizeResult) -> None:
+            nonlocal basin
+            basin = known_basin(intermediate_result.x, intermediate_result.nit)
+            if basin is not None:
+                raise StopIteration
+
+        try:
+            temp_results = minimize(self._reduced_evaluator.F,
+                                    self._presolve.restrict(self._interior_start(corrs_attempt)),
+                                    method='trust-constr',
+                                    options=self.options,
+                                    jac=self._dF,
+                                    hess=self._d2F,
+                                    hessp=self._d2Fp,
+                                    constraints=self._constraints,
+                                    bounds=self._reduced_bounds,
+                                    callback=None if known_basin is None else callback,
+                                   )
+            if basin is not None:
+                return self._basins.duplicate(basin, temp_results.nit)
+            temp_results.x = self._presolve.expand(temp_results.x)
+            temp_results.grad = self._evaluator.F_jacobian(temp_results.x)
+            return temp_results
+        except OptimizeWarning as opt_warn:
+            print(opt_warn)
+            print(f'WARNING. Optimisation Failure: T = {self.temperature}K')
+            print(f'Trial Correlations:\n {corrs_attempt}')
+            print(f'Trial Configuration Probabilities:\n {self.cluster.print_config_probabilities(corrs_attempt)}')
+            return None
+
+    def _trial_solve(self: CVMOptimizer,
+                     corrs_attempt: np.ndarray,
+                    ) -> OptimizeResult:
+        """
+        Local solve of a random search trial. With a basin registry, a solve entering (or after
+        basin_precheck_iter iterations heading into) the neighbourhood of a known minimum stops and
+        returns it, the converged feasible minima are recorded
+        """
+        if self._basins is None:
+            return self._local_solve(corrs_attempt)
+        temp_results = self._local_solve(corrs_attempt, self._basins.monitor(self._presolve.restrict(corrs_attempt)))
+        if temp_results is not None and 'basin' not in temp_results and temp_results.success \
+           and temp_results.constr_violation < self.constr_tol:
+            self._basins.add(self._presolve.restrict(temp_results.x), temp_results)
+        return temp_results
+
+    def _worker_kwargs(self: CVMOptimizer) -> dict:
+        """
+        Arguments rebuilding this optimizer in a worker process
+        """
+        kwargs = {field_.name: getattr(self, field_.name) for field_ in fields(self) if field_.init}
+        kwargs.update({'n_jobs': 1, 'print_output': False, 'optimized_result': None})
+        return kwargs
+
+    def _trial_executor(self: CVMOptimizer) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.n_jobs,
+                                                 mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=_init_trial_worker,
+                                                 initargs=(type(self), self._worker_kwargs()),
+                                                )
+            weakref.finalize(self, self._executor.shutdown, wait=False, cancel_futures=True)
+        return self._executor
+
+    def _trials(self: CVMOptimizer) -> Generator[tuple[int, np.ndarray, OptimizeResult], None, None]:
+        """
+        (trial, starting correlations, local minimum) of every trial, in trial order.
+        With n_jobs > 1 the trials are solved ahead of time on a process pool, the ones
+        still pending when the consumer stops (early stopping) are cancelled.
+        """
+        if self.n_jobs == 1:
+            for trial in range(self.num_trials):
+                corrs_attempt = self._trial_start(trial)
+                yield trial, corrs_attempt, self._trial_solve(corrs_attempt)
+            return
+
+        executor = self._trial_executor()
+        futures = {}
+        submitted = 0
+        try:
+            for trial in range(self.num_trials):
+                # keep every worker busy with a bounded lookahead
+                while submitted < min(self.num_trials, trial + 2 * self.n_jobs):
+                    futures[submitted] = executor.submit(_solve_trial, submitted, self.temperature)
+                    submitted += 1
+                corrs_attempt, temp_results = futures.pop(trial).result()
+                self.local_solves += 1
+                yield trial, corrs_attempt, temp_results
+        finally:
+            for future in futures.values():
+                future.cancel()
+
+    def close(self: CVMOptimizer) -> None:
+        """
+        Shuts down the worker processes of the parallel multi-start
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def reset_continuation(self: CVMOptimizer) -> None:
+        """
+        Forgets the optima of the previous temperatures
+        """
+        self._path.clear()
+
+    def _continuation_start(self: CVMOptimizer) -> np.ndarray:
+        """
+        Warm start at the current temperature: the linear extrapolation in T of the last two
+        optima if it lies strictly inside the feasible region, otherwise the last optimum
+        """
+        T_last, corrs_last = self._path[-1]
+        if self.continuation_extrapolate and len(self._path) > 1:
+            T_prev, corrs_prev = self._path[-2]
+            if T_last != T_prev:
+                corrs_pred = corrs_last + (corrs_last - corrs_prev) * (self.temperature - T_last) / (T_last - T_prev)
+                inside_bounds = np.all((corrs_pred >= self._bounds.lb) & (corrs_pred <= self._bounds.ub))
+                if inside_bounds and np.all(self._vmat @ corrs_pred > 0):
+                    return corrs_pred
+        return corrs_last.copy()
+
+    def _warm_fit(self: CVMOptimizer) -> (float, np.ndarray, np.ndarray, float):
+        """
+        Single local solve from the continuation start. None if it fails, violates the constraints,
+        ends above the disordered state or moves more than continuation_max_step (max norm) away from the start.
+        """
+        corrs_start = self._continuation_start()
+        temp_results = self._local_solve(corrs_start)
+        if temp_results is None or temp_results.constr_violation >= self.constr_tol:
+            return None
+        if temp_results.fun > self.get_energy(self.cluster.disordered_correlations):
+            return None
+        if np.max(np.abs(temp_results.x - corrs_start)) > self.continuation_max_step:
+            return None
+        if self.print_output:
+            print(f'Warm start from the optimum at T = {self._path[-1][0]}K accepted @ T = {self.temperature}K')
+        self.optimized_result = temp_results.copy()
+        return (temp_results.fun, temp_results.x.copy(), temp_results.grad.copy(), temp_results.constr_violation)
+
     def fit(self: CVMOptimizer) -> (float, np.ndarray, np.ndarray, float):
+        """
+        Minimises the free energy at the current temperature. In continuation mode the optimum of the
+        previous temperature(s) seeds a single local solve and the random search only runs if it is rejected.
+        """
+
+        # the free energy cache counts printed by _multistart_fit are those of this temperature
+        self._reduced_evaluator.reset_stats()
+        result = None
+        if self.continuation and self._path:
+            result = self._warm_fit()
+            if result is None:
+                print(f'Warm start rejected @ T = {self.temperature}K. Falling back to the random search.')
+        if result is None:
+            result = self._multistart_fit()
+        if self.continuation:
+            self._path.append((self.temperature, result[1].copy()))
+        return result
+
+    def _multistart_fit(self: CVMOptimizer) -> (float, np.ndarray, np.ndarray, float):
 
         result = None
         result_correlations = self.cluster.disordered_correlations.copy()
@@ -74,35 +368,14 @@ class CVMOptimizer(ClusterOptimizer):
         result_grad = np.zeros(result_correlations.shape[0])
 
         earlystop = 0
-        trial = 0
-        for trial in range(self.num_trials):
+        trials = self._trials()
+        for trial, corrs_attempt, temp_results in trials:
 
             accepted = False
-            corrs_attempt = next(self._structure_generator)
-
-            if trial == 0:
-                corrs_attempt = self.cluster.disordered_correlations.copy()
-
-            f_attempt = self.get_energy(corrs_attempt)
-            args = (self._mults_eci, self._multconfig_kb, self.cluster.vmatrix_array, self._vrhologrho, self.temperature,)
-            try:
-                temp_results = minimize(self._F,
-                                        corrs_attempt,
-                                        method='trust-constr',
-                                        args=args,
-                                        options=self.options,
-                                        jac=self._dF,
-                                        hess=self._d2F,
-                                        constraints=self._constraints,
-                                        bounds=self._bounds,
-                                       )
-            except OptimizeWarning as opt_warn:
-                print(opt_warn)
+            if temp_results is None:
                 print(f'WARNING. Optimisation Failure: step {trial}, T = {self.temperature}K')
-                print(f'Trial Correlations:\n {corrs_attempt}')
-                print(f'Trial Configuration Probabilities:\n self.cluster.print_config_probabilities(corrs_attempt)')
 
-            if temp_results.constr_violation < self.constr_tol and temp_results.fun < result_value:
+            elif temp_results.constr_violation < self.constr_tol and temp_results.fun < result_value:
 
                 earlystop = 0
                 result = temp_results.copy()
@@ -114,7 +387,8 @@ class CVMOptimizer(ClusterOptimizer):
 
                 accepted = True
 
-            if self.print_output:
+            if self.print_output and temp_results is not None:
+                f_attempt = self.get_energy(corrs_attempt)
                 print(f'Trial No.: {trial}')
                 print(f'Current attempt correlations: {corrs_attempt}')
                 print(f'Trial Validity: {self.cluster.check_correlation_validity(corrs_attempt)}')
@@ -132,6 +406,13 @@ class CVMOptimizer(ClusterOptimizer):
             if earlystop > self.early_stopping_count and trial > self.num_trials/2:
                 print(f'No improvement for consecutive {self.early_stopping_count} steps. After half of total steps ({int(self.num_trials/2)}) were done')
                 break
+        trials.close()
+
+        if self.print_output and self.n_jobs == 1:
+            cache_stats = self._reduced_evaluator.cache_stats
+            print(f"Free energy cache @ T = {self.temperature}K : {cache_stats['hits']} hits | {cache_stats['misses']} misses")
+            if self._basins is not None:
+                print(f'Known basins @ T = {self.temperature}K : {len(self._basins)} minima | {self._basins.hits} solves stopped early')
 
         self.optimized_result = result
         return (result_value, result_correlations, result_grad, result_constr_viol)
@@ -143,7 +424,7 @@ class CVMOptimizer(ClusterOptimizer):
             print(f'Constraints:\n{self._constraints}')
             print(f'Approximating Derivatives:\n{self.approx_deriv}')
             print(self._dF)
-            print(self._d2F)
+            print(self._d2F if self._d2Fp is None else self._d2Fp)
         else:
             print(f'Current minimum correlations: {self.optimized_result.x}')
             print(f"Gradient: {np.array2string(self.optimized_result.grad)}")
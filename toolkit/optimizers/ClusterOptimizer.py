@@ -10,7 +10,11 @@ import numpy as np
 from scipy.optimize import BFGS
 
 from toolkit.cluster.Cluster import Cluster
-from toolkit.functions.energyfunctions import F, F_hessian, F_jacobian
+from toolkit.functions.energyfunctions import F, rhologrho
+from toolkit.functions.FreeEnergyEvaluator import FreeEnergyEvaluator
+from toolkit.presolve.vmatrows import merge_identical_rows
+
+HESSIAN_FREE_CLUSTER_THRESHOLD = 200
 
 @dataclass(kw_only=True, order=False, eq=False, repr=False)
 class ClusterOptimizer(ABC):
@@ -26,12 +30,14 @@ class ClusterOptimizer(ABC):
     constr_tol: float = 1e-10
     early_stopping_count: int = 100
     norm_constrained: bool = False
+    hessian_free: bool = None
 
     _bounds: Any = field(init=False)
     _constraints: list = field(init=False,default_factory=list)
     _mults_eci: np.ndarray = field(init=False)
     _multconfig_kb: np.ndarray = field(init=False)
-    _vrhologrho: Callable[[np.ndarray],np.ndarray] = np.vectorize(lambda rho: rho * np.log(np.abs(rho)))
+    _vmat: np.ndarray = field(init=False, repr=False)
+    _vrhologrho: Callable[[np.ndarray],np.ndarray] = rhologrho
     _seed: int = 42
     _F: Callable[[np.ndarray,
                  np.ndarray,
@@ -42,19 +48,37 @@ class ClusterOptimizer(ABC):
                 ], float] = F
     _dF: Callable[...,np.ndarray] = field(init=False)
     _d2F: Callable[...,np.ndarray] = field(init=False)
+    _d2Fp: Callable[...,np.ndarray] = field(init=False, default=None)
+    _evaluator: FreeEnergyEvaluator = field(init=False)
 
     def __post_init__(self) -> None:
 
         self._mults_eci = self.cluster.clusmult_array * self.cluster.eci_array
-        self._multconfig_kb = self.cluster.configmult_array * self.cluster.kb_array
-        
+        # configurations with identical V-Matrix rows enter F through one row with the summed weights
+        self._vmat, self._multconfig_kb, _ = merge_identical_rows(self.cluster.vmatrix_array,
+                                                                  self.cluster.configmult_array * self.cluster.kb_array,
+                                                                 )
+        if self.print_output and self._vmat.shape[0] < self.cluster.vmatrix_array.shape[0]:
+            print(f'V-Matrix rows with identical configurations merged: {self.cluster.vmatrix_array.shape[0]} -> {self._vmat.shape[0]}')
+        self._evaluator = FreeEnergyEvaluator(mults_eci=self._mults_eci,
+                                              multconfig_kb=self._multconfig_kb,
+                                              all_vmat=self._vmat,
+                                             )
+
         if self.approx_deriv:
             print('Approximating the derivatives - Jacobian : a 3-point finite diffrence scheme, Hessian : BFGS')
             self._dF = '3-point'
             self._d2F = BFGS()
         else:
-            self._dF = F_jacobian
-            self._d2F = F_hessian
+            self._dF = self._evaluator.F_jacobian
+            if self.hessian_free is None:
+                self.hessian_free = self.cluster.num_clusters > HESSIAN_FREE_CLUSTER_THRESHOLD
+            if self.hessian_free:
+                print('Hessian-free mode - trust-constr uses Hessian-vector products')
+                self._d2F = None
+                self._d2Fp = self._evaluator.F_hessp
+            else:
+                self._d2F = self._evaluator.F_hessian
 
     @abstractmethod
     def get_energy(self, correlations: np.ndarray) -> float:
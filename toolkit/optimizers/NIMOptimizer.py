@@ -0,0 +1,198 @@
+"""
+Natural Iteration Method (Kikuchi) for the CVM free energy
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+import sys
+
+import numpy as np
+
+from toolkit.bounds.CorrelationBounds import CorrelationBounds
+from toolkit.functions.energyfunctions import _kB
+from toolkit.optimizers.ClusterOptimizer import ClusterOptimizer
+
+# smallest damping of a dual Newton step before the dual solve stops
+DUAL_MIN_STEP = 1e-12
+
+@dataclass(kw_only=True, order=False, eq=False,)
+class NIMOptimizer(ClusterOptimizer):
+    """
+    Minimises the CVM free energy with Kikuchi's natural iteration method, in the correlation basis.
+    The probabilities of the maximal cluster (a V-Matrix block that is square, invertible and
+    has a positive Kikuchi-Barker coefficient, i.e. it contains every other cluster) are updated as
+
+        rho_max = exp(-(V_max^-T (h - C^T mu)) / (kB*T*mult_kb_max) - 1)
+
+    where h is the gradient of the energy plus the entropy of all the subclusters at the previous
+    iterate, and the Lagrange multipliers mu of the fixed correlations (empty and point clusters)
+    come from a small convex dual solved by Newton's method. The probabilities stay positive by construction.
+    If a step raises F it is damped towards the previous iterate, which keeps rho positive as well.
+    The dual is solved to dual_tol (max violation of the fixed correlations) in at most dual_maxiter iterations,
+    the largest violation left over a fit is reported since the fixed correlations are reset after every step.
+    """
+
+    approx_deriv: bool = False
+    maxiter: int = 10000
+    xtol: float = 1e-10
+    dual_maxiter: int = 100
+    dual_tol: float = 1e-12
+    _T: float = 100
+    iterations: int = field(init=False, default=0)
+    dual_residual: float = field(init=False, default=0.0)
+    _max_block: int = field(init=False, repr=False)
+    _vmat_max_inv: np.ndarray = field(init=False, repr=False)
+    _multconfig_kb_max: np.ndarray = field(init=False, repr=False)
+    _vmat_sub: np.ndarray = field(init=False, repr=False)
+    _multconfig_kb_sub: np.ndarray = field(init=False, repr=False)
+    _fixed: np.ndarray = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+
+        super().__post_init__()
+        self._evaluator.temperature = self._T
+        if self.norm_constrained:
+            print('WARNING: The natural iteration method ignores the norm constraint.')
+        self._bounds = CorrelationBounds(self.cluster.num_clusters,
+                                         len(self.cluster.single_point_clusters),
+                                         self.cluster.disordered_correlations[self.cluster.single_point_clusters]
+                                        ).sro_bounds
+        self._fixed = np.flatnonzero(self._bounds.lb == self._bounds.ub)
+
+        vmat = self.cluster.vmat
+        multconfig_kb = {idx: np.asarray(self.cluster.configmult[idx]) * kb for idx, kb in self.cluster.kb.items()}
+        max_blocks = [idx for idx, block in vmat.items()
+                      if block.shape == (self.cluster.num_clusters, self.cluster.num_clusters)
+                      and self.cluster.kb[idx] > 0
+                      and np.linalg.matrix_rank(block) == self.cluster.num_clusters]
+        if not max_blocks:
+            raise ValueError('The natural iteration method needs a maximal cluster containing all the other clusters.')
+        self._max_block = max_blocks[0]
+        self._vmat_max_inv = np.linalg.inv(vmat[self._max_block])
+        self._multconfig_kb_max = multconfig_kb[self._max_block]
+        sub_blocks = [idx for idx in vmat if idx != self._max_block]
+        self._vmat_sub = np.vstack([vmat[idx] for idx in sub_blocks])
+        self._multconfig_kb_sub = np.concatenate([multconfig_kb[idx] for idx in sub_blocks])
+
+    @property
+    def temperature(self):
+        return self._T
+
+    @temperature.setter
+    def temperature(self, T):
+        self._T = T
+        self._evaluator.temperature = T
+
+    def get_energy(self: NIMOptimizer,
+                   correlations: np.ndarray,
+                   temperature: float | np.ndarray = None,
+                  ) -> float | np.ndarray:
+        """
+        Free energy of correlations, see CVMOptimizer.get_energy
+        """
+        if temperature is None and np.ndim(correlations) == 1:
+            return self._evaluator.F(correlations)
+        return self._F(correlations,
+                       self._mults_eci,
+                       self._multconfig_kb,
+                       self._vmat,
+                       self._vrhologrho,
+                       self._T if temperature is None else temperature
+                      )
+
+    def _max_cluster_probabilities(self: NIMOptimizer,
+                                   correlations: np.ndarray,
+                                  ) -> np.ndarray:
+        """
+        Natural iteration update of the maximal cluster probabilities from the subcluster probabilities at correlations.
+        The largest violation of the fixed correlations is kept in dual_residual
+        """
+        kT = _kB*self._T
+        rho_sub = self._vmat_sub @ correlations + sys.float_info.epsilon
+        field_ = self._mults_eci + kT * (self._vmat_sub.T @ (self._multconfig_kb_sub * (1 + np.log(np.abs(rho_sub)))))
+        # log(rho_max) = u + B @ mu, mu in units of kB*T
+        u = -(self._vmat_max_inv.T @ field_) / (kT * self._multconfig_kb_max) - 1
+        B = self._vmat_max_inv.T[:, self._fixed] / self._multconfig_kb_max[:, None]
+        vinv_fixed = self._vmat_max_inv[self._fixed]
+        target = self._bounds.lb[self._fixed]
+
+        # Newton's method on the convex dual phi(mu) = SUM(mult_kb_max * rho_max(mu)) - mu @ target
+        # whose gradient vinv_fixed @ rho_max(mu) - target is the violation of the fixed correlations
+        # B[:, 0] is constant (normalization), start with the largest probability at 1
+        mu = np.zeros(len(self._fixed))
+        mu[0] = -np.max(u) / B[0, 0]
+        for _ in range(self.dual_maxiter):
+            rho = np.exp(u + B @ mu)
+            grad = vinv_fixed @ rho - target
+            if np.max(np.abs(grad)) < self.dual_tol:
+                break
+            hess = vinv_fixed @ (rho[:, None] * B)
+            step = np.linalg.solve(hess, grad)
+            phi = self._multconfig_kb_max @ rho - mu @ target
+            t = 1.0
+            while t > DUAL_MIN_STEP:
+                mu_new = mu - t * step
+                rho_new = np.exp(u + B @ mu_new)
+                if self._multconfig_kb_max @ rho_new - mu_new @ target < phi:
+                    break
+                t /= 2
+            else:
+                # no decrease of phi, mu is kept
+                break
+            mu = mu_new
+        rho = np.exp(u + B @ mu)
+        self.dual_residual = max(self.dual_residual, np.max(np.abs(vinv_fixed @ rho - target)))
+        return rho
+
+    def _nim_step(self: NIMOptimizer,
+                  correlations: np.ndarray,
+                 ) -> np.ndarray:
+        correlations_new = self._vmat_max_inv @ self._max_cluster_probabilities(correlations)
+        correlations_new[self._fixed] = self._bounds.lb[self._fixed]
+        return correlations_new
+
+    def fit(self: NIMOptimizer,
+            correlations: np.ndarray = None,
+           ) -> (float, np.ndarray, np.ndarray, float):
+        """
+        Natural iteration from correlations (the disordered state by default) at the current temperature
+        Output:
+            Same as CVMOptimizer.fit: free energy, correlations, gradient and constraint violation
+        """
+
+        if correlations is None:
+            correlations = self.cluster.disordered_correlations.copy()
+        correlations = np.array(correlations, dtype=np.float64)
+        F_current = self.get_energy(correlations)
+
+        self.iterations = 0
+        self.dual_residual = 0.0
+        converged = False
+        while self.iterations < self.maxiter:
+            self.iterations += 1
+            correlations_new = self._nim_step(correlations)
+            F_new = self.get_energy(correlations_new)
+            # damping: convex combinations of two feasible points are feasible
+            damping = 1.0
+            correlations_step = correlations_new
+            while F_new - F_current > 1e-12 * max(1.0, abs(F_current)) and damping > 1e-6:
+                damping /= 2
+                correlations_step = correlations + damping * (correlations_new - correlations)
+                F_new = self.get_energy(correlations_step)
+            step = np.max(np.abs(correlations_step - correlations))
+            correlations, F_current = correlations_step, F_new
+            if step < self.xtol:
+                converged = True
+                break
+
+        if not converged:
+            print(f'WARNING: The natural iteration did not converge in {self.maxiter} iterations @ T = {self.temperature}K')
+        if self.dual_residual >= self.dual_tol:
+            print(f'WARNING: The fixed correlations were violated by up to {self.dual_residual:.2e} in the natural iteration @ T = {self.temperature}K')
+        if self.print_output:
+            print(f'Natural iteration @ T = {self.temperature}K : {self.iterations} iterations')
+
+        rho = self._vmat @ correlations
+        constr_viol = max(0.0, -np.min(rho), np.max(np.abs(correlations[self._fixed] - self._bounds.lb[self._fixed])))
+        grad = self._evaluator.F_jacobian(correlations)
+        return (F_current, correlations, grad, np.float64(constr_viol))
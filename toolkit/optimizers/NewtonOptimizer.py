@@ -0,0 +1,123 @@
+"""
+Damped Newton local solver for the CVM free energy
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Callable
+
+import numpy as np
+from scipy.optimize import OptimizeResult
+
+from toolkit.optimizers.CVMOptimizer import CVMOptimizer
+
+# fraction of the distance to the boundary rho = 0 a step may cover
+FRACTION_TO_BOUNDARY = 0.99
+ARMIJO_SLOPE = 1e-4
+# largest shift of the Hessian, relative to its largest diagonal entry
+MAX_HESSIAN_SHIFT = 1e8
+
+@dataclass(kw_only=True, order=False, eq=False,)
+class NewtonOptimizer(CVMOptimizer):
+    """
+    CVMOptimizer whose local solves are damped Newton iterations on the free correlations
+    of FixedCorrelationPresolve. The entropy is the barrier:
+    the step length is capped so that every configuration probability stays positive, then
+    backtracked until F decreases enough (Armijo). Where the Hessian is not positive definite
+    (negative Kikuchi-Barker coefficients) it is shifted by a multiple of the identity.
+    The random search, continuation and parallel trials are those of CVMOptimizer.
+    Uses options['maxiter'], options['gtol'] (max norm of the free gradient) and options['xtol'] (max norm of the step).
+    """
+
+    approx_deriv: bool = False
+
+    def __post_init__(self) -> None:
+
+        super().__post_init__()
+        if self.norm_constrained:
+            print('WARNING: The Newton solver ignores the norm constraint.')
+
+    def _newton_direction(self: NewtonOptimizer,
+                          grad: np.ndarray,
+                          hess: np.ndarray,
+                         ) -> np.ndarray:
+        """
+        Newton direction of the shifted Hessian, None if the Hessian is not finite or
+        can not be made positive definite by a shift up to MAX_HESSIAN_SHIFT
+        """
+        if not (np.all(np.isfinite(hess)) and np.all(np.isfinite(grad))):
+            return None
+        shift = 0.0
+        scale = max(np.max(np.abs(np.diag(hess))), np.finfo(float).tiny)
+        identity = np.eye(len(grad))
+        while shift <= MAX_HESSIAN_SHIFT * scale:
+            try:
+                chol = np.linalg.cholesky(hess + shift * identity)
+                return -np.linalg.solve(chol.T, np.linalg.solve(chol, grad))
+            except np.linalg.LinAlgError:
+                shift = max(1e-8 * scale, 10 * shift)
+        return None
+
+    def _local_solve(self: NewtonOptimizer,
+                     corrs_attempt: np.ndarray,
+                     known_basin: Callable[[np.ndarray, int], int] = None,
+                    ) -> OptimizeResult:
+        """
+        Damped Newton minimisation from corrs_attempt, stopped with the known minimum as soon as known_basin gives a basin
+        """
+        self.local_solves += 1
+        maxiter = self.options.get('maxiter', 1000)
+        gtol = self.options.get('gtol', 1e-8)
+        xtol = self.options.get('xtol', 1e-8)
+        evaluator = self._reduced_evaluator
+
+        corrs = self._presolve.restrict(self._interior_start(corrs_attempt))
+        F_current = evaluator.F(corrs)
+        status, message = 0, 'The maximum number of iterations is exceeded.'
+        nit = 0
+        for nit in range(1, maxiter + 1):
+            grad = evaluator.F_jacobian(corrs)
+            if np.max(np.abs(grad)) < gtol:
+                status, message = 1, '`gtol` termination condition is satisfied.'
+                break
+            direction = self._newton_direction(grad, evaluator.F_hessian(corrs))
+            if direction is None:
+                status, message = -1, 'The Hessian is not finite or could not be made positive definite.'
+                break
+
+            # longest step keeping every rho positive
+            rho = self._presolve.vmat_free @ corrs + self._presolve.rho_offset
+            drho = self._presolve.vmat_free @ direction
+            decreasing = drho < 0
+            step = min(1.0, FRACTION_TO_BOUNDARY * np.min(-rho[decreasing] / drho[decreasing])) if np.any(decreasing) else 1.0
+            slope = grad @ direction
+            while True:
+                corrs_new = corrs + step * direction
+                F_new = evaluator.F(corrs_new)
+                if F_new <= F_current + ARMIJO_SLOPE * step * slope:
+                    corrs, F_current = corrs_new, F_new
+                    break
+                if step * np.max(np.abs(direction)) < xtol:
+                    # no sufficient decrease down to xtol, the current iterate is kept
+                    break
+                step /= 2
+            # checked after every iteration, as the trust-constr callback
+            if known_basin is not None:
+                basin = known_basin(corrs, nit)
+                if basin is not None:
+                    return self._basins.duplicate(basin, nit)
+            if step * np.max(np.abs(direction)) < xtol:
+                status, message = 2, '`xtol` termination condition is satisfied.'
+                break
+
+        corrs = self._presolve.expand(corrs)
+        rho = self._vmat @ corrs
+        return OptimizeResult(x = corrs,
+                              fun = F_current,
+                              grad = self._evaluator.F_jacobian(corrs),
+                              constr_violation = max(0.0, -np.min(rho)),
+                              status = status,
+                              message = message,
+                              success = status > 0,
+                              nit = nit,
+                             )
@@ -5,60 +5,273 @@ Optimiser module for SRO Correction
 from __future__ import annotations
 from dataclasses import dataclass, field
 from typing import Type
+import hashlib
 import numpy as np
-from scipy.optimize import linprog
+from scipy import sparse
+from scipy.optimize import linprog, nnls
 from scipy.optimize import OptimizeWarning, OptimizeResult
 
 from toolkit.optimizers.ClusterOptimizer import ClusterOptimizer
+from toolkit.presolve.FixedCorrelationPresolve import FixedCorrelationPresolve
+from toolkit.presolve.vmatrows import merge_identical_rows
+from toolkit.io.CorrelationCache import CorrelationCache, default_correlation_cache
 
+LINPROG_METHODS = ('highs', 'highs-ds', 'highs-ipm')
+# configuration probabilities and bound distances below ACTIVE_TOL are active constraints of a vertex
+ACTIVE_TOL = 1e-9
+# relative residual of the KKT conditions below which the previous vertex is still optimal
+KKT_TOL = 1e-9
 
 @dataclass(kw_only=True, order=False, eq=False, slots=True,)
 class OrderedStateOptimizer(ClusterOptimizer):
     """
-    Finds the ordered structure given cluster information using Linear Programming
+    Finds the ordered structure given cluster information using Linear Programming (HiGHS)
     Input:
         cluster_data - ClusterInfo object contatning vmat, eci and cluster information
-        corr - sample corr, only used as a guess for the refined simplex method. This also
-        specified the point correlations that are kept fixed.
-        method - method of the linear programming; simplex or interior point
+        method - HiGHS solver of the linear programming: highs (automatic choice), highs-ds (dual simplex) or highs-ipm (interior point)
         options - extra options for the linear programming problem
+        use_cache - read/write the ordered states from/to a cache keyed on the ECI's, the V-Matrix, the fixed point correlations and the method
+        enumerate_vertices - also find the optimal vertices of a degenerate ground state (ordered_vertices)
+        vertex_probes - the enumeration stops after vertex_probes random objectives on the optimal face without a new vertex
         Output
     """
 
     options: dict
-    method: str = 'revised-simplex'
+    method: str = 'highs-ds'
     optimized_result: Type[OptimizeResult] = None
+    use_cache: bool = True
+    enumerate_vertices: bool = False
+    vertex_probes: int = 20
+    ordered_vertices: np.ndarray = field(init=False, default=None)
+    cache_hits: int = field(init=False, default=0)
+    warm_starts: int = field(init=False, default=0)
+    _vmat_lp: np.ndarray = field(init=False, repr=False)
+    _vmat_hash: str = field(init=False, repr=False)
+    _cache: CorrelationCache = field(init=False, default=None, repr=False)
+    _previous: tuple = field(init=False, default=None, repr=False)
 
     def __post_init__(self: OrderedStateOptimizer) -> None:
+        if self.method not in LINPROG_METHODS:
+            raise ValueError(f"method should be one of {', '.join(LINPROG_METHODS)}, not {self.method}")
         self._bounds = [(self.cluster.disordered_correlations[idx], self.cluster.disordered_correlations[idx]) if cluster['type'] == 1 else (
             1, 1) if cluster['type'] == 0 else (-1, 1) for idx, cluster in self.cluster.clusters.items()]
 
+        # repeated rows are repeated constraints
+        self._vmat_lp = merge_identical_rows(self.cluster.vmatrix_array)[0]
+        if sparse.issparse(self._vmat_lp):
+            vmat_hash = [self._vmat_lp.data, self._vmat_lp.indices, self._vmat_lp.indptr]
+        else:
+            vmat_hash = [np.ascontiguousarray(self._vmat_lp, dtype=np.float64)]
+        self._vmat_hash = self._hash(np.array(self._vmat_lp.shape), *vmat_hash)
+        if self.use_cache:
+            self._cache = default_correlation_cache('ordered_states')
+
+    @staticmethod
+    def _hash(*arrays: np.ndarray) -> str:
+        digest = hashlib.sha256()
+        for array in arrays:
+            digest.update(np.ascontiguousarray(array).tobytes())
+        return digest.hexdigest()
+
+    def _cache_key(self: OrderedStateOptimizer,
+                   mults_eci: np.ndarray,
+                   lower: np.ndarray,
+                   upper: np.ndarray,
+                   kind: str,
+                  ) -> str:
+        key_ = '\n'.join([self._vmat_hash,
+                          self._hash(np.asarray(mults_eci, dtype=np.float64), lower, upper),
+                          self.method,
+                          kind,
+                         ])
+        return hashlib.sha256(key_.encode('utf-8')).hexdigest()
+
+    def _still_optimal(self: OrderedStateOptimizer,
+                       presolve: FixedCorrelationPresolve,
+                       corrs_free: np.ndarray,
+                      ) -> bool:
+        """
+        Warm start: True if the vertex corrs_free (the previous optimum) satisfies the KKT conditions
+        of the new objective, i.e. mults_eci_free is a non-negative combination of the active
+        constraint normals (rho = 0 rows of V, lower and upper bounds)
+        """
+        rho = presolve.vmat_free @ corrs_free + presolve.rho_offset
+        lower, upper = presolve.lower[presolve.free], presolve.upper[presolve.free]
+        vmat_active = presolve.vmat_free[np.flatnonzero(rho < ACTIVE_TOL)]
+        vmat_active = vmat_active.toarray() if sparse.issparse(vmat_active) else np.asarray(vmat_active)
+        identity = np.eye(len(corrs_free))
+        normals = np.vstack([vmat_active,
+                             identity[corrs_free - lower < ACTIVE_TOL],
+                             -identity[upper - corrs_free < ACTIVE_TOL],
+                            ])
+        if len(normals) == 0:
+            return False
+        _, residual = nnls(normals.T, presolve.mults_eci_free)
+        return residual <= KKT_TOL * max(1.0, np.linalg.norm(presolve.mults_eci_free))
+
+    def _linprog(self: OrderedStateOptimizer,
+                 objective: np.ndarray,
+                 presolve: FixedCorrelationPresolve,
+                 objective_cut: float = None,
+                ) -> OptimizeResult:
+        """
+        min objective.x_free s.t. V_free.x_free + rho_offset >= 0 within the bounds of the free correlations,
+        and mults_eci_free.x_free <= objective_cut if given
+        """
+        A_ub, b_ub = -1 * presolve.vmat_free, presolve.rho_offset
+        if objective_cut is not None:
+            if sparse.issparse(A_ub):
+                A_ub = sparse.vstack([A_ub, sparse.csr_array(presolve.mults_eci_free[np.newaxis, :])], format='csr')
+            else:
+                A_ub = np.vstack([A_ub, presolve.mults_eci_free])
+            b_ub = np.append(b_ub, objective_cut)
+        return linprog(objective,
+                       A_ub=A_ub,
+                       b_ub=b_ub,
+                       bounds=np.column_stack((presolve.lower[presolve.free], presolve.upper[presolve.free])),
+                       options=self.options,
+                       method=self.method
+                      )
+
+    def _solve(self: OrderedStateOptimizer,
+               mults_eci: np.ndarray,
+               lower: np.ndarray,
+               upper: np.ndarray,
+              ) -> OptimizeResult:
+        """
+        Ordered state of one set of ECI's times multiplicities and bounds: from the cache, else the
+        previous optimum if the bounds are unchanged and it is still optimal, else HiGHS
+        """
+        key = self._cache_key(mults_eci, lower, upper, 'ordered') if self._cache is not None else None
+        if key is not None:
+            cached = self._cache.lookup(key)
+            if cached is not None:
+                self.cache_hits += 1
+                # the next solve warm starts from this ordered state, as from a solved one
+                self._previous = (np.asarray(lower, dtype=np.float64), np.asarray(upper, dtype=np.float64), cached.copy())
+                return OptimizeResult(x=cached, fun=float(mults_eci @ cached), success=True, status=0,
+                                      message='Ordered state read from the cache.')
+
+        # the fixed correlations only shift the constraints and the objective
+        presolve = FixedCorrelationPresolve(all_vmat=self._vmat_lp,
+                                            mults_eci=mults_eci,
+                                            lower=lower,
+                                            upper=upper,
+                                           )
+        if self._previous is not None and np.array_equal(self._previous[0], presolve.lower) and np.array_equal(self._previous[1], presolve.upper):
+            corrs_previous = self._previous[2]
+            if self._still_optimal(presolve, presolve.restrict(corrs_previous)):
+                self.warm_starts += 1
+                return OptimizeResult(x=corrs_previous.copy(), fun=float(mults_eci @ corrs_previous), success=True, status=0,
+                                      message='Previous ordered state is still optimal.')
+
+        result = self._linprog(presolve.mults_eci_free, presolve)
+        if result.success:
+            result.x = presolve.expand(result.x)
+            result.fun += presolve.energy_offset
+            self._previous = (presolve.lower, presolve.upper, result.x.copy())
+            if key is not None:
+                self._cache.put(key, result.x, {'structure': self.cluster.structure, 'method': self.method})
+        return result
+
+    def _optimal_vertices(self: OrderedStateOptimizer,
+                          mults_eci: np.ndarray,
+                          lower: np.ndarray,
+                          upper: np.ndarray,
+                          result: OptimizeResult,
+                         ) -> np.ndarray:
+        """
+        Optimal vertices (one per row) of the ordered state LP, found by minimising random
+        objectives over the optimal face until vertex_probes of them in a row give no new vertex.
+        A vertex of the face is the unique minimum of an open cone of objectives, so every
+        vertex is eventually found, the probes do not prove that the list is complete.
+        """
+        key = self._cache_key(mults_eci, lower, upper, 'vertices') if self._cache is not None else None
+        if key is not None:
+            cached = self._cache.lookup(key)
+            if cached is not None:
+                return cached
+
+        presolve = FixedCorrelationPresolve(all_vmat=self._vmat_lp,
+                                            mults_eci=mults_eci,
+                                            lower=lower,
+                                            upper=upper,
+                                           )
+        fun_free = result.fun - presolve.energy_offset
+        objective_cut = fun_free + ACTIVE_TOL * max(1.0, abs(fun_free))
+        vertices = [presolve.restrict(result.x)]
+        rng = np.random.default_rng(self._seed)
+        unchanged = 0
+        while unchanged < self.vertex_probes:
+            probe = self._linprog(rng.normal(size=presolve.num_free), presolve, objective_cut)
+            unchanged += 1
+            if probe.success and np.min(np.max(np.abs(np.array(vertices) - probe.x), axis=1)) > np.sqrt(ACTIVE_TOL):
+                vertices.append(probe.x)
+                unchanged = 0
+        vertices = np.array([presolve.expand(vertex) for vertex in vertices])
+        if key is not None:
+            self._cache.put(key, vertices, {'structure': self.cluster.structure, 'method': self.method})
+        return vertices
+
     def fit(self: OrderedStateOptimizer) -> None:
 
-        obj = self.cluster.eci_array * self.cluster.clusmult_array
+        lower, upper = np.array(self._bounds, dtype=np.float64).T
+        mults_eci = self.cluster.eci_array * self.cluster.clusmult_array
+        result = None
         try:
-            result = linprog(obj,
-                             A_ub=-1 * self.cluster.vmatrix_array,
-                             b_ub=np.zeros(self.cluster.vmatrix_array.shape[0]),
-                             bounds=self._bounds,
-                             options=self.options,
-                             method=self.method
-                            )
+            result = self._solve(mults_eci, lower, upper)
+            if result.success and self.enumerate_vertices:
+                self.ordered_vertices = self._optimal_vertices(mults_eci, lower, upper, result)
+                if len(self.ordered_vertices) > 1:
+                    print(f'WARNING: Degenerate ordered state, {len(self.ordered_vertices)} optimal vertices found')
         except OptimizeWarning as opt_warn:
             print(opt_warn)
-        if result.success:
+        if result is not None and result.success:
             self.cluster.ordered_correlations = result.x
             self.optimized_result = result
             print('Ordered State calculations completed...')
             if self.print_output:
-                np.savetxt('ordered_correlations.out', result.x)
-                with open('ordered_rho.out', 'w', encoding='utf-8') as frho:
+                np.savetxt(f'{self.cluster.structure}/ordered_correlations.out', result.x)
+                if self.ordered_vertices is not None:
+                    np.savetxt(f'{self.cluster.structure}/ordered_vertices.out', self.ordered_vertices)
+                with open(f'{self.cluster.structure}/ordered_rho.out', 'w', encoding='utf-8') as frho:
                     for vmat in self.cluster.vmat.values():
                         frho.write(f'{" ".join(map(str,vmat@result.x))}\n')
-        else:
+        elif result is not None:
             print(
                 f'WARNING: linear programming for ordered correlation search failed: {result.status} - {result.message}\nExiting...')
 
+    def fit_batch(self: OrderedStateOptimizer,
+                  eci_sets: np.ndarray = None,
+                  point_correlations: np.ndarray = None,
+                 ) -> list[OptimizeResult]:
+        """
+        Ordered states of several ECI sets and/or compositions in one call
+        Input:
+            eci_sets - ECI's, one set per row [default: the ECI's of the cluster]
+            point_correlations - fixed point correlations, one composition per row [default: the disordered ones]
+        Output:
+            results (x - correlations, fun - energy) in the order of the rows, a single row is broadcast against the other argument.
+            The compositions are solved in sorted order so that consecutive solves share their bounds and warm start.
+            cluster.ordered_correlations is not modified
+        """
+        lower, upper = np.array(self._bounds, dtype=np.float64).T
+        points = self.cluster.single_point_clusters
+        eci_sets = np.atleast_2d(self.cluster.eci_array if eci_sets is None else eci_sets)
+        point_correlations = np.atleast_2d(lower[points] if point_correlations is None else point_correlations)
+        num_problems = max(len(eci_sets), len(point_correlations))
+        eci_sets = np.broadcast_to(eci_sets, (num_problems, eci_sets.shape[1]))
+        point_correlations = np.broadcast_to(point_correlations, (num_problems, point_correlations.shape[1]))
+
+        results = [None] * num_problems
+        for problem in np.lexsort(point_correlations.T[::-1]):
+            lower_problem, upper_problem = lower.copy(), upper.copy()
+            lower_problem[points] = upper_problem[points] = point_correlations[problem]
+            results[problem] = self._solve(eci_sets[problem] * self.cluster.clusmult_array, lower_problem, upper_problem)
+            if not results[problem].success:
+                print(f'WARNING: linear programming for ordered correlation search {problem} failed: {results[problem].status} - {results[problem].message}')
+        return results
+
     def get_energy(self: OrderedStateOptimizer,
                    correlations: np.ndarray,
                   ) -> float:
@@ -75,5 +288,7 @@ class OrderedStateOptimizer(ClusterOptimizer):
         else:
             print(f'Ordered Correlations: \n{self.optimized_result.x}')
             print(f'Ordered State Free Energy: {self.optimized_result.fun}')
+            if self.ordered_vertices is not None:
+                print(f'Optimal vertices: \n{self.ordered_vertices}')
         print('-----------------------------')
         return ''
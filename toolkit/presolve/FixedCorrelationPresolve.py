@@ -0,0 +1,99 @@
+"""
+Presolve removing the correlations fixed by the bounds from the optimisation variables
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+import numpy as np
+from scipy import sparse
+from scipy.optimize import Bounds
+
+from toolkit.functions.FreeEnergyEvaluator import FreeEnergyEvaluator
+
+@dataclass(kw_only=True, order=False, eq=False)
+class FixedCorrelationPresolve:
+    """
+    Splits the correlations in fixed (equal lower and upper bounds, i.e. the empty and point
+    clusters) and free ones. With x = (x_free, x_fixed)
+        V.x = V_free.x_free + rho_offset
+        mults_eci.x = mults_eci_free.x_free + energy_offset
+    so the free energy, its derivatives and the V.x >= 0 constraints only involve x_free.
+    Input:
+        all_vmat - Stacked V-Matrix (dense or scipy.sparse)
+        mults_eci - Multiplicities of clusters times ECI's
+        lower, upper - bounds of the correlations
+    """
+
+    all_vmat: np.ndarray
+    mults_eci: np.ndarray
+    lower: np.ndarray
+    upper: np.ndarray
+
+    fixed: np.ndarray = field(init=False)
+    free: np.ndarray = field(init=False)
+    fixed_values: np.ndarray = field(init=False)
+    vmat_free: np.ndarray = field(init=False, repr=False)
+    mults_eci_free: np.ndarray = field(init=False, repr=False)
+    rho_offset: np.ndarray = field(init=False, repr=False)
+    energy_offset: float = field(init=False)
+
+    def __post_init__(self: FixedCorrelationPresolve) -> None:
+
+        self.lower = np.asarray(self.lower, dtype=np.float64)
+        self.upper = np.asarray(self.upper, dtype=np.float64)
+        is_fixed = self.lower == self.upper
+        self.fixed = np.flatnonzero(is_fixed)
+        self.free = np.flatnonzero(~is_fixed)
+        self.fixed_values = self.lower[self.fixed]
+
+        self.vmat_free = self.all_vmat[:, self.free]
+        self.mults_eci_free = self.mults_eci[self.free]
+        self.rho_offset = np.asarray(self.all_vmat[:, self.fixed] @ self.fixed_values).ravel()
+        self.energy_offset = float(self.mults_eci[self.fixed] @ self.fixed_values)
+        if sparse.issparse(self.vmat_free):
+            self.vmat_free = sparse.csr_array(self.vmat_free)
+
+    @property
+    def num_free(self: FixedCorrelationPresolve) -> int:
+        return len(self.free)
+
+    @property
+    def bounds(self: FixedCorrelationPresolve) -> Bounds:
+        """
+        Bounds of the free correlations
+        """
+        return Bounds(self.lower[self.free], self.upper[self.free])
+
+    def restrict(self: FixedCorrelationPresolve,
+                 correlations: np.ndarray,
+                ) -> np.ndarray:
+        """
+        Free correlations of a full correlation vector
+        """
+        return np.asarray(correlations, dtype=np.float64)[self.free]
+
+    def expand(self: FixedCorrelationPresolve,
+               correlations_free: np.ndarray,
+              ) -> np.ndarray:
+        """
+        Full correlation vector from the free correlations
+        """
+        correlations = np.empty(len(self.lower))
+        correlations[self.free] = correlations_free
+        correlations[self.fixed] = self.fixed_values
+        return correlations
+
+    def evaluator(self: FixedCorrelationPresolve,
+                  multconfig_kb: np.ndarray,
+                  temperature: float = 100,
+                 ) -> FreeEnergyEvaluator:
+        """
+        Free energy evaluator of the free correlations
+        """
+        return FreeEnergyEvaluator(mults_eci=self.mults_eci_free,
+                                   multconfig_kb=multconfig_kb,
+                                   all_vmat=self.vmat_free,
+                                   rho_offset=self.rho_offset,
+                                   energy_offset=self.energy_offset,
+                                   temperature=temperature,
+                                  )
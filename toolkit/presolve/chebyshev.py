@@ -0,0 +1,45 @@
+"""
+Chebyshev centre of the correlation polytope
+"""
+
+from __future__ import annotations
+import numpy as np
+from scipy import sparse
+from scipy.optimize import linprog
+
+def chebyshev_center(vmat: np.ndarray | sparse.csr_array,
+                     rho_offset: np.ndarray,
+                     lower: np.ndarray,
+                     upper: np.ndarray,
+                    ) -> (np.ndarray, float):
+    """
+    Input:
+        vmat, rho_offset - configuration probabilities V.x + rho_offset of the free correlations x
+        lower, upper - bounds of the free correlations
+    Output:
+        Centre and radius of the largest ball inside {x : V.x + rho_offset >= 0, lower <= x <= upper},
+        i.e. max r s.t. V_i.x + rho_offset_i >= r |V_i| and lower + r <= x <= upper - r, solved with HiGHS.
+        None and 0 if the linear programming fails
+    """
+    num_free = vmat.shape[1]
+    vmat = sparse.csr_array(vmat)
+    row_norms = sparse.linalg.norm(vmat, axis=1)
+    identity = sparse.identity(num_free, format='csr')
+    radius_column = np.ones((num_free, 1))
+    A_ub = sparse.vstack([sparse.hstack([-vmat, row_norms[:, np.newaxis]]),
+                          sparse.hstack([identity, radius_column]),
+                          sparse.hstack([-identity, radius_column]),
+                         ], format='csr')
+    b_ub = np.concatenate([rho_offset, upper, -lower])
+    objective = np.zeros(num_free + 1)
+    objective[-1] = -1
+    result = linprog(objective,
+                     A_ub=A_ub,
+                     b_ub=b_ub,
+                     bounds=[(None, None)] * num_free + [(0, None)],
+                     method='highs',
+                    )
+    if not result.success:
+        print(f'WARNING: linear programming for the Chebyshev centre failed: {result.status} - {result.message}')
+        return None, 0.0
+    return result.x[:-1], result.x[-1]
@@ -0,0 +1,46 @@
+"""
+Compression of the stacked V-Matrix rows
+"""
+
+from __future__ import annotations
+import numpy as np
+from scipy import sparse
+
+def merge_identical_rows(all_vmat: np.ndarray | sparse.csr_array,
+                         weights: np.ndarray = None,
+                        ) -> (np.ndarray | sparse.csr_array, np.ndarray, np.ndarray):
+    """
+    Input:
+        all_vmat - Stacked V-Matrix (dense or scipy.sparse)
+        weights - weight of every row, e.g. multiplicities of configurations times Kikuchi-Barker coefficients
+    Output:
+        V-Matrix with every distinct row once (in order of first appearance), the summed weights
+        of the merged rows (None without weights) and the index of the merged row of every original row.
+        SUM(weights * f(V.x)) is unchanged for any elementwise f, so the merge is exact for the entropy.
+    """
+
+    num_rows = all_vmat.shape[0]
+    # rows are grouped by two random projections, identical rows give bitwise identical projections
+    keys = all_vmat @ np.random.default_rng(0).uniform(-1, 1, size=(all_vmat.shape[1], 2))
+    _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    inverse = inverse.ravel()
+    # renumber the groups in order of first appearance
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    inverse = rank[inverse]
+    first = first[order]
+
+    merged = all_vmat[first]
+    if sparse.issparse(all_vmat):
+        merged = sparse.csr_array(merged)
+        exact = (merged[inverse] != sparse.csr_array(all_vmat)).nnz == 0
+    else:
+        exact = np.array_equal(merged[inverse], all_vmat)
+    if not exact:
+        # projection collision between different rows, keep them all
+        return all_vmat, weights, np.arange(num_rows)
+
+    if weights is not None:
+        weights = np.bincount(inverse, weights=weights, minlength=len(first))
+    return merged, weights, inverse
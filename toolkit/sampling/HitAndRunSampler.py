@@ -0,0 +1,93 @@
+"""
+Hit-and-run sampling of the correlation polytope
+"""
+
+from __future__ import annotations
+from dataclasses import dataclass, field
+import numpy as np
+from scipy import sparse
+
+@dataclass(kw_only=True, order=False, eq=False)
+class HitAndRunSampler:
+    """
+    Vectorized hit-and-run over the polytope {x : V.x + rho_offset >= 0, lower <= x <= upper}
+    of the free correlations (see FixedCorrelationPresolve). Every sample is the end point of an
+    independent chain of num_steps steps from start: each step picks a uniformly random direction
+    and moves to a uniformly random point of the chord through the current point, leaving out a
+    fraction margin at both ends so that the samples stay strictly feasible.
+    Input:
+        vmat - V-Matrix of the free correlations (dense or scipy.sparse)
+        rho_offset - configuration probabilities of the fixed correlations
+        lower, upper - bounds of the free correlations
+        start - strictly feasible starting point of the chains, e.g. the disordered correlations
+        num_steps - steps of every chain [default: 10 times the dimension]
+    """
+
+    vmat: np.ndarray
+    rho_offset: np.ndarray
+    lower: np.ndarray
+    upper: np.ndarray
+    start: np.ndarray
+    num_steps: int = None
+    margin: float = 1e-6
+
+    dim: int = field(init=False)
+
+    def __post_init__(self: HitAndRunSampler) -> None:
+
+        self.dim = len(self.start)
+        if self.num_steps is None:
+            self.num_steps = 10 * self.dim
+        if np.any(self.rho(self.start) <= 0) or np.any(self.start <= self.lower) or np.any(self.start >= self.upper):
+            raise ValueError('The start of the hit-and-run chains is not strictly feasible')
+
+    def _vmat_dot(self: HitAndRunSampler,
+                  corrs: np.ndarray,
+                 ) -> np.ndarray:
+        product = self.vmat @ np.asarray(corrs).T
+        product = product.toarray() if sparse.issparse(product) else np.asarray(product)
+        return product.T
+
+    def rho(self: HitAndRunSampler,
+            corrs: np.ndarray,
+           ) -> np.ndarray:
+        """
+        Configuration probabilities, shape (num_configs,) or (num_samples, num_configs)
+        """
+        return self._vmat_dot(corrs) + self.rho_offset
+
+    def chords(self: HitAndRunSampler,
+               corrs: np.ndarray,
+               directions: np.ndarray,
+              ) -> (np.ndarray, np.ndarray):
+        """
+        Smallest and largest t keeping corrs + t * directions feasible, for every row
+        """
+        rho = self.rho(corrs)
+        drho = self._vmat_dot(directions)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # rho + t*drho >= 0, lower <= corrs + t*directions <= upper
+            rho_steps = -rho / drho
+            to_upper = (self.upper - corrs) / directions
+            to_lower = (self.lower - corrs) / directions
+        t_max = np.minimum(np.min(np.where(drho < 0, rho_steps, np.inf), axis=1),
+                           np.min(np.where(directions > 0, to_upper, np.where(directions < 0, to_lower, np.inf)), axis=1))
+        t_min = np.maximum(np.max(np.where(drho > 0, rho_steps, -np.inf), axis=1),
+                           np.max(np.where(directions > 0, to_lower, np.where(directions < 0, to_upper, -np.inf)), axis=1))
+        return t_min, t_max
+
+    def sample(self: HitAndRunSampler,
+               rng: np.random.Generator,
+               num_samples: int,
+              ) -> np.ndarray:
+        """
+        num_samples strictly feasible free correlation vectors, shape (num_samples, dim)
+        """
+        corrs = np.tile(self.start, (num_samples, 1))
+        for _ in range(self.num_steps):
+            directions = rng.normal(size=corrs.shape)
+            directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+            t_min, t_max = self.chords(corrs, directions)
+            steps = t_min + (t_max - t_min) * rng.uniform(self.margin, 1 - self.margin, num_samples)
+            corrs += steps[:, np.newaxis] * directions
+        return corrs